@@ -2,11 +2,13 @@ import streamlit as st
 import json
 import os
 from datetime import datetime
-from llm import SwissAIClient
+from llm import AsyncSwissAIClient, run_async
+from profiling import profiled
+import tracing
+from data import read_cached
 import glob
 from dotenv import load_dotenv
-import concurrent.futures
-import time
+import asyncio
 from ui_components import load_custom_css, create_header, create_section_header, create_info_box, create_metric_card
 
 # Load environment variables
@@ -24,24 +26,23 @@ def load_persona_batches():
     # Load persona batches
     for filename in glob.glob(os.path.join(personas_dir, "personas_batch_*.json")):
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                batch_file = json.load(f)
+            batch_file = read_cached(filename, json.load, "batch_files")
+            
+            # Handle new format with metadata and personas array
+            if isinstance(batch_file, dict) and 'personas' in batch_file:
+                metadata = batch_file.get('metadata', {})
+                personas_list = batch_file['personas']
+                
+                # Create batch info
+                batch_info = {
+                    'filename': os.path.basename(filename),
+                    'display_name': f"Batch {os.path.basename(filename).split('_')[-1].replace('.json', '')} ({len(personas_list)} Personas)",
+                    'personas': personas_list,
+                    'metadata': metadata,
+                    'count': len(personas_list)
+                }
+                batches.append(batch_info)
                 
-                # Handle new format with metadata and personas array
-                if isinstance(batch_file, dict) and 'personas' in batch_file:
-                    metadata = batch_file.get('metadata', {})
-                    personas_list = batch_file['personas']
-                    
-                    # Create batch info
-                    batch_info = {
-                        'filename': os.path.basename(filename),
-                        'display_name': f"Batch {os.path.basename(filename).split('_')[-1].replace('.json', '')} ({len(personas_list)} Personas)",
-                        'personas': personas_list,
-                        'metadata': metadata,
-                        'count': len(personas_list)
-                    }
-                    batches.append(batch_info)
-                    
         except Exception as e:
             st.sidebar.warning(f"Could not load batch {filename}: {e}")
     
@@ -82,7 +83,7 @@ Antwort als {name}:"""
     return system_prompt
 
 def get_batch_responses(selected_batch, user_question, api_key, max_personas=10):
-    """Get responses from multiple personas in parallel"""
+    """Get responses from multiple personas concurrently"""
     
     if not user_question.strip():
         return []
@@ -90,12 +91,28 @@ def get_batch_responses(selected_batch, user_question, api_key, max_personas=10)
     # Limit number of personas for performance
     personas_to_query = selected_batch['personas'][:max_personas]
     
-    def get_single_response(persona_data):
+    if not personas_to_query:
+        return []
+    
+    # All requests run on the shared long-lived event loop, so its connection pool survives
+    # between questions; the shared limiter in llm.py enforces the rate limits
+    batch_id = selected_batch.get('metadata', {}).get('batch_id', 'unknown')
+    with tracing.span("batch_chat", batch_id=batch_id, size=len(personas_to_query)):
+        return run_async(_get_batch_responses_async(personas_to_query, user_question, api_key))
+
+async def _get_batch_responses_async(personas_to_query, user_question, api_key):
+    """Query all personas concurrently with the async LLM client"""
+    client = AsyncSwissAIClient(api_key=api_key, caller="get_batch_responses")
+    
+    async def get_single_response(persona_index, persona_data):
+        with tracing.span("persona_task", persona_index=persona_index):
+            return await _get_single_response(persona_data)
+    
+    async def _get_single_response(persona_data):
         try:
             system_prompt = create_batch_persona_prompt(persona_data, user_question)
-            client = SwissAIClient(api_key=api_key)
             
-            response = client.complete(
+            response = await client.acomplete(
                 prompt=user_question,
                 system_prompt=system_prompt,
                 temperature=0.7,
@@ -125,23 +142,7 @@ def get_batch_responses(selected_batch, user_question, api_key, max_personas=10)
                 'success': False
             }
     
-    # Use ThreadPoolExecutor for parallel requests (limited to 3 to avoid rate limits)
-    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-        # Add small delays between submissions to respect rate limits
-        futures = []
-        for i, persona in enumerate(personas_to_query):
-            if i > 0:
-                time.sleep(0.3)  # 300ms delay between submissions
-            future = executor.submit(get_single_response, persona)
-            futures.append(future)
-        
-        # Collect results
-        results = []
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            results.append(result)
-    
-    return results
+    return await asyncio.gather(*[get_single_response(i, persona) for i, persona in enumerate(personas_to_query)])
 
 def display_batch_responses(responses):
     """Display responses from multiple personas"""
@@ -227,6 +228,7 @@ def show_batch_summary(chat_history, selected_batch):
         
         st.write("")
 
+@profiled("batch_chat.batch_chat_page")
 def batch_chat_page():
     """Main batch chat page"""
     # Load custom CSS
@@ -3,78 +3,64 @@ import pandas as pd
 from pathlib import Path
 import json
 import time
-import asyncio
 from datetime import datetime
-from single_persona import generate_persona, get_filter_options
-from ui_components import load_custom_css, create_header, create_section_header, create_info_box, create_metric_card
+from single_persona import generate_persona, get_filter_options, show_demographic_filters
+from demographic_sampler import sample_persons
+from demographic_quota import population_shares, sample_stratified
+from profiling import profiled
+from ui_components import load_custom_css, create_header, create_section_header, create_info_box
 import uuid
+import contextvars
 import concurrent.futures
-from threading import Semaphore
+import tracing
 
-def save_personas_batch(personas, filters_used, additional_params):
+def save_personas_batch(personas, filters_used, additional_params, personas_dir=None, batch_id=None):
     """Save a batch of personas to JSON file"""
+    batch_id = batch_id or str(uuid.uuid4())
     
-    # Create personas directory if it doesn't exist
-    personas_dir = Path(__file__).parent / "generated_personas"
-    personas_dir.mkdir(exist_ok=True)
-    
-    # Generate filename with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"personas_batch_{timestamp}.json"
-    filepath = personas_dir / filename
-    
-    # Prepare batch data
-    batch_data = {
-        "metadata": {
-            "generated_at": datetime.now().isoformat(),
-            "total_personas": len(personas),
-            "filters_used": filters_used,
-            "additional_params": additional_params,
-            "batch_id": str(uuid.uuid4())
-        },
-        "personas": personas
-    }
-    
-    # Save to file
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(batch_data, f, indent=2, ensure_ascii=False)
+    with tracing.span("persist", batch_id=batch_id, personas=len(personas)):
+        # Create personas directory if it doesn't exist
+        personas_dir = Path(personas_dir) if personas_dir else Path(__file__).parent / "generated_personas"
+        personas_dir.mkdir(exist_ok=True)
+        
+        # Generate filename with timestamp
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"personas_batch_{timestamp}.json"
+        filepath = personas_dir / filename
+        
+        # Prepare batch data
+        batch_data = {
+            "metadata": {
+                "generated_at": datetime.now().isoformat(),
+                "total_personas": len(personas),
+                "filters_used": filters_used,
+                "additional_params": additional_params,
+                "batch_id": batch_id
+            },
+            "personas": personas
+        }
+        
+        # Save to file
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(batch_data, f, indent=2, ensure_ascii=False)
     
-    return filepath, batch_data["metadata"]["batch_id"]
+    return filepath, batch_id
 
-class RateLimiter:
-    """Rate limiter for controlling API request frequency"""
-    def __init__(self, max_requests_per_second=5):
-        self.max_requests = max_requests_per_second
-        self.semaphore = Semaphore(max_requests_per_second)
-        self.request_times = []
-    
-    def acquire(self):
-        """Acquire a request slot, blocking if necessary to maintain rate limit"""
-        current_time = time.time()
-        
-        # Remove requests older than 1 second
-        self.request_times = [t for t in self.request_times if current_time - t < 1.0]
-        
-        # If we've hit the rate limit, wait
-        if len(self.request_times) >= self.max_requests:
-            sleep_time = 1.0 - (current_time - self.request_times[0])
-            if sleep_time > 0:
-                time.sleep(sleep_time)
-                # Clean up again after waiting
-                current_time = time.time()
-                self.request_times = [t for t in self.request_times if current_time - t < 1.0]
-        
-        # Record this request
-        self.request_times.append(current_time)
+# Upper bound for worker threads. Pacing is done by the shared limiter in llm.py,
+# the threads only need to cover the requests that are in flight at once.
+MAX_PARALLEL_WORKERS = 20
 
 def generate_single_persona_with_rate_limit(args):
-    """Generate a single persona with rate limiting"""
-    persona_index, additional_params, csv_filters, rate_limiter, random_options = args
+    """Generate a single persona (rate limited by the shared limiter in llm.py)"""
+    persona_index, additional_params, csv_filters, random_options, sampled_person = args
     
+    with tracing.span("persona_task", persona_index=persona_index) as task_span:
+        result = _generate_indexed_persona(persona_index, additional_params, csv_filters, random_options, sampled_person)
+        task_span.set_attribute("success", result["success"])
+        return result
+
+def _generate_indexed_persona(persona_index, additional_params, csv_filters, random_options, sampled_person):
     try:
-        # Acquire rate limit slot
-        rate_limiter.acquire()
-        
         import random
         
         # Create parameters for this persona
@@ -90,7 +76,7 @@ def generate_single_persona_with_rate_limit(args):
                 'finanz_erfahrung': random.choice(random_options['finanz_erfahrung'])
             }
         
-        persona_json, person_data = generate_persona(current_params, csv_filters, debug_mode=False)
+        persona_json, person_data = generate_persona(current_params, csv_filters, debug_mode=False, sampled_person=sampled_person)
         
         if persona_json and person_data:
             # Parse JSON to validate it
@@ -119,9 +105,44 @@ def generate_single_persona_with_rate_limit(args):
             "index": persona_index
         }
 
-def generate_batch_personas_parallel(count, additional_params, csv_filters, progress_callback=None):
-    """Generate multiple personas with parallel processing and rate limiting"""
+def sample_batch_persons(count, csv_filters, seed=None, targets=None):
+    """
+    Draw the source persons of a whole batch at once (see demographic_sampler)
     
+    Persons are drawn without replacement while enough of them match the filters;
+    otherwise persons repeat and a warning tells the user.
+    With targets (dimension -> {option: share}) the batch is stratified to these
+    marginals (see demographic_quota). Returns an empty list if nobody matches.
+    """
+    with tracing.span("demographic_sampling", personas=count, stratified=bool(targets)) as sampling_span:
+        if targets:
+            try:
+                sampled_persons = sample_stratified(count, csv_filters, targets, mode="ipf", seed=seed)
+            except ValueError as e:
+                st.error(f"Repräsentative Stichprobe nicht möglich: {e}")
+                return []
+        else:
+            sampled_persons = sample_persons(count, csv_filters, seed=seed)
+        distinct_rows = len({p.row_id for p in sampled_persons})
+        sampling_span.set_attribute("distinct_rows", distinct_rows)
+    
+    if not sampled_persons:
+        st.error("Keine Personen mit den gewählten Filtern gefunden. Bitte lockern Sie die Filter.")
+    elif distinct_rows < len(sampled_persons):
+        st.warning(
+            f"Nur {distinct_rows} verschiedene Personen für {len(sampled_persons)} Personas: "
+            f"{len(sampled_persons) - distinct_rows} Personas basieren auf wiederholten Quellpersonen. "
+            "Lockern Sie die Filter für eine vielfältigere Batch."
+        )
+    return sampled_persons
+
+@profiled("generate_batch_personas_parallel")
+def generate_batch_personas_parallel(count, additional_params, csv_filters, progress_callback=None, batch_id=None, seed=None, targets=None):
+    """Generate multiple personas with parallel processing and rate limiting"""
+    with tracing.batch_span(batch_id or str(uuid.uuid4()), size=count, mode="parallel"):
+        return _generate_batch_personas_parallel(count, additional_params, csv_filters, progress_callback, seed, targets)
+
+def _generate_batch_personas_parallel(count, additional_params, csv_filters, progress_callback, seed, targets):
     # Define random parameter options
     random_options = {
         'vermoegen': ["< 10k", "10k-100k", ">100k"],
@@ -131,12 +152,14 @@ def generate_batch_personas_parallel(count, additional_params, csv_filters, prog
         'finanz_erfahrung': ["Einsteiger", "Fortgeschritten", "Experte"]
     }
     
-    # Create rate limiter (5 requests per second)
-    rate_limiter = RateLimiter(max_requests_per_second=5)
+    # Draw all source persons up front; the workers only do LLM work
+    sampled_persons = sample_batch_persons(count, csv_filters, seed, targets)
+    if not sampled_persons:
+        return [], [f"Failed to generate persona {i + 1}" for i in range(count)]
     
     # Prepare arguments for each persona generation
     args_list = [
-        (i, additional_params, csv_filters, rate_limiter, random_options)
+        (i, additional_params, csv_filters, random_options, sampled_persons[i])
         for i in range(count)
     ]
     
@@ -145,11 +168,12 @@ def generate_batch_personas_parallel(count, additional_params, csv_filters, prog
     completed = 0
     
     # Use ThreadPoolExecutor for parallel processing
-    # Limit to 5 threads to match our rate limit
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+    # The shared limiter enforces 5 req/s and 100k tokens/min across all threads
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(count, MAX_PARALLEL_WORKERS)) as executor:
         # Submit all tasks
+        # Each task runs in a copy of the current context so its spans join the batch trace
         future_to_index = {
-            executor.submit(generate_single_persona_with_rate_limit, args): args[0]
+            executor.submit(contextvars.copy_context().run, generate_single_persona_with_rate_limit, args): args[0]
             for args in args_list
         }
         
@@ -178,21 +202,27 @@ def generate_batch_personas_parallel(count, additional_params, csv_filters, prog
     
     return personas, errors
 
-def generate_batch_personas(count, additional_params, csv_filters, progress_callback=None):
+def generate_batch_personas(count, additional_params, csv_filters, progress_callback=None, batch_id=None, seed=None, targets=None):
     """Generate multiple personas - choose parallel or sequential based on count"""
     if count >= 5:  # Use parallel processing for larger batches
-        return generate_batch_personas_parallel(count, additional_params, csv_filters, progress_callback)
+        return generate_batch_personas_parallel(count, additional_params, csv_filters, progress_callback, batch_id, seed, targets)
     else:
         # Use sequential for small batches (less overhead)
-        return generate_batch_personas_sequential(count, additional_params, csv_filters, progress_callback)
+        return generate_batch_personas_sequential(count, additional_params, csv_filters, progress_callback, batch_id, seed, targets)
 
-def generate_batch_personas_sequential(count, additional_params, csv_filters, progress_callback=None):
+def generate_batch_personas_sequential(count, additional_params, csv_filters, progress_callback=None, batch_id=None, seed=None, targets=None):
     """Sequential generation for small batches"""
-    import random
-    
+    with tracing.batch_span(batch_id or str(uuid.uuid4()), size=count, mode="sequential"):
+        return _generate_batch_personas_sequential(count, additional_params, csv_filters, progress_callback, seed, targets)
+
+def _generate_batch_personas_sequential(count, additional_params, csv_filters, progress_callback, seed, targets):
     personas = []
     errors = []
     
+    sampled_persons = sample_batch_persons(count, csv_filters, seed, targets)
+    if not sampled_persons:
+        return [], [f"Failed to generate persona {i + 1}" for i in range(count)]
+    
     # Define random parameter options
     random_options = {
         'vermoegen': ["< 10k", "10k-100k", ">100k"],
@@ -206,34 +236,11 @@ def generate_batch_personas_sequential(count, additional_params, csv_filters, pr
         if progress_callback:
             progress_callback(i, count, f"Generating persona {i+1}/{count}")
         
-        try:
-            # Create parameters for this persona
-            current_params = additional_params.copy()
-            
-            if additional_params.get('randomize', False):
-                # Generate random parameters for this persona
-                current_params = {
-                    'vermoegen': random.choice(random_options['vermoegen']),
-                    'verfuegbares_einkommen': random.choice(random_options['verfuegbares_einkommen']),
-                    'grosse_ausgaben': random.choice(random_options['grosse_ausgaben']),
-                    'eigentum': random.choice(random_options['eigentum']),
-                    'finanz_erfahrung': random.choice(random_options['finanz_erfahrung'])
-                }
-            
-            persona_json, person_data = generate_persona(current_params, csv_filters, debug_mode=False)
-            if persona_json and person_data:
-                # Parse JSON to validate it
-                persona_dict = json.loads(persona_json)
-                personas.append({
-                    "persona": persona_dict,
-                    "source_data": person_data,
-                    "parameters_used": current_params,
-                    "generated_at": datetime.now().isoformat()
-                })
-            else:
-                errors.append(f"Failed to generate persona {i+1}")
-        except Exception as e:
-            errors.append(f"Error generating persona {i+1}: {str(e)}")
+        result = generate_single_persona_with_rate_limit((i, additional_params, csv_filters, random_options, sampled_persons[i]))
+        if result["success"]:
+            personas.append(result["persona"])
+        else:
+            errors.append(result["error"])
     
     if progress_callback:
         progress_callback(count, count, f"Completed {count}/{count} personas")
@@ -289,81 +296,16 @@ def show():
         # Demographics filters from CSV (same as single persona)
         st.markdown("**👥 Demografische Filter:**")
         
-        alter_range = st.selectbox(
-            "Altersgruppe",
-            options=["Alle", "18-25", "26-35", "36-45", "46-65", "65+"],
-            index=0,
-            help="Wählen Sie eine Altersgruppe",
-            key="batch_alter"
-        )
-        
-        geschlecht_filter = st.selectbox(
-            "Geschlecht",
-            options=["Alle", "Männlich", "Weiblich"],
-            index=0,
-            help="Filtern nach Geschlecht",
-            key="batch_geschlecht"
-        )
-        
-        kanton_filter = st.selectbox(
-            "Kanton",
-            options=["Alle"] + filter_options['kantone'],
-            index=0,
-            help="Filtern nach Kanton",
-            key="batch_kanton"
-        )
-        
-        sprachgebiet_filter = st.selectbox(
-            "Sprachgebiet", 
-            options=["Alle"] + filter_options['sprachgebiet'],
-            index=0,
-            help="Filtern nach Sprachgebiet",
-            key="batch_sprachgebiet"
-        )
-        
-        bruttojahr_range = st.selectbox(
-            "Bruttojahreseinkommen",
-            options=["Alle", "< 60k", "60k-100k", "> 100k"],
-            index=0,
-            help="Filtern nach Einkommensbereich",
-            key="batch_bruttojahr"
-        )
+        csv_filters, matching_persons = show_demographic_filters(filter_options, key_prefix="batch_")
         
-        ausbildung_filter = st.selectbox(
-            "Ausbildung",
-            options=["Alle"] + filter_options['ausbildung'][:10],
-            index=0,
-            help="Filtern nach Ausbildung",
-            key="batch_ausbildung"
+        sampling_mode = st.radio(
+            "Stichprobe",
+            ["Zufällig", "Repräsentativ"],
+            help="Repräsentativ = Kanton, Altersgruppe, Geschlecht und Sprachgebiet des Batches entsprechen genau der Verteilung der gefilterten Daten.",
+            key="batch_sampling_mode"
         )
-        
-        erwerbstaetig_filter = st.selectbox(
-            "Erwerbstätigkeit",
-            options=["Alle", "Erwerbstätig", "Nicht erwerbstätig"],
-            index=0,
-            help="Filtern nach Erwerbsstatus",
-            key="batch_erwerbstaetig"
-        )
-        
-        kinder_filter = st.selectbox(
-            "Kinder im Haushalt",
-            options=["Alle", "Mit Kindern", "Ohne Kinder"],
-            index=0,
-            help="Filtern nach Kindern im Haushalt",
-            key="batch_kinder"
-        )
-        
-        # Collect CSV filters
-        csv_filters = {
-            'alter_range': alter_range,
-            'geschlecht': geschlecht_filter,
-            'kanton': kanton_filter if kanton_filter != "Alle" else None,
-            'sprachgebiet': sprachgebiet_filter if sprachgebiet_filter != "Alle" else None,
-            'bruttojahr_range': bruttojahr_range,
-            'ausbildung': ausbildung_filter if ausbildung_filter != "Alle" else None,
-            'arbeit': 1 if erwerbstaetig_filter == "Erwerbstätig" else (0 if erwerbstaetig_filter == "Nicht erwerbstätig" else None),
-            'kinder': 1 if kinder_filter == "Mit Kindern" else (0 if kinder_filter == "Ohne Kinder" else None)
-        }
+        # Representative batches are stratified to the marginals of the filtered data
+        sampling_targets = population_shares(csv_filters) if sampling_mode == "Repräsentativ" else None
         
         st.markdown("---")
         
@@ -443,7 +385,7 @@ def show():
         <strong>⏱️ Geschätzte Zeit:</strong> ~{estimated_time:.1f} Sekunden
         """)
         
-        if st.button("🚀 Batch Generieren", type="primary", use_container_width=True):
+        if st.button("🚀 Batch Generieren", type="primary", use_container_width=True, disabled=matching_persons == 0):
             if batch_size > 0:
                 # Show progress with enhanced tracking
                 progress_bar = st.progress(0)
@@ -474,24 +416,30 @@ def show():
                 
                 start_time = time.time()
                 
-                # Generate personas
-                personas, errors = generate_batch_personas(
-                    batch_size, 
-                    additional_params, 
-                    csv_filters, 
-                    update_progress
-                )
-                
-                end_time = time.time()
-                duration = end_time - start_time
+                # Generation and saving form one trace (see tracing.py)
+                batch_id = str(uuid.uuid4())
+                with tracing.batch_span(batch_id, size=batch_size):
+                    # Generate personas
+                    personas, errors = generate_batch_personas(
+                        batch_size, 
+                        additional_params, 
+                        csv_filters, 
+                        update_progress,
+                        batch_id=batch_id,
+                        targets=sampling_targets
+                    )
+                    
+                    end_time = time.time()
+                    duration = end_time - start_time
+                    
+                    # Save batch
+                    if personas:
+                        filepath, batch_id = save_personas_batch(personas, csv_filters, additional_params, batch_id=batch_id)
                 
                 # Calculate final rate
                 final_rate = len(personas) / duration if duration > 0 else 0
                 
-                # Save batch
                 if personas:
-                    filepath, batch_id = save_personas_batch(personas, csv_filters, additional_params)
-                    
                     st.session_state.current_batch = {
                         'personas': personas,
                         'errors': errors,
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmark for the batch paths.
+
+Drives generate_batch_personas (batch generation page) and get_batch_responses
+(batch chat page) against the local mock LLM server with configurable latency,
+sweeping concurrency and batch size. For every run it reports personas/sec,
+p50/p95/p99 request latency, the share of request time spent waiting for the
+rate limiter and the failure rate, and flags regressions against a baseline.
+
+Usage:
+    python benchmark_batch_throughput.py
+    python benchmark_batch_throughput.py --concurrency 1,5,20 --sizes 20,100 --latency 2.0
+    python benchmark_batch_throughput.py --save-baseline throughput_baseline.json
+    python benchmark_batch_throughput.py --baseline throughput_baseline.json --fail-on-regression
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable
+
+from mock_llm_server import MockLLMServer, MockServerConfig
+from benchmark_hot_paths import BENCHMARK_FILTERS, make_demographics, make_persona_records
+
+DEFAULT_CONCURRENCY = [1, 5, 20]
+DEFAULT_SIZES = [20, 50]
+DEFAULT_DEMOGRAPHIC_ROWS = 50_000
+
+CHAT_QUESTION = "Würden Sie für eine Hypothek die Bank wechseln, wenn der Zins 0.2% tiefer wäre?"
+
+# Platform limits of the Swiss AI endpoint (see llm.SwissAIClient)
+PLATFORM_REQUESTS_PER_SECOND = 5
+PLATFORM_TOKENS_PER_MINUTE = 100_000
+
+
+def quiet_logs():
+    """Silence per-request logging that would drown the report."""
+    # Importing the pages registers the streamlit loggers silenced below
+    import batch_chat, batch_generation  # noqa: F401
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("httpcore").setLevel(logging.WARNING)
+    logging.getLogger("llm").setLevel(logging.CRITICAL)
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+
+def summarize(
+    path: str,
+    concurrency: int,
+    size: int,
+    successes: int,
+    failures: int,
+    wall_time: float,
+    caller_stats: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Build the result row of one run from its outcome and the LLM metrics."""
+    caller_stats = caller_stats or {}
+    latency = caller_stats.get("latency", {})
+    queue_wait = caller_stats.get("queue_wait", {})
+    return {
+        "path": path,
+        "concurrency": concurrency,
+        "size": size,
+        "personas_per_sec": successes / wall_time if wall_time > 0 else 0.0,
+        "wall_time": wall_time,
+        "p50": latency.get("p50"),
+        "p95": latency.get("p95"),
+        "p99": latency.get("p99"),
+        "limiter_wait_share": queue_wait.get("sum", 0.0) / latency["sum"] if latency.get("sum") else 0.0,
+        "failure_rate": failures / size if size else 0.0,
+        "retries": caller_stats.get("retries", 0),
+    }
+
+
+def run_generation(size: int, concurrency: int) -> Dict[str, Any]:
+    """Generate a batch through generate_batch_personas and measure it."""
+    import batch_generation
+    from llm_metrics import metrics_registry
+    
+    previous_workers = batch_generation.MAX_PARALLEL_WORKERS
+    batch_generation.MAX_PARALLEL_WORKERS = concurrency
+    metrics_registry.reset()
+    try:
+        start = time.perf_counter()
+        personas, errors = batch_generation.generate_batch_personas(
+            size, {'randomize': True}, {'alter_range': BENCHMARK_FILTERS['alter_range']}
+        )
+        wall_time = time.perf_counter() - start
+    finally:
+        batch_generation.MAX_PARALLEL_WORKERS = previous_workers
+    
+    stats = metrics_registry.snapshot().get("generate_persona")
+    return summarize("generate", concurrency, size, len(personas), len(errors), wall_time, stats)
+
+
+def run_chat(size: int, concurrency: int, persona_batch: Dict[str, Any]) -> Dict[str, Any]:
+    """Ask one question to a batch of personas through get_batch_responses and measure it."""
+    from batch_chat import get_batch_responses
+    from llm_metrics import metrics_registry
+    
+    metrics_registry.reset()
+    start = time.perf_counter()
+    responses = get_batch_responses(persona_batch, CHAT_QUESTION, os.environ["SWISS_AI_PLATFORM_API_KEY"], max_personas=size)
+    wall_time = time.perf_counter() - start
+    
+    failures = sum(1 for r in responses if not r['success'])
+    stats = metrics_registry.snapshot().get("get_batch_responses")
+    return summarize("chat", concurrency, size, len(responses) - failures, failures, wall_time, stats)
+
+
+def run_sweep(
+    concurrency_levels: List[int],
+    sizes: List[int],
+    server_config: MockServerConfig,
+    requests_per_second: float = PLATFORM_REQUESTS_PER_SECOND,
+    tokens_per_minute: int = PLATFORM_TOKENS_PER_MINUTE,
+    paths: tuple = ("generate", "chat"),
+    demographic_rows: int = DEFAULT_DEMOGRAPHIC_ROWS,
+    progress: Callable[[str], None] = print
+) -> List[Dict[str, Any]]:
+    """
+    Run every path at every concurrency level and batch size against a fresh mock server.
+    
+    The process-wide limiter is recreated for each run with max_concurrency set to
+    the concurrency level; batch generation also uses that many worker threads.
+    
+    Returns:
+        One result row per (path, concurrency, size)
+    """
+    from llm import configure_rate_limiter
+    
+    quiet_logs()
+    results = []
+    saved_env = {key: os.environ.get(key) for key in (
+        "DEMOGRAPHIE_CSV", "SWISS_AI_BASE_URL", "SWISS_AI_PLATFORM_API_KEY",
+        "SWISS_AI_COMPLETION_CACHE", "SWISS_AI_CASSETTE"
+    )}
+    
+    with tempfile.TemporaryDirectory(prefix="persona-throughput-") as tmp:
+        csv_path = Path(tmp) / "demographics.csv"
+        make_demographics(demographic_rows).to_csv(csv_path, index=False)
+        persona_batch = {"personas": make_persona_records(max(sizes))}
+        
+        try:
+            os.environ["DEMOGRAPHIE_CSV"] = str(csv_path)
+            os.environ["SWISS_AI_PLATFORM_API_KEY"] = "mock"
+            # Every request has to reach the simulated LLM
+            os.environ["SWISS_AI_COMPLETION_CACHE"] = "0"
+            os.environ.pop("SWISS_AI_CASSETTE", None)
+            
+            for path in paths:
+                for concurrency in concurrency_levels:
+                    for size in sizes:
+                        config = MockServerConfig(**{**server_config.__dict__, "tokens_per_minute": tokens_per_minute})
+                        with MockLLMServer(config) as server:
+                            os.environ["SWISS_AI_BASE_URL"] = server.base_url
+                            configure_rate_limiter(
+                                requests_per_second=requests_per_second,
+                                tokens_per_minute=tokens_per_minute,
+                                max_concurrency=concurrency
+                            )
+                            if path == "generate":
+                                result = run_generation(size, concurrency)
+                            else:
+                                result = run_chat(size, concurrency, persona_batch)
+                        results.append(result)
+                        progress(format_row(result))
+        finally:
+            for key, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            configure_rate_limiter()
+    
+    return results
+
+
+def format_row(result: Dict[str, Any]) -> str:
+    def seconds(value):
+        return f"{value:6.2f}s" if value is not None else "     - "
+    return (
+        f"  {result['path']:<8} c={result['concurrency']:<3} n={result['size']:<5} "
+        f"{result['personas_per_sec']:7.2f}/s  p50 {seconds(result['p50'])}  p95 {seconds(result['p95'])}  "
+        f"p99 {seconds(result['p99'])}  wait {result['limiter_wait_share']:5.1%}  "
+        f"fail {result['failure_rate']:5.1%}"
+    )
+
+
+def result_key(result: Dict[str, Any]) -> str:
+    return f"{result['path']}@c{result['concurrency']}@n{result['size']}"
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float = 0.8) -> List[Dict[str, Any]]:
+    """
+    Compare throughput and tail latency with a baseline.
+    
+    A run regresses when its personas/sec falls below threshold times the
+    baseline, its p95 latency grows beyond baseline / threshold, or its failure
+    rate increases by more than 5 percentage points.
+    
+    Returns:
+        One dict per run present in both: key, baseline, current, reasons, regression
+    """
+    previous_runs = {result_key(r): r for r in baseline.get("results", [])}
+    comparison = []
+    for result in results:
+        key = result_key(result)
+        previous = previous_runs.get(key)
+        if previous is None:
+            continue
+        reasons = []
+        if result["personas_per_sec"] < previous["personas_per_sec"] * threshold:
+            reasons.append("throughput")
+        if result["p95"] is not None and previous["p95"] and result["p95"] > previous["p95"] / threshold:
+            reasons.append("p95 latency")
+        if result["failure_rate"] > previous["failure_rate"] + 0.05:
+            reasons.append("failure rate")
+        comparison.append({
+            "key": key, "baseline": previous, "current": result, "reasons": reasons, "regression": bool(reasons)
+        })
+    return comparison
+
+
+def save_baseline(results: List[Dict[str, Any]], settings: Dict[str, Any], path: Path):
+    """Write results and the settings they were measured with as a baseline JSON."""
+    baseline = {
+        "metadata": {
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "settings": settings,
+        },
+        "results": results
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end batch throughput benchmark against a simulated LLM")
+    parser.add_argument("--concurrency", default=",".join(map(str, DEFAULT_CONCURRENCY)), help="Comma-separated concurrency levels")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated batch sizes")
+    parser.add_argument("--paths", default="generate,chat", help="generate, chat or both")
+    parser.add_argument("--latency", type=float, default=1.0, help="Median simulated seconds until the first token")
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="Simulated output speed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of injected 5xx responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of injected 429 responses")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of broken persona JSON")
+    parser.add_argument("--requests-per-second", type=float, default=PLATFORM_REQUESTS_PER_SECOND)
+    parser.add_argument("--tokens-per-minute", type=int, default=PLATFORM_TOKENS_PER_MINUTE)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", type=Path, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", type=Path, help="Write the results as a new baseline")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Throughput ratio below which a run regresses")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with code 1 on regressions")
+    args = parser.parse_args()
+    
+    server_config = MockServerConfig(
+        latency=args.latency,
+        latency_distribution=args.latency_distribution,
+        tokens_per_second=args.tokens_per_second,
+        server_error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+    )
+    settings = {
+        "server": server_config.__dict__,
+        "requests_per_second": args.requests_per_second,
+        "tokens_per_minute": args.tokens_per_minute,
+    }
+    
+    print("🚀 Batch throughput benchmark (simulated LLM)")
+    print("=" * 60)
+    results = run_sweep(
+        [int(c) for c in args.concurrency.split(",")],
+        [int(n) for n in args.sizes.split(",")],
+        server_config,
+        requests_per_second=args.requests_per_second,
+        tokens_per_minute=args.tokens_per_minute,
+        paths=tuple(args.paths.split(",")),
+    )
+    
+    regressions = []
+    if args.baseline and not args.baseline.exists():
+        print(f"\n⚠️  Baseline {args.baseline} not found; create it with --save-baseline {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("metadata", {}).get("settings") != settings:
+            print("\n⚠️  Baseline was measured with different settings; comparison may be misleading")
+        print(f"\n📊 Comparison with {args.baseline}")
+        for entry in compare(results, baseline, args.threshold):
+            marker = "❌" if entry["regression"] else "✅"
+            print(f"  {marker} {entry['key']:<22} {entry['baseline']['personas_per_sec']:7.2f}/s → "
+                  f"{entry['current']['personas_per_sec']:7.2f}/s  {', '.join(entry['reasons'])}")
+            if entry["regression"]:
+                regressions.append(entry)
+    
+    if args.save_baseline:
+        save_baseline(results, settings, args.save_baseline)
+        print(f"\n💾 Baseline written to {args.save_baseline}")
+    
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s)")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
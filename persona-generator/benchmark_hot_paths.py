@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the non-LLM hot paths of the persona generator.
+
+Every step is timed at several data sizes (demographic rows, stored personas)
+so the report shows which one stops scaling as the library grows. Results can
+be saved as a baseline JSON and compared against later runs.
+
+Usage:
+    python benchmark_hot_paths.py                       # default sizes
+    python benchmark_hot_paths.py --full                # up to 1M rows / 100k personas
+    python benchmark_hot_paths.py --save-baseline benchmark_baseline.json
+    python benchmark_hot_paths.py --baseline benchmark_baseline.json --fail-on-regression
+"""
+import gc
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Any
+
+import numpy as np
+import pandas as pd
+
+from data import load_demographic_index, load_demographie_csv, parse_demographie_csv
+from single_persona import (
+    apply_csv_filters, build_persona_prompt, clean_persona_response, format_person_data,
+    load_prompt_files, repair_persona_json
+)
+from batch_generation import save_personas_batch
+from persona_library import create_personas_dataframe, load_saved_batches, search_personas
+from mock_llm_server import make_persona_json
+
+DEFAULT_ROWS = [1_000, 10_000, 100_000]
+DEFAULT_PERSONAS = [100, 1_000, 10_000]
+FULL_ROWS = [1_000, 10_000, 100_000, 1_000_000]
+FULL_PERSONAS = [100, 1_000, 10_000, 100_000]
+
+# Personas per stored batch file when building library fixtures
+PERSONAS_PER_FILE = 100
+
+KANTONE = ["ZH", "BE", "LU", "UR", "SZ", "OW", "NW", "GL", "ZG", "FR", "SO", "BS", "BL",
+           "SH", "AR", "AI", "SG", "GR", "AG", "TG", "TI", "VD", "VS", "NE", "GE", "JU"]
+SPRACHGEBIETE = ["Deutsch", "Französisch", "Italienisch", "Rätoromanisch"]
+AUSBILDUNGEN = ["Obligatorische Schule", "Berufslehre", "Maturität", "Höhere Berufsbildung", "Hochschule"]
+BERUFE = ["Kaufmann/-frau", "Pflegefachperson", "Informatiker/in", "Lehrperson", "Verkäufer/in",
+          "Ingenieur/in", "Landwirt/in", "Koch/Köchin", "Polymechaniker/in", "Treuhänder/in"]
+
+# Filters as the sidebar produces them (a typical narrow selection)
+BENCHMARK_FILTERS = {
+    'alter_range': "26-35",
+    'geschlecht': "Weiblich",
+    'kanton': "ZH",
+    'sprachgebiet': None,
+    'bruttojahr_range': "60k-100k",
+    'ausbildung': None,
+    'arbeit': 1,
+    'kinder': None
+}
+
+BENCHMARK_PARAMS = {
+    'vermoegen': "10k-100k",
+    'verfuegbares_einkommen': "60k-100k",
+    'grosse_ausgaben': "nein",
+    'eigentum': 0,
+    'finanz_erfahrung': "Fortgeschritten"
+}
+
+
+def make_demographics(rows: int, seed: int = 0, extra_columns: int = 20) -> pd.DataFrame:
+    """
+    Synthetic demographic data with the columns the app uses from datax.csv.
+    
+    Args:
+        rows: Number of people
+        seed: Random seed
+        extra_columns: Additional numeric survey columns (the real file is wide)
+    
+    Returns:
+        DataFrame shaped like load_demographie_csv()
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'alter': rng.integers(18, 90, rows),
+        'weiblich': rng.integers(0, 2, rows),
+        'bruttojahr': rng.lognormal(11.2, 0.5, rows).round(-2),
+        'hhgroesse': rng.integers(1, 7, rows),
+        'ausbildung': rng.choice(AUSBILDUNGEN, rows),
+        'beruf': rng.choice(BERUFE, rows),
+        'kanton': rng.choice(KANTONE, rows),
+        'sprachgebiet': rng.choice(SPRACHGEBIETE, rows, p=[0.62, 0.23, 0.14, 0.01]),
+        'arbeit': rng.integers(0, 2, rows),
+        'kinder': rng.integers(0, 2, rows),
+        'ledig': rng.integers(0, 2, rows),
+    })
+    for i in range(extra_columns):
+        column = rng.normal(size=rows).round(3)
+        column[rng.random(rows) < 0.1] = np.nan
+        df[f'v{i:02d}'] = column
+    return df
+
+
+def make_persona_records(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Stored persona records as written by batch generation."""
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        records.append({
+            "persona": json.loads(make_persona_json(rng)),
+            "source_data": {"alter": rng.randint(18, 90), "kanton": rng.choice(KANTONE), **BENCHMARK_PARAMS},
+            "parameters_used": BENCHMARK_PARAMS,
+            "generated_at": datetime.now().isoformat()
+        })
+    return records
+
+
+def write_library(personas_dir: Path, records: List[Dict[str, Any]]):
+    """Write persona records as batch files like save_personas_batch does."""
+    personas_dir.mkdir(parents=True, exist_ok=True)
+    for number, start in enumerate(range(0, len(records), PERSONAS_PER_FILE)):
+        chunk = records[start:start + PERSONAS_PER_FILE]
+        batch_data = {
+            "metadata": {
+                "generated_at": datetime.now().isoformat(),
+                "total_personas": len(chunk),
+                "filters_used": BENCHMARK_FILTERS,
+                "additional_params": BENCHMARK_PARAMS,
+                "batch_id": f"bench-{number}"
+            },
+            "personas": chunk
+        }
+        with open(personas_dir / f"personas_batch_bench_{number:05d}.json", 'w', encoding='utf-8') as f:
+            json.dump(batch_data, f, indent=2, ensure_ascii=False)
+
+
+def measure(fn: Callable[[], Any], min_time: float = 0.2, max_repeats: int = 20) -> Dict[str, float]:
+    """
+    Time a function: repeat it until min_time has passed (at least 3 runs).
+    
+    Returns:
+        Dict with best, median and runs (seconds per call)
+    """
+    timings = []
+    gc.collect()
+    started = time.perf_counter()
+    while len(timings) < 3 or (time.perf_counter() - started < min_time and len(timings) < max_repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {"best": min(timings), "median": statistics.median(timings), "runs": len(timings)}
+
+
+def run_suite(
+    rows_sizes: List[int],
+    persona_sizes: List[int],
+    min_time: float = 0.2,
+    workdir: Optional[Path] = None,
+    progress: Callable[[str], None] = print
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Run every benchmark at every size.
+    
+    Fixtures (CSV files, persona libraries, demographics cache) are written to
+    workdir, by default a temporary directory that is removed afterwards.
+    
+    Returns:
+        Dict "case@size" -> {"case", "size", "best", "median", "runs"}
+    """
+    if workdir is None:
+        with tempfile.TemporaryDirectory(prefix="persona-bench-") as tmp:
+            return run_suite(rows_sizes, persona_sizes, min_time, Path(tmp), progress)
+    
+    # Keep the column stores of the fixture CSVs out of the app's .cache
+    saved_cache_setting = os.environ.get("SWISS_AI_DATA_CACHE")
+    os.environ["SWISS_AI_DATA_CACHE"] = str(workdir / "data_cache")
+    try:
+        return _run_cases(rows_sizes, persona_sizes, min_time, workdir, progress)
+    finally:
+        if saved_cache_setting is None:
+            os.environ.pop("SWISS_AI_DATA_CACHE", None)
+        else:
+            os.environ["SWISS_AI_DATA_CACHE"] = saved_cache_setting
+
+
+def _run_cases(
+    rows_sizes: List[int],
+    persona_sizes: List[int],
+    min_time: float,
+    workdir: Path,
+    progress: Callable[[str], None]
+) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+    
+    def record(case: str, size: int, fn: Callable[[], Any]):
+        timing = measure(fn, min_time=min_time)
+        results[f"{case}@{size}"] = {"case": case, "size": size, **timing}
+        progress(f"  {case:<26} {size:>9,}  {format_seconds(timing['median'])}")
+    
+    system_prompt, prompt_template = load_prompt_files()
+    persona_text = make_persona_json(random.Random(0))
+    fenced_response = f"Hier ist die Persona:\n```json\n{persona_text}\n```"
+    broken_response = persona_text.replace('"\n', '",\n').replace('}\n', '},\n')  # trailing commas
+    
+    for rows in rows_sizes:
+        progress(f"Demographic rows: {rows:,}")
+        df = make_demographics(rows)
+        csv_path = workdir / f"demographics_{rows}.csv"
+        df.to_csv(csv_path, index=False)
+        
+        record("parse_demographie_csv", rows, lambda: parse_demographie_csv(csv_path))
+        # Per-persona cost: the process-wide frame after the first load
+        record("load_demographie_csv", rows, lambda: load_demographie_csv(csv_path))
+        record("filter_chain", rows, lambda: apply_csv_filters(df, BENCHMARK_FILTERS))
+        index = load_demographic_index(csv_path)
+        record("filter_bitmap", rows, lambda: index.select(BENCHMARK_FILTERS))
+        record("filter_index_cached", rows, lambda: index.row_ids(BENCHMARK_FILTERS))
+        record("facet_counts", rows, lambda: index.facet_counts(BENCHMARK_FILTERS))
+        
+        person = df.iloc[rows // 2]
+        record("format_person_data", rows, lambda: format_person_data(person, BENCHMARK_PARAMS))
+        statistical_data_str, combined_dict = format_person_data(person, BENCHMARK_PARAMS)
+        record("prompt_format", rows, lambda: build_persona_prompt(
+            prompt_template, statistical_data_str, combined_dict, BENCHMARK_PARAMS
+        ))
+        del df
+    
+    record("json_cleanup", 1, lambda: json.loads(clean_persona_response(fenced_response)))
+    record("json_repair", 1, lambda: repair_persona_json(clean_persona_response(broken_response)))
+    
+    for count in persona_sizes:
+        progress(f"Stored personas: {count:,}")
+        records = make_persona_records(count)
+        library_dir = workdir / f"library_{count}"
+        write_library(library_dir, records)
+        save_dir = workdir / f"save_{count}"
+        
+        record("save_personas_batch", count, lambda: save_personas_batch(
+            records, BENCHMARK_FILTERS, BENCHMARK_PARAMS, personas_dir=save_dir
+        ))
+        record("load_saved_batches", count, lambda: load_saved_batches(library_dir))
+        
+        personas = [p for batch in load_saved_batches(library_dir) for p in batch['personas']]
+        record("create_personas_dataframe", count, lambda: create_personas_dataframe(personas))
+        personas_df = create_personas_dataframe(personas)
+        record("library_search", count, lambda: search_personas(personas_df, "zürich"))
+    
+    return results
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:8.1f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:8.2f} ms"
+    return f"{seconds:8.2f} s "
+
+
+def scaling_report(results: Dict[str, Dict[str, Any]]) -> List[str]:
+    """
+    Growth exponent of each case between consecutive sizes.
+    
+    An exponent of 1 means linear scaling; clearly above 1 means the step gets
+    disproportionately slower as the data grows.
+    """
+    lines = []
+    cases: Dict[str, List[Dict[str, Any]]] = {}
+    for result in results.values():
+        cases.setdefault(result["case"], []).append(result)
+    
+    for case, entries in cases.items():
+        entries.sort(key=lambda e: e["size"])
+        if len(entries) < 2:
+            continue
+        exponents = []
+        for small, large in zip(entries, entries[1:]):
+            exponents.append(math.log(large["median"] / small["median"]) / math.log(large["size"] / small["size"]))
+        worst = max(exponents)
+        flag = "⚠️ superlinear" if worst > 1.2 else ""
+        lines.append(f"  {case:<26} exponents {', '.join(f'{e:.2f}' for e in exponents)}  {flag}")
+    return lines
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], threshold: float = 1.25) -> List[Dict[str, Any]]:
+    """
+    Compare median timings with a baseline.
+    
+    Args:
+        results: Output of run_suite
+        baseline: Loaded baseline JSON
+        threshold: Slowdown factor from which a case counts as a regression
+    
+    Returns:
+        One dict per case present in both runs: key, baseline, current, ratio, regression
+    """
+    comparison = []
+    for key, result in results.items():
+        previous = baseline.get("results", {}).get(key)
+        if previous is None:
+            continue
+        ratio = result["median"] / previous["median"] if previous["median"] else float("inf")
+        comparison.append({
+            "key": key,
+            "baseline": previous["median"],
+            "current": result["median"],
+            "ratio": ratio,
+            "regression": ratio > threshold
+        })
+    return comparison
+
+
+def save_baseline(results: Dict[str, Dict[str, Any]], path: Path):
+    """Write results with environment information as a baseline JSON."""
+    baseline = {
+        "metadata": {
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "results": results
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the persona generator hot paths")
+    parser.add_argument("--rows", help="Comma-separated demographic row counts")
+    parser.add_argument("--personas", help="Comma-separated stored persona counts")
+    parser.add_argument("--full", action="store_true", help="Run up to 1M rows and 100k personas")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds spent per measurement")
+    parser.add_argument("--baseline", type=Path, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", type=Path, help="Write the results as a new baseline")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown factor reported as regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with code 1 on regressions")
+    args = parser.parse_args()
+    
+    rows_sizes = FULL_ROWS if args.full else DEFAULT_ROWS
+    persona_sizes = FULL_PERSONAS if args.full else DEFAULT_PERSONAS
+    if args.rows:
+        rows_sizes = [int(n) for n in args.rows.split(",")]
+    if args.personas:
+        persona_sizes = [int(n) for n in args.personas.split(",")]
+    
+    print("⏱️  Persona generator hot-path benchmarks")
+    print("=" * 60)
+    results = run_suite(rows_sizes, persona_sizes, min_time=args.min_time)
+    
+    print("\n📈 Scaling (time growth exponent per size step)")
+    for line in scaling_report(results):
+        print(line)
+    
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\n📊 Comparison with {args.baseline}")
+        for entry in compare(results, baseline, args.threshold):
+            marker = "❌" if entry["regression"] else ("✅" if entry["ratio"] < 1 / args.threshold else "  ")
+            print(f"  {marker} {entry['key']:<34} {format_seconds(entry['baseline'])} → "
+                  f"{format_seconds(entry['current'])}  ({entry['ratio']:.2f}x)")
+            if entry["regression"]:
+                regressions.append(entry)
+    
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+        print(f"\n💾 Baseline written to {args.save_baseline}")
+    
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) above {args.threshold:.2f}x")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Shared pytest fixtures for the demographics tests
+"""
+
+import contextlib
+import pytest
+import data
+from diagnostics import cache_stats
+
+@pytest.fixture
+def data_cache(tmp_path, monkeypatch):
+    """Point SWISS_AI_DATA_CACHE at a temporary directory and start with an empty process cache"""
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("SWISS_AI_DATA_CACHE", str(cache_dir))
+    data._demographics.clear()
+    cache_stats.reset()
+    yield cache_dir
+    data._demographics.clear()
+
+@pytest.fixture
+def demographics_csv(tmp_path, data_cache):
+    """Write a frame as demographics CSV into the temporary directory, loaded through data_cache"""
+    def write(frame, name="demographics.csv"):
+        csv_path = tmp_path / name
+        frame.to_csv(csv_path, index=False)
+        return csv_path
+    return write
+
+@pytest.fixture
+def forbid_csv_parse(monkeypatch):
+    """Context manager in which parsing a demographics CSV fails the test"""
+    def fail_parse(csv_path, columns=None):
+        raise AssertionError(f"{csv_path} parsed again")
+
+    @contextlib.contextmanager
+    def forbid():
+        with monkeypatch.context() as patch:
+            patch.setattr(data, "parse_demographie_csv", fail_parse)
+            yield
+    return forbid
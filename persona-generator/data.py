@@ -1,14 +1,287 @@
+import os
+import hashlib
+import logging
+import threading
 import pandas as pd
 from pathlib import Path
+from diagnostics import cache_stats
+from demographic_store import DemographicStore
+from demographic_rows import CsvRowIndex
+from demographic_stream import build_store
+from demographic_index import FILTER_COLUMNS, DemographicIndex
+from filter_spec import spec_from_params
 
-def load_demographie_csv():
-  csv_path = Path(__file__).parent / "../data/Demographie/datax.csv"
-  df = pd.read_csv(csv_path, low_memory=False)
-  return df
+logger = logging.getLogger(__name__)
 
-def filter_df_by_params(df, params):
-  for key, value in params.items():
-    if value is not None:
-      df = df[df[key] == value]
-  return df
+DEMOGRAPHIE_CSV = Path(__file__).parent / "../data/Demographie/datax.csv"
+
+# Parsed CSVs are kept as memory-mapped column stores below this directory
+DEFAULT_DATA_CACHE_DIR = Path(__file__).parent / ".cache" / "demographics"
+
+# path -> ((mtime_ns, size), parsed content)
+_file_cache = {}
+_file_cache_lock = threading.Lock()
+
+# CSVs of at least this size are converted to the column store chunk by chunk
+DEFAULT_STREAM_THRESHOLD_MB = 256
+
+# Columns parsed up front when there is no column store: the filter columns
+# and the option lists of the filter widgets
+EAGER_COLUMNS = FILTER_COLUMNS + ('beruf',)
+
+# resolved CSV path -> ((mtime_ns, size), {"store", "index", "rows", "frame", "csv_path"})
+_demographics = {}
+_demographics_lock = threading.Lock()
+
+def get_data_cache_dir():
+  """
+  Read the on-disk cache location from SWISS_AI_DATA_CACHE.
+
+  Unset or "1"/"true" uses .cache/demographics, "0"/"false" turns the on-disk
+  cache off (the filter columns are then parsed once per process and other
+  columns read per selected row), any other value is taken as the directory.
+  """
+  setting = os.getenv("SWISS_AI_DATA_CACHE", "").strip()
+  if not setting or setting.lower() in ("1", "true", "yes"):
+    return DEFAULT_DATA_CACHE_DIR
+  if setting.lower() in ("0", "false", "no"):
+    return None
+  return Path(setting)
+
+def get_stream_threshold():
+  """
+  Read SWISS_AI_DATA_STREAM_MB, the CSV size (in MB) from which the column
+  store is built in chunks with bounded memory (see demographic_stream)
+  instead of from one full parse. Default 256, "0" streams every file.
+  """
+  setting = os.getenv("SWISS_AI_DATA_STREAM_MB", "").strip()
+  try:
+    megabytes = float(setting) if setting else DEFAULT_STREAM_THRESHOLD_MB
+  except ValueError:
+    logger.warning(f"Ignoring invalid SWISS_AI_DATA_STREAM_MB={setting!r}")
+    megabytes = DEFAULT_STREAM_THRESHOLD_MB
+  return int(megabytes * 1024 * 1024)
+
+def _file_signature(path):
+  stat = Path(path).stat()
+  return (stat.st_mtime_ns, stat.st_size)
+
+def parse_demographie_csv(csv_path, columns=None):
+  """
+  Parse the demographics CSV with pandas, without any caching.
+
+  Args:
+    csv_path: CSV file
+    columns: Only parse these columns (those missing from the file are ignored)
+  """
+  usecols = (lambda name: name in columns) if columns is not None else None
+  return pd.read_csv(csv_path, low_memory=False, usecols=usecols)
+
+def load_demographie_csv(csv_path=None):
+  """
+  Load the whole demographics table, parsing the CSV at most once per process.
+
+  The frame is a view of the column store (see load_demographic_store):
+  numeric columns are the memory-mapped arrays, text columns categoricals
+  over the store's dictionaries. It is shared between threads and sessions,
+  is read-only and must not be modified in place. It is built on the first
+  call only; filtering and sampling use the index and load_demographic_rows.
+
+  Args:
+    csv_path: CSV file, defaults to DEMOGRAPHIE_CSV from the environment or datax.csv
+
+  Returns:
+    Read-only DataFrame with one row per person
+
+  Raises:
+    ValueError: The CSV is above the stream threshold and has no column store
+  """
+  loaded = _load_demographics(csv_path)
+  if loaded["frame"] is None:
+    with _demographics_lock:
+      if loaded["frame"] is None:
+        store = loaded["store"]
+        if loaded["rows"] is not store:
+          # Projected store: the full table needs the other columns as well
+          if _file_signature(loaded["csv_path"])[1] >= get_stream_threshold():
+            raise ValueError(
+              f"{loaded['csv_path']} is too large to load as a whole without a column store "
+              "(SWISS_AI_DATA_STREAM_MB); use load_demographic_index and load_demographic_rows"
+            )
+          store = DemographicStore.from_frame(parse_demographie_csv(loaded["csv_path"]))
+        loaded["frame"] = store.to_frame()
+  return loaded["frame"]
+
+def load_demographic_rows(row_ids, csv_path=None):
+  """
+  All columns of the given persons, fetched on demand.
+
+  Reads the selected rows from the column store, or through the row-offset
+  index into the CSV when only the filter columns were loaded (see
+  demographic_rows).
+
+  Args:
+    row_ids: Row positions, e.g. from load_demographic_index().row_ids(...)
+    csv_path: CSV file, defaults to DEMOGRAPHIE_CSV from the environment or datax.csv
+
+  Returns:
+    DataFrame with one row per id, in the given order, indexed by row id
+  """
+  return _load_demographics(csv_path)["rows"].take(row_ids)
+
+def load_demographic_store(csv_path=None):
+  """
+  Load the demographics data as a DemographicStore, once per process.
 
+  The first call per CSV memory-maps the store under SWISS_AI_DATA_CACHE
+  (or parses the CSV and writes the store); later calls return the same
+  object until the CSV's modification time or size changes. Without an
+  on-disk store the store holds EAGER_COLUMNS only.
+
+  Args:
+    csv_path: CSV file, defaults to DEMOGRAPHIE_CSV from the environment or datax.csv
+  """
+  return _load_demographics(csv_path)["store"]
+
+def load_demographic_index(csv_path=None):
+  """
+  Bitmap index over the filter dimensions of the demographics data (see demographic_index).
+
+  Built together with the store, so it is shared by all threads and replaced
+  when the CSV changes.
+
+  Args:
+    csv_path: CSV file, defaults to DEMOGRAPHIE_CSV from the environment or datax.csv
+  """
+  return _load_demographics(csv_path)["index"]
+
+def demographics_store_location(csv_path=None):
+  """
+  Resolve the demographics CSV and where its column store lives.
+
+  Args:
+    csv_path: CSV file, defaults to DEMOGRAPHIE_CSV from the environment or datax.csv
+
+  Returns:
+    (csv path, (mtime_ns, size) of the CSV, store directory or None if the on-disk cache is off)
+  """
+  # DEMOGRAPHIE_CSV in the environment points the app at another data file
+  csv_path = Path(csv_path or os.getenv("DEMOGRAPHIE_CSV") or DEMOGRAPHIE_CSV)
+  cache_dir = get_data_cache_dir()
+  store_dir = _store_dir(cache_dir, str(csv_path.resolve())) if cache_dir is not None else None
+  return csv_path, _file_signature(csv_path), store_dir
+
+def should_stream_demographics(csv_path=None):
+  """
+  Whether a draw should stream the CSV (demographic_sampler.stream_sample_persons)
+  instead of loading it: the CSV is at least get_stream_threshold() bytes, the
+  on-disk cache is on and its column store exists neither in this process nor
+  on disk yet. The streaming draw writes the store, later draws use the index.
+
+  Args:
+    csv_path: CSV file, defaults to DEMOGRAPHIE_CSV from the environment or datax.csv
+  """
+  csv_path, signature, store_dir = demographics_store_location(csv_path)
+  if store_dir is None or signature[1] < get_stream_threshold():
+    return False
+  entry = _demographics.get(str(csv_path.resolve()))
+  if entry is not None and entry[0] == signature:
+    return False
+  return DemographicStore.open(store_dir, signature) is None
+
+def _load_demographics(csv_path):
+  csv_path, signature, store_dir = demographics_store_location(csv_path)
+  key = str(csv_path.resolve())
+
+  entry = _demographics.get(key)
+  if entry is not None and entry[0] == signature:
+    cache_stats.record("data", hit=True)
+    return entry[1]
+
+  # One loader per process; threads arriving meanwhile wait and reuse its result
+  with _demographics_lock:
+    entry = _demographics.get(key)
+    if entry is not None and entry[0] == signature:
+      cache_stats.record("data", hit=True)
+      return entry[1]
+
+    store = None
+    rows = None
+    large = signature[1] >= get_stream_threshold()
+    if store_dir is not None:
+      store = DemographicStore.open(store_dir, signature)
+    if store is None and store_dir is not None and large:
+      # Large CSV: two chunked passes straight into the store files, never the whole table in memory
+      try:
+        store = build_store(csv_path, store_dir, signature)
+      except OSError as e:
+        logger.warning(f"Could not write demographics store {store_dir}, loading the filter columns only: {e}")
+    if store is None and (store_dir is None or large):
+      # No store on disk: parse the filter columns, fetch other columns per selected row
+      store = DemographicStore.from_frame(parse_demographie_csv(csv_path, columns=EAGER_COLUMNS))
+      rows = CsvRowIndex.build(csv_path, store.rows)
+      if rows is None and large:
+        raise ValueError(
+          f"{csv_path} is too large to parse as a whole (SWISS_AI_DATA_STREAM_MB) and its rows "
+          "cannot be fetched by line (quoted line breaks); a writable SWISS_AI_DATA_CACHE is needed"
+        )
+      if rows is None:
+        store = None
+    if store is None:
+      store = DemographicStore.from_frame(parse_demographie_csv(csv_path))
+      if store_dir is not None:
+        try:
+          store.save(store_dir, signature)
+          # Serve the mapped files, so this process shares pages with the others
+          store = DemographicStore.open(store_dir, signature) or store
+        except OSError as e:
+          logger.warning(f"Could not write demographics store {store_dir}: {e}")
+
+    loaded = {
+      "store": store,
+      "index": DemographicIndex(store),
+      "rows": rows if rows is not None else store,
+      "frame": None,
+      "csv_path": csv_path,
+    }
+    _demographics[key] = (signature, loaded)
+    cache_stats.record("data", hit=False)
+    return loaded
+
+def _store_dir(cache_dir, key):
+  """One store directory per CSV path, named after the file and a hash of its path"""
+  digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+  return Path(cache_dir) / f"{Path(key).stem}-{digest}"
+
+def read_cached(path, parse, cache_name):
+  """
+  Parse a file once and reuse the result until the file changes.
+
+  Entries are keyed by path and validated by modification time and size, so
+  edited or rewritten files are parsed again. The parsed object is shared
+  between callers and must not be modified.
+
+  Args:
+    path: File to read
+    parse: Function taking an open text file and returning the parsed content
+    cache_name: Name under which hits and misses are counted (see diagnostics)
+  """
+  path = Path(path)
+  signature = _file_signature(path)
+  key = str(path.resolve())
+
+  with _file_cache_lock:
+    entry = _file_cache.get(key)
+  if entry is not None and entry[0] == signature:
+    cache_stats.record(cache_name, hit=True)
+    return entry[1]
+
+  with open(path, 'r', encoding='utf-8') as f:
+    content = parse(f)
+  with _file_cache_lock:
+    _file_cache[key] = (signature, content)
+  cache_stats.record(cache_name, hit=False)
+  return content
+
+def filter_df_by_params(df, params):
+  return spec_from_params(params).apply(df)
@@ -4,7 +4,7 @@ Debug script to test LLM persona generation directly
 """
 import json
 from pathlib import Path
-from data import load_demographie_csv
+from data import load_demographic_rows
 from llm import SwissAIClient
 
 def load_prompt_files():
@@ -24,10 +24,8 @@ def test_persona_generation():
     """Test persona generation with debug output"""
     
     print("🔍 Loading data...")
-    df = load_demographie_csv()
-    
     # Select first person for consistent testing
-    selected_person = df.iloc[0]
+    selected_person = load_demographic_rows([0]).iloc[0]
     
     # Create test parameters
     additional_params = {
@@ -87,7 +85,7 @@ def test_persona_generation():
     
     print("🚀 Calling LLM...")
     try:
-        client = SwissAIClient()
+        client = SwissAIClient(caller="debug_llm")
         
         response = client.complete(
             prompt=full_prompt,
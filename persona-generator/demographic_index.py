@@ -0,0 +1,338 @@
+"""
+Bitmap indexes over the demographic filter dimensions and the filter planner.
+
+For every option of every sidebar filter (age bucket, gender, income bucket,
+canton, language region, education, employment, children) the index holds a
+packed bitmap with one bit per row, built once per loaded store. A FilterSpec
+(see filter_spec) is compiled into a FilterPlan: predicates with a bitmap are
+ANDed first, the others are evaluated on the column store for the remaining
+rows only, each group ordered by estimated selectivity. Row ids are cached per
+spec, so repeated personas with the same filters cost a dictionary lookup.
+"""
+import threading
+from functools import reduce
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from demographic_store import DemographicStore
+from filter_spec import SIDEBAR_BUCKETS, Eq, In, FilterSpec, spec_from_sidebar
+
+# Filters matched by equality, one bitmap per distinct value
+VALUE_DIMENSIONS = ('kanton', 'sprachgebiet', 'ausbildung', 'arbeit', 'kinder')
+
+# Columns the index reads: those of the sidebar buckets and the equality dimensions
+FILTER_COLUMNS = tuple(dict.fromkeys(
+    [predicate.column for buckets in SIDEBAR_BUCKETS.values() for predicate in buckets.values()] + list(VALUE_DIMENSIONS)
+))
+
+# Filter specs whose row ids are kept
+ROW_ID_CACHE_SIZE = 256
+
+# Rows evaluated to estimate the selectivity of predicates without a bitmap
+SELECTIVITY_SAMPLE_SIZE = 4096
+
+# Distinct values up to which a column outside VALUE_DIMENSIONS is indexed on first use;
+# equality filters on columns with more values (income, free-text job titles) are scanned
+LAZY_INDEX_MAX_VALUES = 64
+
+
+# Set bits per byte value, for NumPy versions without np.bitwise_count
+_BIT_COUNTS = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def popcount(bitmap: np.ndarray, axis: Optional[int] = None):
+    """Number of set bits in a packed bitmap (per row of a stack of bitmaps with axis=-1)."""
+    bits = np.bitwise_count(bitmap) if hasattr(np, "bitwise_count") else _BIT_COUNTS[bitmap]
+    counts = bits.sum(axis=axis, dtype=np.int64)
+    return int(counts) if axis is None else counts
+
+
+class PlanStep:
+    """One predicate of a plan: estimated share of matching rows and its bitmap, if indexed."""
+    
+    def __init__(self, predicate, selectivity: float, bitmap: Optional[np.ndarray]):
+        self.predicate = predicate
+        self.selectivity = selectivity
+        self.bitmap = bitmap
+
+
+class FilterPlan:
+    """A FilterSpec compiled against one index: bitmap ANDs, then scans of the surviving rows."""
+    
+    def __init__(self, index: "DemographicIndex", steps: List[PlanStep]):
+        self.index = index
+        self.bitmap_steps = sorted((s for s in steps if s.bitmap is not None), key=lambda s: s.selectivity)
+        self.scan_steps = sorted((s for s in steps if s.bitmap is None), key=lambda s: s.selectivity)
+    
+    @property
+    def steps(self) -> List[PlanStep]:
+        """Steps in execution order."""
+        return self.bitmap_steps + self.scan_steps
+    
+    def explain(self) -> List[str]:
+        """One line per step in execution order, with the estimated share of matching rows."""
+        lines = []
+        for number, step in enumerate(self.steps, start=1):
+            access = "bitmap" if step.bitmap is not None else "scan"
+            lines.append(f"{number}. {access:<6} {step.predicate.describe():<40} ~{step.selectivity:.1%}")
+        return lines or ["all rows (no filter)"]
+    
+    def bitmap(self) -> np.ndarray:
+        """Packed bitmap of the matching rows; scans are only run if the plan has any."""
+        index = self.index
+        if not self.scan_steps:
+            bitmaps = [s.bitmap for s in self.bitmap_steps]
+            return reduce(np.bitwise_and, bitmaps[1:], bitmaps[0]) if bitmaps else index._all
+        mask = np.zeros(index.rows, dtype=bool)
+        mask[self.run()] = True
+        return np.packbits(mask)
+    
+    def run(self) -> np.ndarray:
+        """Sorted row ids matching every step."""
+        index = self.index
+        row_ids = None
+        if self.bitmap_steps:
+            first = self.bitmap_steps[0].bitmap
+            bits = reduce(np.bitwise_and, (s.bitmap for s in self.bitmap_steps[1:]), first)
+            row_ids = np.flatnonzero(np.unpackbits(bits, count=index.rows))
+        for step in self.scan_steps:
+            if row_ids is None:
+                row_ids = np.flatnonzero(index.evaluate(step.predicate))
+            elif len(row_ids) == 0:
+                break
+            else:
+                row_ids = row_ids[index.evaluate(step.predicate, row_ids)]
+        return np.arange(index.rows) if row_ids is None else row_ids
+
+
+class DemographicIndex:
+    """Packed bitmaps per filter option of one DemographicStore."""
+    
+    def __init__(self, store: DemographicStore):
+        self.store = store
+        self.rows = store.rows
+        self._lock = threading.Lock()
+        self._none = np.packbits(np.zeros(self.rows, dtype=bool))
+        self._none.flags.writeable = False
+        self._all = np.packbits(np.ones(self.rows, dtype=bool))
+        self._all.flags.writeable = False
+        # filter key -> {option: bitmap}
+        self._bitmaps: Dict[str, Dict[Any, np.ndarray]] = {}
+        # columns with too many distinct values for value bitmaps
+        self._scanned: set = set()
+        # predicate -> (bitmap, matching rows), for every bitmap above
+        self._predicates: Dict[Any, Tuple[np.ndarray, int]] = {}
+        self._row_ids: "OrderedDict[FilterSpec, np.ndarray]" = OrderedDict()
+        self._categories: Dict[str, Tuple[List[Any], np.ndarray]] = {}
+        # filter key -> option bitmaps stacked into one (options, bytes) matrix
+        self._facets: Dict[str, np.ndarray] = {}
+        sample_size = min(self.rows, SELECTIVITY_SAMPLE_SIZE)
+        self._sample = np.sort(np.random.default_rng(0).choice(self.rows, sample_size, replace=False))
+        
+        for key, buckets in SIDEBAR_BUCKETS.items():
+            columns = {predicate.column for predicate in buckets.values()}
+            if all(column in store.columns and not store.is_text(column) for column in columns):
+                self._bitmaps[key] = {label: self._index(predicate) for label, predicate in buckets.items()}
+        for column in VALUE_DIMENSIONS:
+            if column in store.columns:
+                self._bitmaps[column] = self._value_bitmaps(column, self._distinct_values(column))
+    
+    def _index(self, predicate) -> np.ndarray:
+        bitmap = np.packbits(self.evaluate(predicate))
+        bitmap.flags.writeable = False
+        self._predicates[predicate] = (bitmap, popcount(bitmap))
+        return bitmap
+    
+    def _distinct_values(self, column: str, limit: Optional[int] = None) -> Optional[List[Any]]:
+        """Distinct values of a column, None if there are more than limit."""
+        if self.store.is_text(column):
+            distinct = self.store.dictionary(column)
+            return None if limit is not None and len(distinct) > limit else list(distinct)
+        
+        def unique(values):
+            return np.unique(values[~np.isnan(values)] if values.dtype.kind == 'f' else values)
+        
+        values = self.store.column(column)
+        # The sample rules out most high-cardinality columns without sorting every row
+        if limit is not None and len(unique(values[self._sample])) > limit:
+            return None
+        distinct = unique(values)
+        if limit is not None and len(distinct) > limit:
+            return None
+        return [v.item() for v in distinct]
+    
+    def _value_bitmaps(self, column: str, distinct: List[Any]) -> Dict[Any, np.ndarray]:
+        return {value: self._index(Eq(column, value)) for value in distinct}
+    
+    def evaluate(self, predicate, row_ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Boolean mask of one predicate over the column store.
+        
+        Text values are translated to dictionary codes first, so no strings are compared.
+        
+        Args:
+            predicate: Range, In or Eq from filter_spec
+            row_ids: Rows to evaluate (default: all rows)
+        
+        Raises:
+            ValueError: Range predicate on a text column
+        """
+        column = predicate.column
+        values = self.store.column(column)
+        if row_ids is not None:
+            values = values[row_ids]
+        if not self.store.is_text(column):
+            return predicate.evaluate(values)
+        if isinstance(predicate, Eq):
+            code = self.store.code(column, predicate.value)
+            return values == code if code >= 0 else np.zeros(len(values), dtype=bool)
+        if isinstance(predicate, In):
+            codes = [code for code in (self.store.code(column, v) for v in predicate.values) if code >= 0]
+            return np.isin(values, codes)
+        raise ValueError(f"{predicate.describe()}: {column} is a text column")
+    
+    def plan(self, spec: FilterSpec) -> FilterPlan:
+        """
+        Compile a FilterSpec against this index.
+        
+        Equality and IN predicates on indexed columns (and the sidebar buckets)
+        use bitmaps with exact counts; the selectivity of all other predicates
+        is estimated on a fixed sample of rows. Predicates on columns the data
+        does not have are skipped.
+        """
+        steps = []
+        for predicate in spec.predicates:
+            if predicate.column not in self.store.columns:
+                continue
+            bitmap, matches = self._bitmap(predicate)
+            if bitmap is not None:
+                steps.append(PlanStep(predicate, matches / self.rows if self.rows else 0.0, bitmap))
+            else:
+                estimate = float(self.evaluate(predicate, self._sample).mean()) if len(self._sample) else 0.0
+                steps.append(PlanStep(predicate, estimate, None))
+        return FilterPlan(self, steps)
+    
+    def _bitmap(self, predicate) -> Tuple[Optional[np.ndarray], int]:
+        indexed = self._predicates.get(predicate)
+        if indexed is not None:
+            return indexed
+        if isinstance(predicate, Eq):
+            column = predicate.column
+            with self._lock:
+                if column not in self._bitmaps and column not in self._scanned:
+                    # Low-cardinality columns outside the sidebar dimensions are indexed on first use
+                    distinct = self._distinct_values(column, LAZY_INDEX_MAX_VALUES)
+                    if distinct is None:
+                        self._scanned.add(column)
+                    else:
+                        self._bitmaps[column] = self._value_bitmaps(column, distinct)
+            if column in self._scanned:
+                return None, 0
+            return self._predicates.get(predicate, (self._none, 0))
+        if isinstance(predicate, In) and predicate.column in self._bitmaps:
+            parts = [self._predicates.get(Eq(predicate.column, value), (self._none, 0))[0] for value in predicate.values]
+            bitmap = reduce(np.bitwise_or, parts[1:], parts[0]) if parts else self._none
+            return bitmap, popcount(bitmap)
+        return None, 0
+    
+    def options(self, key: str) -> List[Any]:
+        """Options of an indexed filter dimension, in index order."""
+        return list(self._bitmaps.get(key, {}))
+    
+    def categories(self, key: str) -> Tuple[List[Any], np.ndarray]:
+        """
+        Per-row option codes of one filter dimension, computed once from its bitmaps.
+        
+        Returns:
+            (options, codes) with codes[row] the position in options, -1 for rows in no option
+        """
+        with self._lock:
+            cached = self._categories.get(key)
+        if cached is not None:
+            return cached
+        
+        options = self.options(key)
+        codes = np.full(self.rows, -1, dtype=np.int16)
+        for code, option in enumerate(options):
+            codes[np.unpackbits(self._bitmaps[key][option], count=self.rows).view(bool)] = code
+        codes.flags.writeable = False
+        with self._lock:
+            self._categories[key] = (options, codes)
+        return options, codes
+    
+    def facet_counts(self, csv_filters: Dict[str, Any]) -> Dict[str, Dict[Any, int]]:
+        """
+        Matching persons per option of every indexed filter, given the other current filters.
+        
+        As in faceted search, the counts of a filter ignore its own selection: they
+        answer "how many persons would match if this option were chosen instead".
+        All counts are popcounts over the precomputed bitmaps; filters outside the
+        indexed dimensions still restrict the counts of all dimensions.
+        
+        Args:
+            csv_filters: Filter dict as collected by the sidebar
+        
+        Returns:
+            filter key -> {"Alle": persons matching without this filter, option: persons, ...}
+        """
+        spec = spec_from_sidebar(csv_filters)
+        own = {key: spec_from_sidebar({key: value}).predicates for key, value in csv_filters.items()}
+        shared = None
+        counts = {}
+        for key in list(self._bitmaps):
+            if key not in SIDEBAR_BUCKETS and key not in VALUE_DIMENSIONS:
+                continue
+            if own.get(key):
+                others = FilterSpec(p for p in spec.predicates if p not in own[key])
+                base = self.plan(others).bitmap()
+            else:
+                # Filters without a selection share the bitmap of the full combination
+                if shared is None:
+                    shared = self.plan(spec).bitmap()
+                base = shared
+            option_counts = popcount(self._facet_matrix(key) & base, axis=-1)
+            counts[key] = {"Alle": popcount(base), **dict(zip(self._bitmaps[key], option_counts.tolist()))}
+        return counts
+    
+    def _facet_matrix(self, key: str) -> np.ndarray:
+        matrix = self._facets.get(key)
+        if matrix is None:
+            bitmaps = list(self._bitmaps[key].values())
+            matrix = np.stack(bitmaps) if bitmaps else np.zeros((0, len(self._none)), dtype=np.uint8)
+            matrix.flags.writeable = False
+            self._facets[key] = matrix
+        return matrix
+    
+    def select(self, csv_filters: Dict[str, Any]) -> np.ndarray:
+        """Row ids matching the sidebar filters, computed without the cache."""
+        return self.plan(spec_from_sidebar(csv_filters)).run()
+    
+    def row_ids(self, csv_filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Row ids (positions in the store) matching the sidebar filters, cached per combination.
+        
+        Args:
+            csv_filters: Filter dict as collected by the sidebar
+        
+        Returns:
+            Sorted read-only int array; shared between callers
+        """
+        return self.spec_row_ids(spec_from_sidebar(csv_filters))
+    
+    def spec_row_ids(self, spec: FilterSpec) -> np.ndarray:
+        """Row ids matching a FilterSpec, cached per spec (predicate order does not matter)."""
+        with self._lock:
+            row_ids = self._row_ids.get(spec)
+            if row_ids is not None:
+                self._row_ids.move_to_end(spec)
+                return row_ids
+        
+        row_ids = self.plan(spec).run()
+        row_ids.flags.writeable = False
+        with self._lock:
+            self._row_ids[spec] = row_ids
+            while len(self._row_ids) > ROW_ID_CACHE_SIZE:
+                self._row_ids.popitem(last=False)
+        return row_ids
@@ -0,0 +1,277 @@
+"""
+Quota and stratified sampling of source persons for representative batches.
+
+Targets are given per filter dimension as option -> count ("quota" mode) or
+option -> share ("ipf" mode), e.g.
+
+    {"kanton": {"ZH": 0.18, "BE": 0.12, ...}, "geschlecht": {"Weiblich": 0.5, "Männlich": 0.5}}
+
+The rows matching the hard filters are grouped into joint cells (one per
+combination of options of the targeted dimensions). The cell sizes of the
+population are then fitted to all target marginals by iterative proportional
+fitting (raking), rounded to whole persons with every marginal kept on target
+and drawn per cell in one pass. Quotas are met exactly as far as the data
+contains such persons; unreachable targets are logged.
+
+Dimensions: alter_range, geschlecht, kanton, sprachgebiet (any indexed
+filter dimension works, see demographic_index).
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from data import load_demographic_index
+from demographic_sampler import SampledPerson, sample_persons, sample_rows
+
+logger = logging.getLogger(__name__)
+
+# Dimensions a representative batch is stratified by
+REPRESENTATIVE_DIMENSIONS = ('kanton', 'alter_range', 'geschlecht', 'sprachgebiet')
+
+QUOTA_MODES = ("quota", "ipf")
+
+# Raking stops after this many sweeps or once every marginal is within IPF_TOLERANCE persons
+IPF_MAX_ITERATIONS = 200
+IPF_TOLERANCE = 1e-6
+
+# Above this many joint cells the pairwise marginal repair after rounding is skipped
+REPAIR_MAX_CELLS = 4000
+
+
+def population_shares(csv_filters: Dict[str, Any], dimensions=REPRESENTATIVE_DIMENSIONS, csv_path=None) -> Dict[str, Dict[Any, float]]:
+    """
+    Marginal distribution of the persons matching the filters, per dimension.
+    
+    Used as "ipf" targets this yields a batch whose canton, age, gender and
+    language mix equals that of the data instead of a random deviation from it.
+    Dimensions in which none of the matching persons has a value are left out.
+    """
+    index = load_demographic_index(csv_path)
+    row_ids = index.row_ids(csv_filters)
+    shares = {}
+    for dimension in dimensions:
+        options, codes = index.categories(dimension)
+        counts = np.bincount(codes[row_ids][codes[row_ids] >= 0], minlength=len(options))
+        total = counts.sum()
+        if total:
+            shares[dimension] = {option: counts[i] / total for i, option in enumerate(options) if counts[i]}
+    return shares
+
+
+def fit_cell_counts(population: np.ndarray, targets: List[np.ndarray]) -> np.ndarray:
+    """
+    Iterative proportional fitting of a joint cell table to target marginals.
+    
+    Args:
+        population: Persons per cell, shape (options of dim 1, options of dim 2, ...)
+        targets: Target count per option for every dimension, each summing to the batch size
+    
+    Returns:
+        Fractional counts per cell (zero wherever the population is empty)
+    """
+    fitted = population.astype(np.float64)
+    if fitted.sum() == 0:
+        return fitted
+    fitted *= targets[0].sum() / fitted.sum()
+    for _ in range(IPF_MAX_ITERATIONS):
+        worst = 0.0
+        for axis, target in enumerate(targets):
+            other_axes = tuple(a for a in range(fitted.ndim) if a != axis)
+            current = fitted.sum(axis=other_axes)
+            worst = max(worst, float(np.abs(current - target).max()))
+            factor = np.divide(target, current, out=np.zeros_like(target, dtype=np.float64), where=current > 0)
+            shape = [1] * fitted.ndim
+            shape[axis] = -1
+            fitted *= factor.reshape(shape)
+        if worst < IPF_TOLERANCE:
+            break
+    return fitted
+
+
+def round_counts(fitted: np.ndarray, targets: List[np.ndarray]) -> np.ndarray:
+    """
+    Round fractional cell counts to whole persons, keeping every marginal on target.
+    
+    Starts from the rounded-down counts and hands out the remaining persons one
+    at a time to the cell that is still short in the most dimensions, ties
+    broken by the largest fractional remainder. Cells without population never
+    receive persons, so the counts fall short of the batch size when no cell
+    fits the targets at all.
+    
+    Args:
+        fitted: Output of fit_cell_counts
+        targets: Target count per option for every dimension
+    
+    Returns:
+        Integer counts per cell summing to the batch size (or less, see above)
+    """
+    total = int(round(targets[0].sum()))
+    counts = np.floor(fitted + 1e-9).astype(np.int64)
+    deficits = [_round_vector(target, total) - marginal for target, marginal in zip(targets, _marginals(counts))]
+    
+    for _ in range(total - int(counts.sum())):
+        short = np.zeros(fitted.shape)
+        for axis, deficit in enumerate(deficits):
+            shape = [1] * fitted.ndim
+            shape[axis] = -1
+            short = short + (deficit > 0).reshape(shape)
+        score = np.where(fitted > 0, short * total + (fitted - counts), -np.inf)
+        if not np.isfinite(score.max()):
+            break
+        cell = np.unravel_index(int(np.argmax(score)), fitted.shape)
+        counts[cell] += 1
+        for axis, deficit in enumerate(deficits):
+            deficit[cell[axis]] -= 1
+    
+    if counts.size <= REPAIR_MAX_CELLS:
+        _repair_marginals(counts, fitted, [_round_vector(target, total) for target in targets])
+    return counts
+
+
+def _repair_marginals(counts: np.ndarray, fitted: np.ndarray, targets: List[np.ndarray]):
+    """
+    Move single persons between cells while that brings the marginals closer to the targets.
+    
+    The greedy hand-out can run into cells that are short in some dimensions
+    only; each move here picks the pair of cells (from, to) that lowers the
+    total marginal deviation the most.
+    """
+    options = [np.indices(counts.shape)[axis].ravel() for axis in range(counts.ndim)]
+    flat = counts.reshape(-1)
+    for _ in range(int(counts.sum())):
+        deviations = [marginal - target for marginal, target in zip(_marginals(counts), targets)]
+        if all(not deviation.any() for deviation in deviations):
+            return
+        change = np.zeros((flat.size, flat.size))
+        for option, deviation in zip(options, deviations):
+            removed = (np.abs(deviation - 1) - np.abs(deviation))[option]
+            added = (np.abs(deviation + 1) - np.abs(deviation))[option]
+            pair = removed[:, None] + added[None, :]
+            pair[option[:, None] == option[None, :]] = 0
+            change += pair
+        change[flat == 0, :] = np.inf
+        change[:, fitted.ravel() <= 0] = np.inf
+        source, target = np.unravel_index(int(np.argmin(change)), change.shape)
+        if change[source, target] >= 0:
+            return
+        flat[source] -= 1
+        flat[target] += 1
+
+
+def _round_vector(vector: np.ndarray, total: int) -> np.ndarray:
+    """Largest-remainder rounding of one marginal to whole persons summing to total."""
+    rounded = np.floor(vector + 1e-9).astype(np.int64)
+    remainders = vector - rounded
+    rounded[np.argsort(-remainders, kind="stable")[:total - rounded.sum()]] += 1
+    return rounded
+
+
+def _target_vector(dimension: str, options: List[Any], target: Dict[Any, float], count: int, mode: str) -> np.ndarray:
+    unknown = set(target) - set(options)
+    if unknown:
+        raise ValueError(f"Unknown {dimension} options in targets: {sorted(map(str, unknown))}")
+    vector = np.array([float(target.get(option, 0)) for option in options])
+    if (vector < 0).any() or vector.sum() <= 0:
+        raise ValueError(f"Targets for {dimension} must be non-negative and not all zero")
+    if mode == "quota":
+        if not np.allclose(vector, np.round(vector)) or int(round(vector.sum())) != count:
+            raise ValueError(f"Quotas for {dimension} must be whole persons summing to {count}, got {vector.sum():g}")
+        return vector
+    return vector / vector.sum() * count
+
+
+def sample_stratified(
+    count: int,
+    csv_filters: Dict[str, Any],
+    targets: Dict[str, Dict[Any, float]],
+    mode: str = "ipf",
+    seed: Optional[int] = None,
+    csv_path=None
+) -> List[SampledPerson]:
+    """
+    Draw source persons whose mix over the targeted dimensions matches the targets.
+    
+    Args:
+        count: Batch size
+        csv_filters: Hard filters applied before stratifying (sidebar filter dict)
+        targets: dimension -> {option: count ("quota") or share ("ipf")}
+        mode: "quota" for explicit person counts per option, "ipf" for shares
+        seed: Seed for a reproducible draw
+        csv_path: Demographics CSV, defaults to the app's data file
+    
+    Returns:
+        count SampledPersons in random order, empty if no matching person has
+        values in the targeted dimensions that fit the targets; persons are
+        repeated only in cells with fewer persons than their quota
+    
+    Raises:
+        ValueError: Unknown mode, dimension or option, or quotas not summing to count
+    """
+    if mode not in QUOTA_MODES:
+        raise ValueError(f"mode must be one of {QUOTA_MODES}, got {mode!r}")
+    index = load_demographic_index(csv_path)
+    row_ids = index.row_ids(csv_filters)
+    if count <= 0 or len(row_ids) == 0:
+        return []
+    if not targets:
+        raise ValueError("targets must name at least one dimension")
+    # Dimensions without target options (no matching person has a value there) do not stratify
+    targets = {dimension: target for dimension, target in targets.items() if target}
+    if not targets:
+        return sample_persons(count, csv_filters, seed=seed, csv_path=csv_path)
+    
+    # Joint cell of every candidate row (mixed radix over the targeted dimensions)
+    shape = []
+    target_vectors = []
+    cells = np.zeros(len(row_ids), dtype=np.int64)
+    in_scope = np.ones(len(row_ids), dtype=bool)
+    for dimension, target in targets.items():
+        if not index.options(dimension):
+            raise ValueError(f"Unknown dimension {dimension!r}")
+        options, codes = index.categories(dimension)
+        row_codes = codes[row_ids]
+        in_scope &= row_codes >= 0
+        cells = cells * len(options) + np.maximum(row_codes, 0)
+        shape.append(len(options))
+        target_vectors.append(_target_vector(dimension, options, target, count, mode))
+    
+    candidates = row_ids[in_scope]
+    cells = cells[in_scope]
+    if len(candidates) == 0:
+        logger.warning(f"No person matching the filters has values for all of {sorted(targets)}")
+        return []
+    population = np.bincount(cells, minlength=int(np.prod(shape))).reshape(shape)
+    fitted = fit_cell_counts(population, target_vectors)
+    for dimension, target, achieved in zip(targets, target_vectors, _marginals(fitted)):
+        if np.abs(achieved - target).max() > 0.5:
+            logger.warning(f"Targets for {dimension} cannot be met with the persons matching the filters")
+    quotas = round_counts(fitted, target_vectors).ravel()
+    
+    # One pass over the cells: candidates grouped by cell, quota drawn from each group
+    rng = np.random.default_rng(seed)
+    order = np.argsort(cells, kind="stable")
+    bounds = np.searchsorted(cells[order], np.arange(len(quotas) + 1))
+    chosen = []
+    for cell in np.flatnonzero(quotas):
+        members = candidates[order[bounds[cell]:bounds[cell + 1]]]
+        chosen.append(rng.choice(members, size=quotas[cell], replace=quotas[cell] > len(members)))
+    chosen = np.concatenate(chosen) if chosen else np.array([], dtype=np.int64)
+    rng.shuffle(chosen)
+    return sample_rows(chosen, csv_path)
+
+
+def _marginals(fitted: np.ndarray) -> List[np.ndarray]:
+    return [fitted.sum(axis=tuple(a for a in range(fitted.ndim) if a != axis)) for axis in range(fitted.ndim)]
+
+
+def marginal_counts(sampled: List[SampledPerson], dimensions=REPRESENTATIVE_DIMENSIONS, csv_path=None) -> Dict[str, Dict[Any, int]]:
+    """Persons per option and dimension in a drawn batch, for checking it against the targets."""
+    index = load_demographic_index(csv_path)
+    row_ids = np.array([person.row_id for person in sampled], dtype=np.int64)
+    result = {}
+    for dimension in dimensions:
+        options, codes = index.categories(dimension)
+        counts = np.bincount(codes[row_ids][codes[row_ids] >= 0], minlength=len(options))
+        result[dimension] = {option: int(counts[i]) for i, option in enumerate(options) if counts[i]}
+    return result
@@ -0,0 +1,91 @@
+"""
+Row-offset index into the demographics CSV, for fetching selected rows on demand.
+
+Without a column store (SWISS_AI_DATA_CACHE=0) only the filter columns are
+parsed up front. The other columns of a selected person are read from the CSV
+itself: one scan records the byte offset of every line, and fetching rows
+seeks to their lines and parses just those.
+
+Values are parsed per fetch, so a column's type is inferred from the fetched
+rows (an integer column with gaps elsewhere in the file stays integer here).
+"""
+import io
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Bytes read per block while scanning for line starts
+SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def line_offsets(csv_path: Path) -> np.ndarray:
+    """
+    Byte offset of every line start in the file, plus the file size as end marker.
+
+    Returns:
+        int64 array; line i spans offsets[i]:offsets[i + 1]
+    """
+    parts = [np.zeros(1, dtype=np.int64)]
+    position = 0
+    with open(csv_path, 'rb') as f:
+        while True:
+            block = f.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord("\n"))
+            parts.append(newlines.astype(np.int64) + position + 1)
+            position += len(block)
+    offsets = np.concatenate(parts)
+    if offsets[-1] != position:
+        # Last line without a trailing newline
+        offsets = np.append(offsets, position)
+    return offsets
+
+
+class CsvRowIndex:
+    """Fetch whole rows of a CSV by row number through recorded line offsets."""
+
+    def __init__(self, csv_path: Path, offsets: np.ndarray):
+        self.csv_path = Path(csv_path)
+        self.offsets = offsets
+        self.rows = len(offsets) - 2  # without header and end marker
+
+    @classmethod
+    def build(cls, csv_path: Path, rows: int) -> Optional["CsvRowIndex"]:
+        """
+        Scan the CSV for line starts.
+
+        Args:
+            csv_path: CSV file with a header line and one person per line
+            rows: Row count of the parsed file, to check that lines and rows correspond
+
+        Returns:
+            The index, or None if lines and rows differ (quoted line breaks, blank lines)
+        """
+        index = cls(csv_path, line_offsets(csv_path))
+        if index.rows != rows:
+            logger.info(f"{csv_path}: {index.rows} lines for {rows} rows, rows cannot be fetched by line offset")
+            return None
+        return index
+
+    def take(self, row_ids) -> pd.DataFrame:
+        """All columns of the given rows, in the given order, indexed by row id."""
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        unique_ids, positions = np.unique(row_ids, return_inverse=True)
+        with open(self.csv_path, 'rb') as f:
+            buffer = io.BytesIO()
+            buffer.write(f.read(int(self.offsets[1])))
+            for row_id in unique_ids:
+                f.seek(int(self.offsets[row_id + 1]))
+                line = f.read(int(self.offsets[row_id + 2] - self.offsets[row_id + 1]))
+                buffer.write(line if line.endswith(b"\n") else line + b"\n")
+        buffer.seek(0)
+        fetched = pd.read_csv(buffer, low_memory=False)
+        result = fetched.iloc[positions]
+        result.index = pd.Index(row_ids)
+        return result
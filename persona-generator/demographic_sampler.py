@@ -0,0 +1,153 @@
+"""
+Vectorized sampling of source persons for persona generation.
+
+A batch draws all its source rows in one seeded NumPy draw over the cached
+row ids of its filter combination (see demographic_index) and renders their
+statistical_data strings up front, so the worker threads of the batch only
+do LLM work.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import data
+from data import demographics_store_location, load_demographic_index, load_demographic_rows, should_stream_demographics
+from demographic_store import DemographicStore
+from demographic_stream import CHUNK_ROWS, StoreBuilder, stream_sample
+from filter_spec import FilterSpec, spec_from_sidebar
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SampledPerson:
+    """One drawn source person: row id, column values and the prompt text."""
+    row_id: int
+    person: Dict[str, Any]
+    statistical_data: str
+
+
+def render_statistical_data(person: Dict[str, Any]) -> str:
+    """"column: value" lines for all non-null values, as used in the persona prompt."""
+    return "\n".join(f"{key}: {value}" for key, value in person.items() if pd.notna(value))
+
+
+def sample_persons(
+    count: int,
+    csv_filters: Dict[str, Any],
+    seed: Optional[int] = None,
+    replace: Optional[bool] = None,
+    csv_path=None
+) -> List[SampledPerson]:
+    """
+    Draw source persons matching the filters in one vectorized draw.
+    
+    The first draw from a large CSV without a column store streams it instead
+    (see stream_sample_persons and data.should_stream_demographics), so a seed
+    reproduces that draw only once the store exists. This applies to scripts
+    and API callers: the app pages load the store for their filter options on
+    first render, before any draw.
+    
+    Args:
+        count: Number of persons to draw
+        csv_filters: Filter dict as collected by the sidebar
+        seed: Seed for a reproducible draw (None = fresh entropy)
+        replace: Draw with replacement; None draws without replacement when
+            enough persons match and with replacement (logging a warning) otherwise
+        csv_path: Demographics CSV, defaults to the app's data file
+    
+    Returns:
+        count SampledPersons in draw order, empty if no person matches
+    
+    Raises:
+        ValueError: replace=False and fewer than count persons match
+    """
+    if count <= 0:
+        return []
+    if replace is not True and should_stream_demographics(csv_path):
+        # Holds all matching persons if fewer than count match
+        sampled = stream_sample_persons(count, csv_filters, seed=seed, csv_path=csv_path)
+        if len(sampled) == count or not sampled or not _with_replacement(len(sampled), count, replace):
+            return sampled
+        chosen = np.random.default_rng(seed).choice(len(sampled), size=count, replace=True)
+        return [sampled[i] for i in chosen]
+    
+    row_ids = load_demographic_index(csv_path).row_ids(csv_filters)
+    if len(row_ids) == 0:
+        return []
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(row_ids, size=count, replace=_with_replacement(len(row_ids), count, replace))
+    return sample_rows(chosen, csv_path)
+
+
+def _with_replacement(matching: int, count: int, replace: Optional[bool]) -> bool:
+    """Resolve the replace argument of sample_persons for matching persons."""
+    if replace is None:
+        replace = matching < count
+        if replace:
+            logger.warning(f"Only {matching} persons match the filters, drawing {count} with replacement repeats persons")
+    elif not replace and matching < count:
+        raise ValueError(f"Only {matching} persons match the filters, cannot draw {count} without replacement")
+    return replace
+
+
+def sample_rows(row_ids, csv_path=None) -> List[SampledPerson]:
+    """SampledPersons for given row ids, with one fetch of their columns for all of them."""
+    records = load_demographic_rows(row_ids, csv_path).to_dict('records')
+    return [
+        SampledPerson(int(row_id), person, render_statistical_data(person))
+        for row_id, person in zip(row_ids, records)
+    ]
+
+
+def stream_sample_persons(
+    count: int,
+    csv_filters,
+    seed: Optional[int] = None,
+    weight_column: Optional[str] = None,
+    csv_path=None,
+    chunk_rows: int = CHUNK_ROWS
+) -> List[SampledPerson]:
+    """
+    Draw source persons from a CSV of any size in one chunked pass, without loading it.
+    
+    Memory is bounded by one chunk plus the drawn persons (weighted reservoir
+    sampling, see demographic_stream). With the on-disk data cache enabled and
+    no store for the CSV yet, the same pass collects what the column store
+    needs and the store is written afterwards, so later runs use the store and
+    its bitmap index (sample_persons) instead of streaming again.
+    
+    Args:
+        count: Number of persons to draw, without replacement
+        csv_filters: Sidebar filter dict or FilterSpec, applied to every chunk
+        seed: Seed for a reproducible draw
+        weight_column: Column with a sampling weight per person (default: uniform)
+        csv_path: Demographics CSV, defaults to the app's data file
+        chunk_rows: Rows read per chunk
+    
+    Returns:
+        Up to count SampledPersons in random order (all matching persons if fewer match)
+    """
+    csv_path, signature, store_dir = demographics_store_location(csv_path)
+    spec = csv_filters if isinstance(csv_filters, FilterSpec) else spec_from_sidebar(csv_filters)
+    builder = None
+    if store_dir is not None and DemographicStore.open(store_dir, signature) is None:
+        builder = StoreBuilder()
+    
+    row_ids, rows = stream_sample(count, spec, csv_path, weight_column, seed, chunk_rows, builder)
+    if builder is not None:
+        # The loader writes the same store under this lock; whoever comes second finds it done
+        with data._demographics_lock:
+            if DemographicStore.open(store_dir, signature) is None:
+                try:
+                    builder.write(csv_path, store_dir, signature, chunk_rows)
+                except OSError as e:
+                    logger.warning(f"Could not write demographics store {store_dir}: {e}")
+    
+    return [
+        SampledPerson(int(row_id), person, render_statistical_data(person))
+        for row_id, person in zip(row_ids, rows.to_dict('records'))
+    ]
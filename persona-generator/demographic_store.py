@@ -0,0 +1,245 @@
+"""
+Compact, memory-mapped column store for the demographics data.
+
+Numeric columns are stored as one .npy file each (integers downcast to the
+smallest type that fits) and opened with mmap_mode="r", so every Streamlit
+server and worker process on the machine shares the same page-cache pages.
+Text columns (kanton, ausbildung, beruf, sprachgebiet, ...) are stored as
+small-int codes plus a sorted dictionary in meta.json; code -1 means missing.
+Opening a store reads meta.json only; each column is mapped on first use, so
+a process that only filters touches the filter columns and nothing else.
+
+Directory layout:
+    meta.json        version, CSV signature, rows, columns (+ dictionaries)
+    c0000.npy ...    one array per column, values or dictionary codes
+"""
+import os
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout changes so stores written by older versions are rebuilt
+STORE_VERSION = 2
+
+
+def _smallest_int_dtype(low: int, high: int) -> np.dtype:
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def encode_text(values) -> Tuple[np.ndarray, List[str]]:
+    """
+    Dictionary-encode a text column.
+    
+    Args:
+        values: Array-like of strings (other values are converted with str), NaN/None for missing
+    
+    Returns:
+        (codes, dictionary) with the dictionary sorted and code -1 for missing values
+    """
+    values = np.asarray(values, dtype=object)
+    present = ~pd.isna(values)
+    text = np.full(len(values), None, dtype=object)
+    text[present] = [str(v) for v in values[present]]
+    codes, uniques = pd.factorize(text, sort=True, use_na_sentinel=True)
+    return codes.astype(_smallest_int_dtype(-1, len(uniques))), [str(u) for u in uniques]
+
+
+class DemographicStore:
+    """Columns of the demographics table as NumPy arrays; text columns as codes + dictionary."""
+    
+    def __init__(
+        self,
+        columns: List[str],
+        arrays: Dict[str, np.ndarray],
+        dictionaries: Dict[str, List[str]],
+        files: Optional[Dict[str, Path]] = None,
+        rows: Optional[int] = None
+    ):
+        self.columns = list(columns)
+        self.arrays = dict(arrays)
+        self.dictionaries = dictionaries
+        # Columns not mapped yet: name -> .npy file
+        self._files = dict(files or {})
+        self._lock = threading.Lock()
+        self.rows = rows if rows is not None else (len(arrays[columns[0]]) if columns else 0)
+        self._code_lookup = {name: {value: code for code, value in enumerate(values)} for name, values in dictionaries.items()}
+    
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "DemographicStore":
+        """Encode a parsed frame: integers downcast, text dictionary-encoded."""
+        arrays = {}
+        dictionaries = {}
+        for name in df.columns:
+            series = df[name]
+            if pd.api.types.is_bool_dtype(series.dtype):
+                arrays[name] = series.to_numpy(dtype=np.int8)
+            elif pd.api.types.is_integer_dtype(series.dtype):
+                values = series.to_numpy()
+                low, high = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+                arrays[name] = values.astype(_smallest_int_dtype(low, high))
+            elif pd.api.types.is_numeric_dtype(series.dtype):
+                arrays[name] = series.to_numpy(dtype=np.float64)
+            else:
+                arrays[name], dictionaries[name] = encode_text(series.to_numpy(dtype=object))
+        for array in arrays.values():
+            array.flags.writeable = False
+        return cls(list(df.columns), arrays, dictionaries)
+    
+    def save(self, directory: Path, signature: Tuple[int, int]):
+        """
+        Write the store to directory, meta.json last so half-written stores are never opened.
+        
+        Args:
+            directory: Target directory (created if missing)
+            signature: (mtime_ns, size) of the source CSV, checked by open()
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for position, name in enumerate(self.columns):
+            _save_array(directory / column_file(position), self.column(name))
+        write_meta(directory, signature, self.rows, self.columns, self.dictionaries)
+    
+    @classmethod
+    def open(cls, directory: Path, signature: Tuple[int, int]) -> Optional["DemographicStore"]:
+        """
+        Memory-map a store written by save().
+        
+        Returns:
+            The store, or None if it is missing, stale (other CSV signature) or unreadable
+        """
+        meta_path = Path(directory) / "meta.json"
+        if not meta_path.exists():
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("version") != STORE_VERSION or tuple(meta.get("signature", ())) != tuple(signature):
+                return None
+            
+            files = {}
+            dictionaries = {}
+            for column in meta["columns"]:
+                files[column["name"]] = Path(directory) / column["file"]
+                if "dictionary" in column:
+                    dictionaries[column["name"]] = column["dictionary"]
+            if not all(path.exists() for path in files.values()):
+                return None
+            return cls([column["name"] for column in meta["columns"]], {}, dictionaries, files=files, rows=meta["rows"])
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable demographics store {directory}: {e}")
+            return None
+    
+    def is_text(self, name: str) -> bool:
+        return name in self.dictionaries
+    
+    def column(self, name: str) -> np.ndarray:
+        """Values of a numeric column, or the codes of a text column (mapped on first use)."""
+        array = self.arrays.get(name)
+        if array is not None:
+            return array
+        with self._lock:
+            if name not in self.arrays:
+                mapped = np.load(self._files[name], mmap_mode="r", allow_pickle=False)
+                if len(mapped) != self.rows:
+                    raise ValueError(f"{self._files[name]} has {len(mapped)} rows, expected {self.rows}")
+                # Plain ndarray view of the mapping; pandas does not expect the memmap subclass
+                self.arrays[name] = mapped.view(np.ndarray)
+            return self.arrays[name]
+    
+    @property
+    def mapped_columns(self) -> List[str]:
+        """Columns read or mapped so far, in column order."""
+        return [name for name in self.columns if name in self.arrays]
+    
+    def dictionary(self, name: str) -> List[str]:
+        """Sorted distinct values of a text column (index = code)."""
+        return self.dictionaries[name]
+    
+    def code(self, name: str, value) -> int:
+        """Code of a text value, -1 if it never occurs."""
+        return self._code_lookup[name].get(str(value), -1)
+    
+    @property
+    def nbytes(self) -> int:
+        return sum(self.column(name).nbytes for name in self.columns)
+    
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Wrap the arrays in a DataFrame without copying the numeric columns.
+        
+        Text columns become categoricals over the dictionary, so the frame holds
+        codes instead of one Python string per cell.
+        """
+        data = {}
+        for name in self.columns:
+            if name in self.dictionaries:
+                data[name] = pd.Categorical.from_codes(self.column(name), categories=self.dictionaries[name])
+            else:
+                data[name] = self.column(name)
+        return pd.DataFrame(data, copy=False)
+    
+    def take(self, row_ids) -> pd.DataFrame:
+        """
+        All columns of the given rows, in the given order, indexed by row id.
+        
+        Only the selected values are read from the mapped files, so fetching a
+        few persons does not touch the other rows of the wide columns.
+        """
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        data = {}
+        for name in self.columns:
+            values = self.column(name)[row_ids]
+            if name in self.dictionaries:
+                data[name] = pd.Categorical.from_codes(values, categories=self.dictionaries[name])
+            else:
+                data[name] = values
+        return pd.DataFrame(data, index=pd.Index(row_ids))
+
+
+def column_file(position: int) -> str:
+    """File name of the column at this position."""
+    return f"c{position:04d}.npy"
+
+
+def write_meta(directory: Path, signature: Tuple[int, int], rows: int, columns: List[str], dictionaries: Dict[str, List[str]]):
+    """
+    Write meta.json for column files already in place (see column_file), which makes the store visible to open().
+    
+    Args:
+        directory: Store directory
+        signature: (mtime_ns, size) of the source CSV
+        rows: Rows per column
+        columns: Column names in file order
+        dictionaries: Sorted dictionary per text column
+    """
+    entries = []
+    for position, name in enumerate(columns):
+        entry = {"name": name, "file": column_file(position)}
+        if name in dictionaries:
+            entry["dictionary"] = dictionaries[name]
+        entries.append(entry)
+    
+    meta = {"version": STORE_VERSION, "signature": list(signature), "rows": rows, "columns": entries}
+    tmp_path = Path(directory) / f"meta.json.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, Path(directory) / "meta.json")
+
+
+def _save_array(path: Path, array: np.ndarray):
+    # Write next to the target and rename, so concurrent readers never see half a file
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.asarray(array), allow_pickle=False)
+    os.replace(tmp_path, path)
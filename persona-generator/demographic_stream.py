@@ -0,0 +1,277 @@
+"""
+Out-of-core reading of demographics CSVs larger than memory.
+
+The CSV is read in chunks of CHUNK_ROWS rows, so memory is bounded by one
+chunk plus what is kept from it:
+
+- WeightedReservoir draws N rows in one pass (A-Res, Efraimidis & Spirakis:
+  each row gets the key u^(1/w) and the N largest keys are kept), optionally
+  weighted by a column such as a census weight.
+- StoreBuilder writes the column store (see demographic_store) straight into
+  preallocated .npy files. The first pass (a sampling pass or a plain scan)
+  learns the row count and column types, a second pass encodes the values.
+  Later runs open the store and its bitmap index instead of the CSV.
+"""
+import os
+import shutil
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from demographic_store import DemographicStore, _smallest_int_dtype, column_file, write_meta
+
+logger = logging.getLogger(__name__)
+
+# Rows per chunk; a chunk of the 30-column demographics table takes a few hundred MB at most
+CHUNK_ROWS = 200_000
+
+# Rows copied per step when remapping text codes to the sorted dictionary
+REMAP_BLOCK_ROWS = 1_000_000
+
+
+def iter_chunks(csv_path: Path, chunk_rows: int = CHUNK_ROWS, dtype=None) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """
+    Read a CSV chunk by chunk.
+    
+    Yields:
+        (row id of the chunk's first row, chunk with a 0-based index)
+    """
+    start = 0
+    with pd.read_csv(csv_path, chunksize=chunk_rows, dtype=dtype) as reader:
+        for chunk in reader:
+            chunk.index = pd.RangeIndex(len(chunk))
+            yield start, chunk
+            start += len(chunk)
+
+
+class WeightedReservoir:
+    """Weighted sample without replacement of fixed size over a stream of rows (A-Res)."""
+    
+    def __init__(self, size: int, seed: Optional[int] = None):
+        self.size = size
+        self._rng = np.random.default_rng(seed)
+        self._keys = np.empty(0)
+        self._row_ids = np.empty(0, dtype=np.int64)
+        self._rows: Optional[pd.DataFrame] = None
+    
+    def offer(self, row_ids: np.ndarray, rows: pd.DataFrame, weights: Optional[np.ndarray] = None):
+        """
+        Offer rows to the sample.
+        
+        Args:
+            row_ids: Row id per offered row
+            rows: The offered rows (only kept rows are copied)
+            weights: Weight per row (default 1); rows with missing or non-positive weight are never drawn
+        """
+        if self.size <= 0 or len(row_ids) == 0:
+            return
+        # log(u^(1/w)) = log(u) / w, with u in (0, 1]
+        keys = np.log(1.0 - self._rng.random(len(row_ids)))
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)
+            valid = weights > 0  # False for NaN
+            keys[valid] /= weights[valid]
+            keys[~valid] = -np.inf
+        candidates = keys > -np.inf
+        if len(self._keys) == self.size:
+            candidates &= keys > self._keys.min()
+        if not candidates.any():
+            return
+        
+        keys = np.concatenate([self._keys, keys[candidates]])
+        row_ids = np.concatenate([self._row_ids, np.asarray(row_ids, dtype=np.int64)[candidates]])
+        offered = rows.iloc[np.flatnonzero(candidates)]
+        rows = offered if self._rows is None else pd.concat([self._rows, offered], ignore_index=True)
+        rows = rows.reset_index(drop=True)
+        if len(keys) > self.size:
+            keep = np.argpartition(-keys, self.size - 1)[:self.size]
+            keys, row_ids, rows = keys[keep], row_ids[keep], rows.iloc[keep].reset_index(drop=True)
+        self._keys, self._row_ids, self._rows = keys, row_ids, rows
+    
+    def sample(self) -> Tuple[np.ndarray, pd.DataFrame]:
+        """(row ids, rows) of the sample, largest key first, which is a random order."""
+        if self._rows is None:
+            return self._row_ids, pd.DataFrame()
+        order = np.argsort(-self._keys, kind="stable")
+        return self._row_ids[order], self._rows.iloc[order].reset_index(drop=True)
+
+
+def _chunk_kind(series: pd.Series) -> Optional[str]:
+    if series.isna().all():
+        return None  # only missing values, fits any column type
+    if pd.api.types.is_bool_dtype(series.dtype) or pd.api.types.is_integer_dtype(series.dtype):
+        return "int"
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return "float"
+    return "text"
+
+
+class StoreBuilder:
+    """Build a DemographicStore from a CSV with bounded memory (see module docstring)."""
+    
+    def __init__(self):
+        self.rows = 0
+        self.columns: Optional[List[str]] = None
+        # column -> "int", "float" or "text"; missing while a column had no values yet
+        self._kinds: Dict[str, str] = {}
+        self._ranges: Dict[str, Tuple[int, int]] = {}
+        self._missing = set()
+    
+    def observe(self, chunk: pd.DataFrame):
+        """First pass: count rows and learn column types and integer ranges."""
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+        self.rows += len(chunk)
+        for name in self.columns:
+            if chunk[name].hasnans:
+                self._missing.add(name)
+            kind = _chunk_kind(chunk[name])
+            if kind is None:
+                continue
+            previous = self._kinds.get(name)
+            if previous == "text" or kind == "text":
+                self._kinds[name] = "text"
+            elif previous == "float" or kind == "float":
+                self._kinds[name] = "float"
+            else:
+                self._kinds[name] = "int"
+                values = chunk[name].to_numpy(dtype=np.int64)
+                low, high = self._ranges.get(name, (int(values.min()), int(values.max())))
+                self._ranges[name] = (min(low, int(values.min())), max(high, int(values.max())))
+    
+    def write(self, csv_path: Path, directory: Path, signature: Tuple[int, int], chunk_rows: int = CHUNK_ROWS) -> DemographicStore:
+        """
+        Second pass: encode every column into directory and publish the store.
+        
+        Text columns are read as strings, so numbers in text columns keep their
+        spelling as in a full parse. Codes are written in first-seen order and
+        remapped to the sorted dictionary afterwards, block by block.
+        
+        Raises:
+            ValueError: The CSV changed between the passes
+        """
+        directory = Path(directory)
+        # Built next to the target and swapped in, so other processes never open a partial store;
+        # every build gets its own work directory, also within one process
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        work = Path(tempfile.mkdtemp(prefix=f"{directory.name}.", suffix=".tmp", dir=directory.parent))
+        try:
+            self._write_columns(csv_path, work, signature, chunk_rows)
+        except BaseException:
+            shutil.rmtree(work, ignore_errors=True)
+            raise
+        if directory.exists():
+            shutil.rmtree(directory)
+        os.replace(work, directory)
+        return DemographicStore.open(directory, signature)
+    
+    def _write_columns(self, csv_path: Path, directory: Path, signature: Tuple[int, int], chunk_rows: int):
+        columns = self.columns or []
+        kinds = {name: self._kinds.get(name, "float") for name in columns}
+        for name in self._missing:
+            if kinds[name] == "int":
+                kinds[name] = "float"  # integers with gaps are parsed as floats
+        outputs = {}
+        for position, name in enumerate(columns):
+            if kinds[name] == "text":
+                dtype, file_name = np.int32, f"{column_file(position)}.codes.tmp"
+            elif kinds[name] == "int":
+                dtype, file_name = _smallest_int_dtype(*self._ranges[name]), column_file(position)
+            else:
+                dtype, file_name = np.float64, column_file(position)
+            outputs[name] = np.lib.format.open_memmap(directory / file_name, mode="w+", dtype=dtype, shape=(self.rows,))
+        
+        text_columns = {name: str for name in columns if kinds[name] == "text"}
+        seen: Dict[str, Dict[str, int]] = {name: {} for name in text_columns}
+        rows = 0
+        for start, chunk in iter_chunks(csv_path, chunk_rows, dtype=text_columns or None):
+            end = start + len(chunk)
+            if end > self.rows:
+                raise ValueError(f"{csv_path} changed while building the store")
+            for name in columns:
+                series = chunk[name]
+                if kinds[name] == "text":
+                    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+                    lookup = np.array([seen[name].setdefault(str(value), len(seen[name])) for value in uniques] + [-1], dtype=np.int32)
+                    outputs[name][start:end] = lookup[codes]
+                elif kinds[name] == "int":
+                    outputs[name][start:end] = series.to_numpy(dtype=np.int64)
+                else:
+                    outputs[name][start:end] = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            rows = end
+        if rows != self.rows:
+            raise ValueError(f"{csv_path} changed while building the store")
+        
+        dictionaries = {}
+        for position, name in enumerate(columns):
+            if kinds[name] == "text":
+                dictionaries[name] = self._remap_codes(directory, position, outputs[name], seen[name])
+            outputs[name].flush()
+        del outputs
+        write_meta(directory, signature, self.rows, columns, dictionaries)
+    
+    def _remap_codes(self, directory: Path, position: int, codes: np.ndarray, seen: Dict[str, int]) -> List[str]:
+        dictionary = sorted(seen)
+        remap = np.full(len(seen) + 1, -1, dtype=np.int64)  # last entry: missing
+        for code, value in enumerate(dictionary):
+            remap[seen[value]] = code
+        final = np.lib.format.open_memmap(
+            directory / column_file(position), mode="w+", dtype=_smallest_int_dtype(-1, len(dictionary)), shape=(self.rows,)
+        )
+        for start in range(0, self.rows, REMAP_BLOCK_ROWS):
+            final[start:start + REMAP_BLOCK_ROWS] = remap[codes[start:start + REMAP_BLOCK_ROWS]]
+        final.flush()
+        os.remove(codes.filename)
+        return dictionary
+
+
+def build_store(csv_path: Path, directory: Path, signature: Tuple[int, int], chunk_rows: int = CHUNK_ROWS) -> DemographicStore:
+    """Scan and encode a CSV of any size into a column store (two chunked passes)."""
+    builder = StoreBuilder()
+    for _, chunk in iter_chunks(csv_path, chunk_rows):
+        builder.observe(chunk)
+    logger.info(f"Writing demographics store for {builder.rows:,} rows of {csv_path} to {directory}")
+    return builder.write(csv_path, directory, signature, chunk_rows)
+
+
+def stream_sample(
+    count: int,
+    spec,
+    csv_path: Path,
+    weight_column: Optional[str] = None,
+    seed: Optional[int] = None,
+    chunk_rows: int = CHUNK_ROWS,
+    builder: Optional[StoreBuilder] = None
+) -> Tuple[np.ndarray, pd.DataFrame]:
+    """
+    Draw up to count rows matching a FilterSpec in one chunked pass.
+    
+    Args:
+        count: Rows to draw (fewer if fewer rows match)
+        spec: FilterSpec applied to every chunk
+        csv_path: CSV file
+        weight_column: Column with the sampling weight per row (default: uniform)
+        seed: Seed for a reproducible draw
+        chunk_rows: Rows per chunk
+        builder: StoreBuilder that observes the same pass, for writing the store afterwards
+    
+    Returns:
+        (row ids, rows) in random order
+    
+    Raises:
+        KeyError: weight_column is not a column of the CSV
+    """
+    reservoir = WeightedReservoir(count, seed)
+    for start, chunk in iter_chunks(csv_path, chunk_rows):
+        if builder is not None:
+            builder.observe(chunk)
+        if weight_column is not None and weight_column not in chunk.columns:
+            raise KeyError(f"Weight column {weight_column!r} not in {csv_path}")
+        matches = spec.apply(chunk)
+        weights = matches[weight_column].to_numpy(dtype=np.float64, na_value=np.nan) if weight_column else None
+        reservoir.offer(start + matches.index.to_numpy(), matches, weights)
+    return reservoir.sample()
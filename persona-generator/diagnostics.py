@@ -0,0 +1,130 @@
+"""
+Runtime diagnostics for the Streamlit app: cache hit rates and LLM saturation.
+"""
+import time
+import threading
+from typing import Optional, Dict, Any
+
+import streamlit as st
+
+# Caches shown in the panel, in display order
+CACHE_NAMES = ("data", "prompts", "completions", "batch_files")
+
+# Seconds between live refreshes of the panel
+REFRESH_SECONDS = 2
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters per named cache."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+    
+    def record(self, name: str, hit: bool):
+        with self._lock:
+            counts = self._counts.setdefault(name, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Dict cache name -> hits, misses and hit_rate (None before the first lookup)."""
+        with self._lock:
+            result = {}
+            for name, counts in self._counts.items():
+                lookups = counts["hits"] + counts["misses"]
+                result[name] = {**counts, "hit_rate": counts["hits"] / lookups if lookups else None}
+            return result
+    
+    def reset(self):
+        with self._lock:
+            self._counts = {}
+
+
+cache_stats = CacheStats()
+
+
+def collect_diagnostics(render_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Gather the numbers shown in the diagnostics panel.
+    
+    Args:
+        render_seconds: Duration of the current Streamlit rerun, if known
+    
+    Returns:
+        Dict with render_seconds, caches, llm (in_flight, queued, coalesced_in_flight,
+        concurrency_limit, available_tokens, tokens_per_minute) and p95_latency
+    """
+    from llm import get_rate_limiter, single_flight
+    from llm_cache import get_default_cache
+    from llm_metrics import metrics_registry
+    
+    caches = cache_stats.snapshot()
+    completion_cache = get_default_cache()
+    if completion_cache is not None:
+        lookups = completion_cache.hits + completion_cache.misses
+        caches["completions"] = {
+            "hits": completion_cache.hits,
+            "misses": completion_cache.misses,
+            "hit_rate": completion_cache.hit_rate if lookups else None,
+        }
+    
+    limiter = get_rate_limiter()
+    return {
+        "render_seconds": render_seconds,
+        "caches": {name: caches.get(name) for name in CACHE_NAMES},
+        "llm": {
+            "in_flight": limiter.in_flight,
+            "queued": limiter.waiting,
+            "coalesced_in_flight": single_flight.in_flight,
+            "concurrency_limit": limiter.concurrency_limit,
+            "available_tokens": limiter.available_tokens,
+            "tokens_per_minute": limiter.tokens_per_minute,
+        },
+        "p95_latency": metrics_registry.latency_quantile(0.95),
+    }
+
+
+def show_diagnostics_panel(render_started: float):
+    """
+    Render the diagnostics panel into the current container (e.g. the sidebar).
+    
+    The LLM and cache numbers refresh every REFRESH_SECONDS without rerunning
+    the page; the render time is the one of the last full rerun.
+    
+    Args:
+        render_started: time.perf_counter() at the start of the rerun
+    """
+    _live_panel(time.perf_counter() - render_started)
+
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def _live_panel(render_seconds: float):
+    diagnostics = collect_diagnostics(render_seconds)
+    llm = diagnostics["llm"]
+    
+    st.markdown("### 🩺 Diagnose")
+    col_render, col_p95 = st.columns(2)
+    with col_render:
+        st.metric("Rerun", f"{diagnostics['render_seconds']:.2f}s")
+    with col_p95:
+        p95 = diagnostics["p95_latency"]
+        st.metric("LLM p95", f"{p95:.1f}s" if p95 is not None else "–")
+    
+    col_active, col_queued = st.columns(2)
+    with col_active:
+        st.metric("LLM aktiv", f"{llm['in_flight']}/{llm['concurrency_limit']}")
+    with col_queued:
+        st.metric("LLM wartend", llm["queued"])
+    
+    token_share = max(0.0, llm["available_tokens"]) / llm["tokens_per_minute"]
+    st.progress(min(1.0, token_share), text=f"Token-Budget: {llm['available_tokens']:,.0f} / {llm['tokens_per_minute']:,}")
+    
+    cache_labels = {"data": "Daten", "prompts": "Prompts", "completions": "Completions", "batch_files": "Batch-Dateien"}
+    lines = []
+    for name, label in cache_labels.items():
+        stats = diagnostics["caches"][name]
+        if stats is None or stats["hit_rate"] is None:
+            lines.append(f"- {label}: –")
+        else:
+            lines.append(f"- {label}: {stats['hit_rate']:.0%} ({stats['hits']}/{stats['hits'] + stats['misses']})")
+    st.markdown("**Cache-Trefferquote**\n" + "\n".join(lines))
@@ -0,0 +1,231 @@
+"""
+Declarative filters over the demographics data.
+
+A FilterSpec is a conjunction of predicates on columns:
+
+    Range("alter", 26, 35)                 26 <= alter <= 35 (bounds optional, inclusive by default)
+    In("kanton", ("ZH", "BE"))             kanton is one of the values
+    Eq("weiblich", 1)                      weiblich == 1
+
+The sidebar filters of the pages (alter_range, geschlecht, bruttojahr_range,
+kanton, ...) are translated by spec_from_sidebar; the bucket boundaries live
+only in SIDEBAR_BUCKETS. A spec runs against a pandas frame (FilterSpec.apply)
+or is compiled into a FilterPlan over the bitmap index and column store (see
+demographic_index), which orders the predicates by estimated selectivity.
+
+Usage:
+    python filter_spec.py "alter>=30" "alter<=45" "kanton in ZH,BE" "weiblich=1"
+"""
+import math
+import argparse
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Range:
+    """low <= column <= high; either bound may be None, strict with *_inclusive=False."""
+    column: str
+    low: Optional[float] = None
+    high: Optional[float] = None
+    low_inclusive: bool = True
+    high_inclusive: bool = True
+    
+    def evaluate(self, values) -> Any:
+        mask = np.ones(len(values), dtype=bool)
+        if self.low is not None:
+            mask &= (values >= self.low) if self.low_inclusive else (values > self.low)
+        if self.high is not None:
+            mask &= (values <= self.high) if self.high_inclusive else (values < self.high)
+        return np.asarray(mask, dtype=bool)
+    
+    def describe(self) -> str:
+        parts = []
+        if self.low is not None:
+            parts.append(f"{self.column} {'>=' if self.low_inclusive else '>'} {self.low:g}")
+        if self.high is not None:
+            parts.append(f"{self.column} {'<=' if self.high_inclusive else '<'} {self.high:g}")
+        return " and ".join(parts) or f"{self.column} (any)"
+
+
+@dataclass(frozen=True)
+class In:
+    """column is one of values (a tuple, so specs stay hashable)."""
+    column: str
+    values: Tuple[Any, ...]
+    
+    def evaluate(self, values) -> Any:
+        if isinstance(values, pd.Series):
+            return values.isin(self.values).to_numpy(dtype=bool)
+        if values.dtype.kind in "iuf":
+            candidates = [v for v in self.values if _is_number(v)]
+        else:
+            candidates = list(self.values)
+        return np.isin(values, candidates) if candidates else np.zeros(len(values), dtype=bool)
+    
+    def describe(self) -> str:
+        return f"{self.column} in ({', '.join(map(str, self.values))})"
+
+
+@dataclass(frozen=True)
+class Eq:
+    """column == value."""
+    column: str
+    value: Any
+    
+    def evaluate(self, values) -> Any:
+        if not isinstance(values, pd.Series) and values.dtype.kind in "iuf" and not _is_number(self.value):
+            return np.zeros(len(values), dtype=bool)
+        return np.asarray(values == self.value, dtype=bool)
+    
+    def describe(self) -> str:
+        return f"{self.column} = {self.value}"
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, np.number))
+
+
+# Sidebar bucket filters: filter key -> {label: predicate}
+SIDEBAR_BUCKETS: Dict[str, Dict[str, Any]] = {
+    'alter_range': {
+        "18-25": Range('alter', 18, 25),
+        "26-35": Range('alter', 26, 35),
+        "36-45": Range('alter', 36, 45),
+        "46-65": Range('alter', 46, 65),
+        "65+": Range('alter', low=65, low_inclusive=False),
+    },
+    'geschlecht': {
+        "Männlich": Eq('weiblich', 0),
+        "Weiblich": Eq('weiblich', 1),
+    },
+    'bruttojahr_range': {
+        "< 60k": Range('bruttojahr', high=60000, high_inclusive=False),
+        "60k-100k": Range('bruttojahr', 60000, 100000),
+        "> 100k": Range('bruttojahr', low=100000, low_inclusive=False),
+    },
+}
+
+# Sidebar keys that are not filters of their own
+IGNORED_SIDEBAR_KEYS = ('alter_min', 'alter_max')
+
+
+class FilterSpec:
+    """Conjunction of predicates; equal specs (in any order) compare and hash equal."""
+    
+    def __init__(self, predicates=()):
+        self.predicates: Tuple[Any, ...] = tuple(dict.fromkeys(predicates))
+    
+    def __eq__(self, other):
+        return isinstance(other, FilterSpec) and set(self.predicates) == set(other.predicates)
+    
+    def __hash__(self):
+        return hash(frozenset(self.predicates))
+    
+    def __len__(self):
+        return len(self.predicates)
+    
+    def __repr__(self):
+        return f"FilterSpec({' and '.join(p.describe() for p in self.predicates) or 'all rows'})"
+    
+    @property
+    def columns(self) -> List[str]:
+        return list(dict.fromkeys(p.column for p in self.predicates))
+    
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Rows of a pandas frame matching all predicates.
+        
+        Predicates on columns the frame does not have are skipped, as the
+        sidebar filters always did.
+        """
+        mask = None
+        for predicate in self.predicates:
+            if predicate.column not in df.columns:
+                continue
+            matches = predicate.evaluate(df[predicate.column])
+            mask = matches if mask is None else mask & matches
+        return df if mask is None else df[mask]
+
+
+def spec_from_sidebar(csv_filters: Dict[str, Any]) -> FilterSpec:
+    """
+    Translate the sidebar filter dict into a FilterSpec.
+    
+    None and "Alle" mean no filter, unknown bucket labels are ignored and any
+    other key is an equality filter on the column of that name.
+    """
+    predicates = []
+    for key, value in csv_filters.items():
+        if value is None or value == "Alle" or key in IGNORED_SIDEBAR_KEYS:
+            continue
+        if key in SIDEBAR_BUCKETS:
+            predicate = SIDEBAR_BUCKETS[key].get(value)
+            if predicate is not None:
+                predicates.append(predicate)
+        else:
+            predicates.append(Eq(key, value))
+    return FilterSpec(predicates)
+
+
+def spec_from_params(params: Dict[str, Any]) -> FilterSpec:
+    """Equality on every column of params with a value other than None."""
+    return FilterSpec(Eq(key, value) for key, value in params.items() if value is not None)
+
+
+def parse_condition(condition: str):
+    """
+    Parse one command-line condition into a predicate.
+    
+    Forms: "col=value", "col in a,b,c", "col>=x", "col>x", "col<=x", "col<x".
+    Values that look like numbers are parsed as numbers.
+    """
+    text = condition.strip()
+    if " in " in text:
+        column, values = text.split(" in ", 1)
+        return In(column.strip(), tuple(_parse_value(v) for v in values.split(",")))
+    for operator in (">=", "<=", ">", "<", "="):
+        if operator in text:
+            column, value = (part.strip() for part in text.split(operator, 1))
+            value = _parse_value(value)
+            if operator == "=":
+                return Eq(column, value)
+            if operator in (">=", ">"):
+                return Range(column, low=value, low_inclusive=operator == ">=")
+            return Range(column, high=value, high_inclusive=operator == "<=")
+    raise ValueError(f"Cannot parse filter condition {condition!r}")
+
+
+def _parse_value(text: str):
+    text = text.strip()
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    return int(number) if number.is_integer() and "." not in text else number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count and explain a filter over the demographics data")
+    parser.add_argument("conditions", nargs="*", help='e.g. "alter>=30" "kanton in ZH,BE" "weiblich=1"')
+    parser.add_argument("--csv", help="Demographics CSV (default: DEMOGRAPHIE_CSV or datax.csv)")
+    args = parser.parse_args()
+    
+    # The planner checks predicate types against the filter_spec module, not __main__
+    from data import load_demographic_index
+    from filter_spec import FilterSpec as Spec, parse_condition as parse
+    
+    index = load_demographic_index(args.csv)
+    plan = index.plan(Spec(parse(c) for c in args.conditions))
+    for line in plan.explain():
+        print(line)
+    matches = len(plan.run())
+    share = matches / index.rows if index.rows else math.nan
+    print(f"{matches:,} of {index.rows:,} persons match ({share:.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,25 @@
 Generic LLM utility for Swiss AI Platform API with rate limiting and error handling.
 """
 import os
+import re
+import random
+import email.utils
+import importlib.util
+import inspect
+import asyncio
 import time
 import logging
-from typing import Optional, Iterator
+import threading
+from typing import Optional, Iterator, AsyncIterator, Callable, List, Dict, Any, Tuple
 from dataclasses import dataclass
+import httpx
 import openai
 from dotenv import load_dotenv
+from llm_cache import CompletionCache, get_default_cache, make_cache_key
+from llm_cassette import REPLAY, AsyncCassetteOpenAI, Cassette, CassetteOpenAI, get_default_cassette
+from llm_tokens import TokenEstimate, token_estimator
+from llm_metrics import RequestMetrics, ensure_metrics_server, metrics_registry
+import tracing
 
 # Load environment variables from .env file
 load_dotenv()
@@ -21,62 +34,1181 @@ class RateLimitInfo:
     """Information about current rate limits from response headers."""
     remaining_tokens: Optional[int] = None
     reset_tokens_time: Optional[str] = None
+    
+    @property
+    def reset_tokens_seconds(self) -> Optional[float]:
+        """The token reset time converted to seconds (None if unknown)."""
+        return parse_reset_time(self.reset_tokens_time)
 
 
-class SwissAIClient:
+def parse_reset_time(value: Optional[str]) -> Optional[float]:
     """
-    A wrapper client for Swiss AI Platform API with built-in rate limiting and error handling.
+    Parse a rate limit reset value into seconds.
     
-    Rate limits:
-    - 5 requests per second
-    - 100,000 tokens per minute
+    Accepts plain seconds ("12", "0.5") as well as duration strings such as
+    "1m30s", "6s" or "250ms".
+    
+    Args:
+        value: Raw header value
+        
+    Returns:
+        Seconds until reset, or None if the value cannot be parsed
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    
+    matches = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not matches or ''.join(number + unit for number, unit in matches) != value:
+        return None
+    factors = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+    return sum(float(number) * factors[unit] for number, unit in matches)
+
+
+class RateLimiter:
+    """
+    Thread-safe token-bucket limiter enforcing both request and token budgets.
+    
+    Two buckets are refilled continuously: one for requests (requests_per_second)
+    and one for LLM tokens (tokens_per_minute). A request is admitted only when
+    both buckets can cover it and the number of requests in flight is below the
+    current concurrency limit. Token costs are reserved up front from an estimate
+    and reconciled once the actual usage is known.
+    
+    The concurrency limit adapts to the X-Ratelimit-* headers reported by the
+    server (see update_from_headers): it is halved when the remaining token budget
+    runs low and grows again by one while the budget is plentiful.
+    
+    Requests estimated above large_request_tokens (persona generation with its
+    large prompt and max_tokens=3000) must leave small_request_reserve of the
+    token budget untouched, so a burst of them cannot starve short chat requests.
     """
     
-    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
+    def __init__(
+        self,
+        requests_per_second: float = 5,
+        tokens_per_minute: int = 100_000,
+        request_burst: int = 1,
+        max_concurrency: int = 20,
+        min_concurrency: int = 1,
+        low_budget_ratio: float = 0.2,
+        high_budget_ratio: float = 0.5,
+        large_request_tokens: int = 2_000,
+        small_request_reserve_ratio: float = 0.1,
+        decrease_cooldown: float = 5.0
+    ):
         """
-        Initialize the Swiss AI client.
+        Initialize the limiter.
         
         Args:
-            api_key: API key for Swiss AI Platform. If None, reads from SWISS_AI_PLATFORM_API_KEY env var.
-            base_url: Base URL for the API. If None, uses default Swiss AI Platform URL.
+            requests_per_second: Sustained request rate
+            tokens_per_minute: Sustained token budget (prompt + completion)
+            request_burst: How many requests may be sent back to back. The default of 1
+                spaces requests evenly (0.2s apart at 5 req/s).
+            max_concurrency: Upper bound for requests in flight
+            min_concurrency: Lower bound the adaptive limit never goes below
+            low_budget_ratio: Remaining/total token ratio below which concurrency is halved
+            high_budget_ratio: Remaining/total token ratio above which concurrency grows
+            large_request_tokens: Estimated cost above which a request counts as large
+            small_request_reserve_ratio: Share of the token budget large requests must leave free
+            decrease_cooldown: Seconds after a halving of the concurrency limit during which
+                further low-budget responses do not halve it again, unless the server
+                reports its reset time (then that window is used)
+        """
+        self.requests_per_second = requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+        self.request_burst = request_burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.low_budget_ratio = low_budget_ratio
+        self.high_budget_ratio = high_budget_ratio
+        self.large_request_tokens = large_request_tokens
+        self.small_request_reserve = tokens_per_minute * small_request_reserve_ratio
+        self.decrease_cooldown = decrease_cooldown
+        
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._request_allowance = float(request_burst)
+        self._token_allowance = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._waiting = 0
+        self._paused_until = 0.0
+        self._decrease_until = 0.0
+        self.concurrency_limit = max_concurrency
+    
+    def _refill(self, now: float):
+        """Top up both buckets for the time elapsed since the last refill."""
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_allowance = min(
+            float(self.request_burst),
+            self._request_allowance + elapsed * self.requests_per_second
+        )
+        self._token_allowance = min(
+            float(self.tokens_per_minute),
+            self._token_allowance + elapsed * self.tokens_per_minute / 60.0
+        )
+    
+    def _reserved(self, estimated_tokens: int) -> float:
+        """Token amount actually reserved for a request of the estimated size."""
+        # A single request larger than the whole budget would never be admitted
+        return float(min(max(estimated_tokens, 0), self.tokens_per_minute))
+    
+    def _try_acquire(self, cost: float) -> float:
+        """
+        Admit a request if all budgets allow it. Must be called with the lock held.
+        
+        Returns:
+            0.0 if the request was admitted, otherwise the seconds to wait before retrying
+        """
+        now = time.monotonic()
+        self._refill(now)
+        
+        pause_wait = max(0.0, self._paused_until - now)
+        
+        request_wait = 0.0
+        if self._request_allowance < 1:
+            request_wait = (1 - self._request_allowance) / self.requests_per_second
+        
+        # Large requests also have to leave the small-request reserve in the bucket
+        needed = cost
+        if cost > self.large_request_tokens:
+            needed = min(cost + self.small_request_reserve, float(self.tokens_per_minute))
+        
+        token_wait = 0.0
+        if self._token_allowance < needed:
+            token_wait = (needed - self._token_allowance) * 60.0 / self.tokens_per_minute
+        
+        # Woken up by release() when a slot frees up
+        concurrency_wait = 1.0 if self._in_flight >= self.concurrency_limit else 0.0
+        
+        sleep_time = max(pause_wait, request_wait, token_wait, concurrency_wait)
+        if sleep_time == 0:
+            self._request_allowance -= 1
+            self._token_allowance -= cost
+            self._in_flight += 1
+        return sleep_time
+    
+    def acquire(self, estimated_tokens: int = 0) -> float:
+        """
+        Block until a request costing estimated_tokens may be sent.
+        
+        Every successful acquire() must be paired with a release().
+        
+        Args:
+            estimated_tokens: Expected prompt + completion tokens for the request
+            
+        Returns:
+            Seconds spent waiting for the limiter
+        """
+        cost = self._reserved(estimated_tokens)
+        start = time.monotonic()
+        queued = False
+        
+        with self._condition:
+            try:
+                while True:
+                    sleep_time = self._try_acquire(cost)
+                    if sleep_time == 0:
+                        return time.monotonic() - start
+                    
+                    if not queued:
+                        queued = True
+                        self._waiting += 1
+                    logger.debug(f"Rate limiting: sleeping for {sleep_time:.2f} seconds")
+                    self._condition.wait(timeout=min(sleep_time, 1.0))
+            finally:
+                if queued:
+                    self._waiting -= 1
+    
+    async def acquire_async(self, estimated_tokens: int = 0) -> float:
+        """
+        Asyncio variant of acquire() that waits without blocking the event loop.
+        
+        Args:
+            estimated_tokens: Expected prompt + completion tokens for the request
+            
+        Returns:
+            Seconds spent waiting for the limiter
+        """
+        cost = self._reserved(estimated_tokens)
+        start = time.monotonic()
+        queued = False
+        
+        try:
+            while True:
+                with self._lock:
+                    sleep_time = self._try_acquire(cost)
+                    if sleep_time > 0 and not queued:
+                        queued = True
+                        self._waiting += 1
+                if sleep_time == 0:
+                    return time.monotonic() - start
+                
+                # Released slots are not signalled to coroutines, so poll in short steps
+                logger.debug(f"Rate limiting: sleeping for {sleep_time:.2f} seconds")
+                await asyncio.sleep(min(sleep_time, 0.05))
+        finally:
+            if queued:
+                with self._lock:
+                    self._waiting -= 1
+    
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """
+        Correct the token bucket once the real usage of a request is known.
+        
+        Args:
+            estimated_tokens: The amount reserved in acquire()
+            actual_tokens: Tokens reported by the API (None keeps the estimate)
         """
+        if actual_tokens is None:
+            return
+        with self._condition:
+            self._refill(time.monotonic())
+            # May go negative: an underestimated request puts the bucket in debt
+            self._token_allowance = min(
+                float(self.tokens_per_minute),
+                self._token_allowance + self._reserved(estimated_tokens) - actual_tokens
+            )
+            self._condition.notify_all()
+    
+    def release(self, estimated_tokens: int = 0, actual_tokens: Optional[int] = None):
+        """
+        Mark a request acquired with acquire() as finished.
+        
+        Args:
+            estimated_tokens: The amount reserved in acquire()
+            actual_tokens: Tokens reported by the API (None keeps the estimate)
+        """
+        with self._condition:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._condition.notify_all()
+        self.reconcile(estimated_tokens, actual_tokens)
+    
+    def update_from_headers(self, info: RateLimitInfo, rate_limited: bool = False):
+        """
+        Adapt to the token budget reported by the server.
+        
+        The local token bucket is never allowed to exceed what the server says is
+        left, and the concurrency limit follows an additive-increase /
+        multiplicative-decrease rule based on the remaining budget ratio. The
+        limit is halved at most once per reset window (or decrease_cooldown), so
+        the responses of all requests in flight during one low-budget window
+        back off once instead of once each.
+        
+        Args:
+            info: Parsed X-Ratelimit-* headers of a response
+            rate_limited: True if the response was a 429; pauses until the reset time
+        """
+        remaining = info.remaining_tokens
+        reset_seconds = info.reset_tokens_seconds
+        
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            
+            if rate_limited:
+                self._decrease_concurrency(now, reset_seconds)
+                if reset_seconds:
+                    self._paused_until = max(self._paused_until, now + reset_seconds)
+            
+            if remaining is not None:
+                self._token_allowance = min(self._token_allowance, float(remaining))
+                
+                ratio = remaining / self.tokens_per_minute
+                if ratio < self.low_budget_ratio:
+                    if self._decrease_concurrency(now, reset_seconds):
+                        logger.info(
+                            f"Token budget low ({remaining} remaining), "
+                            f"concurrency limit lowered to {self.concurrency_limit}"
+                        )
+                elif ratio > self.high_budget_ratio and self.concurrency_limit < self.max_concurrency:
+                    self.concurrency_limit += 1
+            
+            self._condition.notify_all()
+    
+    def _decrease_concurrency(self, now: float, reset_seconds: Optional[float]) -> bool:
+        """Halve the concurrency limit unless it was halved in the current window. Lock must be held."""
+        if now < self._decrease_until:
+            return False
+        self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit // 2)
+        self._decrease_until = now + (reset_seconds or self.decrease_cooldown)
+        return True
+    
+    @property
+    def in_flight(self) -> int:
+        """Number of acquired requests that have not been released yet."""
+        with self._lock:
+            return self._in_flight
+    
+    @property
+    def waiting(self) -> int:
+        """Number of callers currently blocked in acquire() / acquire_async()."""
+        with self._lock:
+            return self._waiting
+    
+    @property
+    def available_tokens(self) -> float:
+        """Tokens currently available in the per-minute budget."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._token_allowance
+
+
+_shared_rate_limiter: Optional[RateLimiter] = None
+_shared_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Return the process-wide rate limiter shared by every SwissAIClient.
+    
+    Returns:
+        The shared RateLimiter instance (created on first use)
+    """
+    global _shared_rate_limiter
+    with _shared_rate_limiter_lock:
+        if _shared_rate_limiter is None:
+            _shared_rate_limiter = RateLimiter()
+        return _shared_rate_limiter
+
+
+def configure_rate_limiter(**settings) -> RateLimiter:
+    """
+    Replace the process-wide limiter, e.g. for other platform limits or load tests.
+    
+    Clients created afterwards use the new limiter; existing clients keep theirs.
+    
+    Args:
+        **settings: RateLimiter arguments (requests_per_second, tokens_per_minute, max_concurrency, ...)
+        
+    Returns:
+        The new shared RateLimiter
+    """
+    global _shared_rate_limiter
+    with _shared_rate_limiter_lock:
+        _shared_rate_limiter = RateLimiter(**settings)
+        return _shared_rate_limiter
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> int:
+    """
+    Estimate the total token cost (prompt + expected completion) of a chat request.
+    
+    Args:
+        messages: Chat messages that will be sent
+        max_tokens: Completion limit of the request
+        
+    Returns:
+        Estimated prompt + completion tokens
+    """
+    return token_estimator.estimate(messages, max_tokens).total
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """
+    Read the server's Retry-After hint from response headers.
+    
+    Supports retry-after-ms, Retry-After in seconds and Retry-After as an HTTP date.
+    
+    Args:
+        headers: Response headers (case-insensitive mapping)
+        
+    Returns:
+        Seconds to wait, or None if the server gave no usable hint
+    """
+    if not headers:
+        return None
+    
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms is not None:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000.0)
+        except ValueError:
+            pass
+    
+    retry_after = headers.get('retry-after')
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Retry configuration for failed completion requests.
+    
+    Rate limits (429), timeouts, connection errors and 5xx responses are retried
+    with exponential backoff and jitter. A Retry-After hint from the server takes
+    precedence over the computed backoff. All other errors (bad request,
+    authentication, ...) are fatal and raised immediately.
+    """
+    max_attempts: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    jitter: float = 0.5
+    respect_retry_after: bool = True
+    retryable_status_codes: Tuple[int, ...] = (408, 409, 429, 500, 502, 503, 504)
+    
+    def is_retryable(self, error: Exception) -> bool:
+        """Whether the error is transient and the request may be retried."""
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in self.retryable_status_codes
+        return False
+    
+    def get_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """
+        Compute the wait before the next attempt.
+        
+        Args:
+            error: The error raised by the failed attempt
+            attempt: Number of the attempt that failed (1-based)
+            
+        Returns:
+            Seconds to wait, or None if the request must not be retried
+        """
+        if attempt >= self.max_attempts or not self.is_retryable(error):
+            return None
+        
+        if self.respect_retry_after:
+            response = getattr(error, 'response', None)
+            retry_after = parse_retry_after(getattr(response, 'headers', None))
+            if retry_after is not None:
+                return retry_after
+        
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay + random.uniform(0, self.jitter * delay)
+
+
+class RetryMetrics:
+    """Thread-safe counters describing how often requests were retried."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        """Set all counters back to zero."""
+        with self._lock:
+            self.retries = 0
+            self.recovered = 0
+            self.gave_up = 0
+            self.fatal = 0
+            self.retries_by_error: Dict[str, int] = {}
+    
+    def record_retry(self, error: Exception):
+        """A failed attempt will be retried."""
+        with self._lock:
+            self.retries += 1
+            error_name = type(error).__name__
+            self.retries_by_error[error_name] = self.retries_by_error.get(error_name, 0) + 1
+    
+    def record_recovered(self):
+        """A request succeeded after at least one retry."""
+        with self._lock:
+            self.recovered += 1
+    
+    def record_failure(self, retryable: bool):
+        """A request failed for good (retries exhausted or a fatal error)."""
+        with self._lock:
+            if retryable:
+                self.gave_up += 1
+            else:
+                self.fatal += 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a copy of the current counters."""
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "recovered": self.recovered,
+                "gave_up": self.gave_up,
+                "fatal": self.fatal,
+                "retries_by_error": dict(self.retries_by_error)
+            }
+
+
+retry_metrics = RetryMetrics()
+
+
+@dataclass
+class HTTPPoolConfig:
+    """Connection pool settings for the shared HTTP clients."""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0
+    http2: Optional[bool] = None  # None: use HTTP/2 if the h2 package is installed
+    
+    def build_limits(self) -> httpx.Limits:
+        """httpx pool limits for this configuration."""
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+    
+    def use_http2(self) -> bool:
+        """Whether the clients should negotiate HTTP/2."""
+        if self.http2 is None:
+            return importlib.util.find_spec("h2") is not None
+        return self.http2
+
+
+_http_pool_config = HTTPPoolConfig()
+_http_clients: Dict[Tuple[str, str], httpx.Client] = {}
+_async_http_clients: Dict[Tuple[str, str, int], Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+_http_clients_lock = threading.Lock()
+
+
+def configure_http_pool(**settings):
+    """
+    Change the pool settings used for HTTP clients created from now on.
+    
+    Args:
+        **settings: Fields of HTTPPoolConfig (max_connections, max_keepalive_connections,
+            keepalive_expiry, http2)
+    """
+    global _http_pool_config
+    with _http_clients_lock:
+        _http_pool_config = HTTPPoolConfig(**{**_http_pool_config.__dict__, **settings})
+
+
+def get_http_client(api_key: str, base_url: str) -> httpx.Client:
+    """
+    Return the keep-alive HTTP client shared by all sync clients for (api_key, base_url).
+    
+    Reusing one client per endpoint keeps TCP/TLS connections open between requests
+    instead of paying a new handshake for every SwissAIClient.
+    
+    Args:
+        api_key: API key the connections are used with
+        base_url: API base URL
+        
+    Returns:
+        Pooled httpx.Client
+    """
+    key = (api_key, base_url)
+    with _http_clients_lock:
+        client = _http_clients.get(key)
+        if client is None or client.is_closed:
+            client = openai.DefaultHttpxClient(
+                limits=_http_pool_config.build_limits(),
+                http2=_http_pool_config.use_http2()
+            )
+            _http_clients[key] = client
+        return client
+
+
+def get_async_http_client(api_key: str, base_url: str) -> httpx.AsyncClient:
+    """
+    Return the keep-alive async HTTP client for (api_key, base_url) in the running event loop.
+    
+    Async connections belong to the event loop they were opened in, so one client is
+    kept per loop; clients of loops that have been closed are dropped. Synchronous
+    callers should use run_async() so that all their requests share one long-lived
+    loop and pool instead of a new one per asyncio.run().
+    
+    Args:
+        api_key: API key the connections are used with
+        base_url: API base URL
+        
+    Returns:
+        Pooled httpx.AsyncClient
+    """
+    loop = asyncio.get_running_loop()
+    key = (api_key, base_url, id(loop))
+    with _http_clients_lock:
+        # A closed loop can no longer run aclose(); its sockets went away with it
+        for stale_key in [k for k, (l, _) in _async_http_clients.items() if l.is_closed()]:
+            del _async_http_clients[stale_key]
+        
+        entry = _async_http_clients.get(key)
+        if entry is None or entry[0] is not loop or entry[1].is_closed:
+            client = openai.DefaultAsyncHttpxClient(
+                limits=_http_pool_config.build_limits(),
+                http2=_http_pool_config.use_http2()
+            )
+            entry = (loop, client)
+            _async_http_clients[key] = entry
+        return entry[1]
+
+
+def close_http_clients():
+    """Close all pooled HTTP clients, async ones in the event loop they belong to."""
+    with _http_clients_lock:
+        for client in _http_clients.values():
+            client.close()
+        _http_clients.clear()
+        async_clients = list(_async_http_clients.values())
+        _async_http_clients.clear()
+    
+    for loop, client in async_clients:
+        if loop.is_closed():
+            continue
+        if not loop.is_running():
+            loop.run_until_complete(client.aclose())
+            continue
+        future = asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        if _running_loop() is not loop:
+            future.result(timeout=10)
+
+
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    """The event loop running in this thread, None outside async code."""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the long-lived event loop used by run_async(), starting it on first use.
+    
+    The loop runs in a daemon thread for the lifetime of the process, so the async
+    HTTP pool opened in it keeps its connections from one call to the next.
+    """
+    global _background_loop
+    with _http_clients_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(target=_background_loop.run_forever, name="swiss-ai-async", daemon=True).start()
+        return _background_loop
+
+
+def run_async(coro):
+    """
+    Run a coroutine on the shared background event loop and wait for its result.
+    
+    Use this instead of asyncio.run() from synchronous code: asyncio.run() opens a new
+    loop and with it a new async connection pool every time, and closes the loop before
+    the pool can be closed. Context variables such as the current tracing span are
+    carried over into the coroutine.
+    
+    Args:
+        coro: Coroutine to run
+    
+    Returns:
+        The coroutine's result (its exception is re-raised)
+    """
+    loop = get_background_loop()
+    if _running_loop() is loop:
+        raise RuntimeError("run_async() cannot be called from the background loop itself; await the coroutine")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+class _Flight:
+    """A call in progress that other callers can wait for."""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls into a single execution.
+    
+    The first caller for a key runs the function; callers arriving with the same
+    key while it is still running wait and receive the same result (or exception).
+    Nothing is remembered once the call has finished - that is the cache's job.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self.coalesced = 0
+    
+    def do(self, key: str, fn):
+        """
+        Run fn() unless an identical call is already in flight, then share its outcome.
+        
+        Args:
+            key: Identity of the call
+            fn: Function without arguments performing the call
+            
+        Returns:
+            The result of fn() from whichever caller executed it
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+        
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+    
+    @property
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running."""
+        with self._lock:
+            return len(self._flights)
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight; calls are coalesced per event loop."""
+    
+    def __init__(self):
+        self._flights: Dict[Tuple[int, str], asyncio.Future] = {}
+        self.coalesced = 0
+    
+    async def do(self, key: str, coro_fn):
+        """
+        Await coro_fn() unless an identical call is already in flight on this loop.
+        
+        Args:
+            key: Identity of the call
+            coro_fn: Coroutine function without arguments performing the call
+            
+        Returns:
+            The result of the shared call
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        
+        future = self._flights.get(flight_key)
+        if future is not None and future.get_loop() is loop:
+            self.coalesced += 1
+            # shield: a cancelled follower must not cancel the shared call
+            return await asyncio.shield(future)
+        
+        future = loop.create_future()
+        self._flights[flight_key] = future
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieve the exception so an unobserved future does not log a warning
+            future.exception()
+            raise
+        finally:
+            del self._flights[flight_key]
+    
+    @property
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running."""
+        return len(self._flights)
+
+
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
+
+
+class ReleasingStream:
+    """
+    Iterator over a streamed response that holds a rate limiter slot.
+    
+    The slot is given back exactly once: when the stream is exhausted or fails,
+    when close() is called (also on leaving a with block), or at the latest when
+    the object is garbage collected. Callers that stop reading early should
+    close() the stream or use it as a context manager.
+    """
+    
+    def __init__(self, stream, observe: Callable[[Any], None], finish: Callable[[Optional[BaseException]], None]):
+        """
+        Args:
+            stream: The parsed response stream
+            observe: Called with every chunk before it is handed out
+            finish: Called once with the error (or None) when the stream is done
+        """
+        self._stream = stream
+        self._chunks = iter(stream)
+        self._observe = observe
+        self._finish = finish
+        self._lock = threading.Lock()
+        self.closed = False
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._done(None)
+            raise
+        except Exception as e:
+            self._done(e)
+            raise
+        self._observe(chunk)
+        return chunk
+    
+    def _done(self, error: Optional[BaseException]):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        self._finish(error)
+    
+    def close(self):
+        """Stop reading, close the HTTP response and release the limiter slot."""
+        if self.closed:
+            return
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._done(None)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def __del__(self):
+        self.close()
+
+
+async def aclose_stream(stream) -> None:
+    """Close an async response stream, whether its close is a coroutine or not."""
+    close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+    if close is not None:
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+
+
+DEFAULT_BASE_URL = "https://api.swisscom.com/layer/swiss-ai-weeks/apertus-70b/v1"
+DEFAULT_MODEL = "swiss-ai/Apertus-70B"
+
+
+class _BaseSwissAIClient:
+    """Configuration and request helpers shared by the sync and async clients."""
+    
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        cache: Optional[CompletionCache] = None,
+        cassette: Optional[Cassette] = None,
+        caller: str = "unknown"
+    ):
+        # Record/replay is opt-in (explicit cassette or SWISS_AI_CASSETTE)
+        self.cassette = cassette if cassette is not None else get_default_cassette()
+        
         self.api_key = api_key or os.getenv("SWISS_AI_PLATFORM_API_KEY")
+        if not self.api_key and self.cassette is not None and self.cassette.mode == REPLAY:
+            # Replaying never talks to the API
+            self.api_key = "cassette-replay"
         if not self.api_key:
             raise ValueError("API key not found. Set SWISS_AI_PLATFORM_API_KEY environment variable or pass api_key parameter.")
         
-        self.base_url = base_url or "https://api.swisscom.com/layer/swiss-ai-weeks/apertus-70b/v1"
-        self.model = "swiss-ai/Apertus-70B"
+        self.base_url = base_url or os.getenv("SWISS_AI_BASE_URL") or DEFAULT_BASE_URL
+        self.model = DEFAULT_MODEL
         
-        self.client = openai.OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url
-        )
+        # Rate limiting is shared across all clients in the process
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        # Completion cache is opt-in (explicit instance or SWISS_AI_COMPLETION_CACHE)
+        self.cache = cache if cache is not None else get_default_cache()
+        # Share one upstream call between identical concurrent deterministic requests
+        self.coalesce_requests = True
+        self.token_estimator = token_estimator
+        # Requests are recorded in the metrics registry under this caller tag
+        self.caller = caller
+        self.metrics = metrics_registry
+        ensure_metrics_server()
+    
+    def estimate_request_tokens(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        max_tokens: Optional[int] = None
+    ) -> TokenEstimate:
+        """
+        Estimate the token cost of a request before sending it.
         
-        # Rate limiting tracking
-        self.last_request_time = 0
-        self.min_request_interval = 0.2  # 5 requests per second = 0.2 seconds between requests
+        Args:
+            prompt: The user prompt
+            system_prompt: Optional system prompt
+            max_tokens: Completion limit the request would use
+            
+        Returns:
+            TokenEstimate with prompt and expected completion tokens
+            
+        Example:
+            client = SwissAIClient()
+            estimate = client.estimate_request_tokens(full_prompt, system_prompt, max_tokens=3000)
+            print(estimate.total)
+        """
+        _, estimate = self._build_request(prompt, system_prompt, 0.0, max_tokens, False, {})
+        return estimate
+    
+    def _start_metrics(self, stream: bool) -> RequestMetrics:
+        """Start measuring one logical request (all of its attempts)."""
+        return RequestMetrics(caller=self.caller, stream=stream)
+    
+    def _finish_metrics(self, request_metrics: RequestMetrics, error: Optional[BaseException] = None):
+        """Stop measuring a request and add it to the metrics registry."""
+        request_metrics.finish(error)
+        self.metrics.record(request_metrics)
+    
+    def _coalescable(self, params: Dict[str, Any]) -> bool:
+        """
+        Whether identical concurrent requests may share one upstream call.
         
-    def _wait_for_rate_limit(self):
-        """Ensure we don't exceed the rate limit of 5 requests per second."""
-        current_time = time.time()
-        time_since_last_request = current_time - self.last_request_time
+        Only deterministic requests (temperature 0 or an explicit seed) are
+        coalesced. Sampled requests such as persona generation at temperature
+        0.7 each get their own answer, even when their prompts are identical.
+        """
+        if not self.coalesce_requests:
+            return False
+        return params.get("temperature") == 0 or params.get("seed") is not None
+    
+    def _flight_key(self, params: Dict[str, Any]) -> str:
+        """Key under which identical in-flight requests are coalesced."""
+        return make_cache_key({**params, "base_url": self.base_url})
+    
+    def _cache_key(self, params: Dict[str, Any], bypass_cache: bool) -> Optional[str]:
+        """Cache key for a non-streaming request, or None if the cache is not used."""
+        if self.cache is None or bypass_cache or params.get("stream"):
+            return None
+        # The same model name can serve different weights on another endpoint
+        return make_cache_key({**params, "base_url": self.base_url})
+    
+    def _build_request(
+        self,
+        prompt: str,
+        system_prompt: Optional[str],
+        temperature: float,
+        max_tokens: Optional[int],
+        stream: bool,
+        kwargs: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], TokenEstimate]:
+        """
+        Build the chat completion parameters and their estimated token cost.
         
-        if time_since_last_request < self.min_request_interval:
-            sleep_time = self.min_request_interval - time_since_last_request
-            logger.debug(f"Rate limiting: sleeping for {sleep_time:.2f} seconds")
-            time.sleep(sleep_time)
+        Returns:
+            Tuple of (API call parameters, token estimate)
+        """
+        # Prepare messages
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
         
-        self.last_request_time = time.time()
+        # Prepare API call parameters
+        params = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": stream,
+            **kwargs
+        }
+        
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+        
+        return params, token_estimator.estimate(messages, max_tokens)
     
     def _extract_rate_limit_info(self, response) -> RateLimitInfo:
-        """Extract rate limit information from response headers."""
+        """Extract rate limit information from the headers of a raw HTTP response."""
         headers = getattr(response, 'headers', {}) or {}
         
+        remaining_tokens = headers.get('X-Ratelimit-Remaining-Tokens')
+        try:
+            remaining_tokens = int(float(remaining_tokens)) if remaining_tokens is not None else None
+        except ValueError:
+            remaining_tokens = None
+        
         return RateLimitInfo(
-            remaining_tokens=headers.get('X-Ratelimit-Remaining-Tokens'),
+            remaining_tokens=remaining_tokens,
             reset_tokens_time=headers.get('X-Ratelimit-Reset-Tokens')
         )
     
+    def _update_rate_limits(self, response, rate_limited: bool = False):
+        """Feed the rate limit headers of a raw response into the shared limiter."""
+        rate_limit_info = self._extract_rate_limit_info(response)
+        if rate_limit_info.remaining_tokens is not None:
+            logger.debug(f"Remaining tokens: {rate_limit_info.remaining_tokens}")
+        self.rate_limiter.update_from_headers(rate_limit_info, rate_limited=rate_limited)
+    
+    def _handle_response(
+        self,
+        raw_response,
+        params: Dict[str, Any],
+        estimate: TokenEstimate,
+        stream: bool,
+        request_metrics: RequestMetrics
+    ):
+        """
+        Parse a raw response and account for it in the limiter and token estimator.
+        
+        Returns:
+            The parsed stream (streaming) or the message content
+        """
+        response = raw_response.parse()
+        
+        if stream:
+            # Usage is not reported for streams; the estimate stays reserved
+            self._update_rate_limits(raw_response)
+            request_metrics.prompt_tokens = estimate.prompt_tokens
+            return response
+        
+        # Reconcile first: the reported remaining budget already includes this request
+        usage = getattr(response, 'usage', None)
+        self.rate_limiter.reconcile(estimate.total, getattr(usage, 'total_tokens', None))
+        self._update_rate_limits(raw_response)
+        if usage is not None:
+            self.token_estimator.observe(
+                estimate, params.get("max_tokens"),
+                getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None)
+            )
+        request_metrics.prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        request_metrics.completion_tokens = getattr(usage, 'completion_tokens', None)
+        request_metrics.finish_reason = getattr(response.choices[0], 'finish_reason', None)
+        return response.choices[0].message.content
+    
+    def _handle_error(self, error: Exception):
+        """Log a failed request and feed 429 headers into the limiter."""
+        if isinstance(error, openai.RateLimitError):
+            logger.error(f"Rate limit exceeded: {error}")
+            self._update_rate_limits(error.response, rate_limited=True)
+        elif isinstance(error, openai.APIError):
+            logger.error(f"API error: {error}")
+        else:
+            logger.error(f"Unexpected error: {error}")
+    
+    def _next_retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """
+        Decide whether a failed attempt is retried and record it in retry_metrics.
+        
+        Returns:
+            Seconds to wait before the next attempt, or None to give up
+        """
+        delay = self.retry_policy.get_delay(error, attempt)
+        if delay is None:
+            retry_metrics.record_failure(self.retry_policy.is_retryable(error))
+            return None
+        
+        retry_metrics.record_retry(error)
+        logger.warning(
+            f"Attempt {attempt}/{self.retry_policy.max_attempts} failed "
+            f"({type(error).__name__}), retrying in {delay:.1f}s"
+        )
+        return delay
+
+
+class SwissAIClient(_BaseSwissAIClient):
+    """
+    A wrapper client for Swiss AI Platform API with built-in rate limiting and error handling.
+    
+    Rate limits:
+    - 5 requests per second
+    - 100,000 tokens per minute
+    """
+    
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        cache: Optional[CompletionCache] = None,
+        cassette: Optional[Cassette] = None,
+        caller: str = "unknown"
+    ):
+        """
+        Initialize the Swiss AI client.
+        
+        Args:
+            api_key: API key for Swiss AI Platform. If None, reads from SWISS_AI_PLATFORM_API_KEY env var.
+            base_url: Base URL for the API. If None, uses SWISS_AI_BASE_URL or the default Swiss AI Platform URL.
+            rate_limiter: Limiter to use. If None, the process-wide shared limiter is used
+                so that all clients together respect the platform limits.
+            retry_policy: Retry behaviour for transient errors. If None, RetryPolicy() defaults apply.
+            cache: Completion cache for non-streaming requests. If None, the shared cache is
+                used when SWISS_AI_COMPLETION_CACHE is set, otherwise nothing is cached.
+            cassette: Cassette to record responses to or replay them from. If None, the
+                cassette configured by SWISS_AI_CASSETTE is used, otherwise the API is called.
+            caller: Tag (page or function) under which requests appear in the metrics
+        """
+        super().__init__(
+            api_key=api_key, base_url=base_url, rate_limiter=rate_limiter,
+            retry_policy=retry_policy, cache=cache, cassette=cassette, caller=caller
+        )
+        
+        if self.cassette is not None and self.cassette.mode == REPLAY:
+            self.client = CassetteOpenAI(self.cassette)
+            return
+        
+        # Retries are handled by complete() so that every attempt passes the rate limiter.
+        # The HTTP connection pool is shared by all clients for the same endpoint.
+        self.client = openai.OpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            max_retries=0,
+            http_client=get_http_client(self.api_key, self.base_url)
+        )
+        if self.cassette is not None:
+            self.client = CassetteOpenAI(self.cassette, inner=self.client)
+        
+    def _wait_for_rate_limit(self, estimated_tokens: int = 0) -> float:
+        """Block until the shared limiter admits a request of the estimated size."""
+        return self.rate_limiter.acquire(estimated_tokens)
+    
+    def _release_after_stream(self, stream, estimated_tokens: int, request_metrics: RequestMetrics) -> ReleasingStream:
+        """Wrap a stream so the limiter slot is freed once it is done, closed or dropped."""
+        def observe(chunk):
+            if chunk.choices:
+                request_metrics.observe_chunk(chunk.choices[0].delta.content, chunk.choices[0].finish_reason)
+        
+        def finish(error: Optional[BaseException]):
+            self.rate_limiter.release(estimated_tokens)
+            self._finish_metrics(request_metrics, error)
+        
+        return ReleasingStream(stream, observe, finish)
+    
     def complete(
         self,
         prompt: str,
@@ -84,6 +1216,7 @@ class SwissAIClient:
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         stream: bool = False,
+        bypass_cache: bool = False,
         **kwargs
     ) -> str:
         """
@@ -95,11 +1228,12 @@ class SwissAIClient:
             temperature: Sampling temperature (0.0 to 1.0)
             max_tokens: Maximum number of tokens to generate
             stream: Whether to stream the response
+            bypass_cache: Skip the completion cache and always call the API
             **kwargs: Additional parameters to pass to the API
             
         Returns:
-            The generated text response (or iterator if streaming)
-            
+            The generated text response (or a ReleasingStream if streaming; close it when stopping early)
+        
         Example:
             client = SwissAIClient()
             response = client.complete(
@@ -108,50 +1242,96 @@ class SwissAIClient:
             )
             print(response)
         """
-        # Wait to respect rate limits
-        self._wait_for_rate_limit()
-        
-        # Prepare messages
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": prompt})
+        params, estimate = self._build_request(prompt, system_prompt, temperature, max_tokens, stream, kwargs)
         
-        # Prepare API call parameters
-        params = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": temperature,
-            "stream": stream,
-            **kwargs
-        }
+        if stream:
+            return self._complete_with_retries(params, estimate, True, self._start_metrics(stream=True))
         
-        if max_tokens is not None:
-            params["max_tokens"] = max_tokens
+        with tracing.span("llm_call", caller=self.caller, estimated_tokens=estimate.total) as call_span:
+            cache_key = self._cache_key(params, bypass_cache)
+            if cache_key is not None:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self.metrics.record_cache_hit(self.caller)
+                    call_span.set_attribute("cache_hit", True)
+                    return cached
+            
+            def fetch():
+                result = self._complete_with_retries(params, estimate, False, self._start_metrics(stream=False))
+                if cache_key is not None and result is not None:
+                    self.cache.set(cache_key, result)
+                return result
+            
+            # Identical deterministic requests already in flight (other sessions/threads) share one API call
+            if not self._coalescable(params):
+                return fetch()
+            return single_flight.do(self._flight_key(params), fetch)
+    
+    def _complete_with_retries(
+        self,
+        params: Dict[str, Any],
+        estimate: TokenEstimate,
+        stream: bool,
+        request_metrics: RequestMetrics
+    ):
+        """Call the API, retrying transient errors according to the retry policy."""
+        attempt = 1
+        while True:
+            try:
+                with tracing.span("llm_attempt", attempt=attempt) as attempt_span:
+                    queue_wait = request_metrics.queue_wait
+                    try:
+                        result = self._complete_once(params, estimate, stream, request_metrics)
+                    finally:
+                        attempt_span.set_attribute("queue_wait", round(request_metrics.queue_wait - queue_wait, 6))
+                if attempt > 1:
+                    retry_metrics.record_recovered()
+                if not stream:
+                    self._finish_metrics(request_metrics)
+                return result
+            except Exception as e:
+                delay = self._next_retry_delay(e, attempt)
+                if delay is None:
+                    self._finish_metrics(request_metrics, e)
+                    raise
+                request_metrics.retries += 1
+                time.sleep(delay)
+                attempt += 1
+    
+    def _complete_once(
+        self,
+        params: Dict[str, Any],
+        estimate: TokenEstimate,
+        stream: bool,
+        request_metrics: RequestMetrics
+    ):
+        """Send a single completion attempt through the rate limiter."""
+        # Wait to respect rate limits (requests and tokens)
+        request_metrics.queue_wait += self._wait_for_rate_limit(estimate.total)
         
+        stream_handed_off = False
+        sent = False
         try:
             logger.debug(f"Making completion request, stream={stream}")
-            response = self.client.chat.completions.create(**params)
-            
-            # Log rate limit info if available
-            rate_limit_info = self._extract_rate_limit_info(response)
-            if rate_limit_info.remaining_tokens:
-                logger.info(f"Remaining tokens: {rate_limit_info.remaining_tokens}")
+            # The raw response exposes the HTTP headers with the rate limit budget
+            raw_response = self.client.chat.completions.with_raw_response.create(**params)
+            sent = True
+            result = self._handle_response(raw_response, params, estimate, stream, request_metrics)
             
             if stream:
-                return response
-            else:
-                return response.choices[0].message.content
+                stream_handed_off = True
+                return self._release_after_stream(result, estimate.total, request_metrics)
+            return result
             
-        except openai.RateLimitError as e:
-            logger.error(f"Rate limit exceeded: {e}")
-            raise
-        except openai.APIError as e:
-            logger.error(f"API error: {e}")
-            raise
         except Exception as e:
-            logger.error(f"Unexpected error: {e}")
+            if not sent:
+                # A failed attempt used no tokens; refund them before a 429 caps the bucket
+                self.rate_limiter.reconcile(estimate.total, 0)
+            self._handle_error(e)
             raise
+        finally:
+            if not stream_handed_off:
+                self.rate_limiter.release()
     
     def stream_complete(
         self,
@@ -188,6 +1368,273 @@ class SwissAIClient:
                 yield content
 
 
+class AsyncSwissAIClient(_BaseSwissAIClient):
+    """
+    Asyncio client for the Swiss AI Platform built on openai.AsyncOpenAI.
+    
+    Shares the process-wide rate limiter with SwissAIClient, so sync and async
+    callers together stay within the platform limits. Many requests can be
+    awaited concurrently from a single thread; max_concurrency bounds how many
+    of them this client keeps open at once.
+    """
+    
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        cache: Optional[CompletionCache] = None,
+        cassette: Optional[Cassette] = None,
+        caller: str = "unknown",
+        max_concurrency: int = 100
+    ):
+        """
+        Initialize the async Swiss AI client.
+        
+        Args:
+            api_key: API key for Swiss AI Platform. If None, reads from SWISS_AI_PLATFORM_API_KEY env var.
+            base_url: Base URL for the API. If None, uses SWISS_AI_BASE_URL or the default Swiss AI Platform URL.
+            rate_limiter: Limiter to use. If None, the process-wide shared limiter is used.
+            retry_policy: Retry behaviour for transient errors. If None, RetryPolicy() defaults apply.
+            cache: Completion cache for acomplete(). If None, the shared cache is used when
+                SWISS_AI_COMPLETION_CACHE is set.
+            cassette: Cassette to record responses to or replay them from. If None, the
+                cassette configured by SWISS_AI_CASSETTE is used.
+            caller: Tag (page or function) under which requests appear in the metrics
+            max_concurrency: Maximum number of requests this client has open at once
+        """
+        super().__init__(
+            api_key=api_key, base_url=base_url, rate_limiter=rate_limiter,
+            retry_policy=retry_policy, cache=cache, cassette=cassette, caller=caller
+        )
+        
+        self.max_concurrency = max_concurrency
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self._client_loop = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop = None
+    
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        """
+        The openai.AsyncOpenAI client for the running event loop.
+        
+        Created lazily because its pooled HTTP connections belong to one event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or (self._client_loop is not None and self._client_loop is not loop):
+            if self.cassette is not None and self.cassette.mode == REPLAY:
+                self._client = AsyncCassetteOpenAI(self.cassette)
+            else:
+                # Retries are handled by acomplete()/astream() so that every attempt passes the rate limiter
+                self._client = openai.AsyncOpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    max_retries=0,
+                    http_client=get_async_http_client(self.api_key, self.base_url)
+                )
+                if self.cassette is not None:
+                    self._client = AsyncCassetteOpenAI(self.cassette, inner=self._client)
+            self._client_loop = loop
+        return self._client
+    
+    @client.setter
+    def client(self, value: openai.AsyncOpenAI):
+        """Use an explicitly configured client regardless of the event loop."""
+        self._client = value
+        self._client_loop = None
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Return the concurrency semaphore for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+    
+    async def acomplete(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        bypass_cache: bool = False,
+        **kwargs
+    ) -> str:
+        """
+        Generate a completion without blocking the event loop.
+        
+        Args:
+            prompt: The user prompt
+            system_prompt: Optional system prompt
+            temperature: Sampling temperature (0.0 to 1.0)
+            max_tokens: Maximum number of tokens to generate
+            bypass_cache: Skip the completion cache and always call the API
+            **kwargs: Additional parameters to pass to the API
+            
+        Returns:
+            The generated text response
+            
+        Example:
+            client = AsyncSwissAIClient()
+            answers = await asyncio.gather(*[client.acomplete(q) for q in questions])
+        """
+        params, estimate = self._build_request(prompt, system_prompt, temperature, max_tokens, False, kwargs)
+        
+        with tracing.span("llm_call", caller=self.caller, estimated_tokens=estimate.total) as call_span:
+            cache_key = self._cache_key(params, bypass_cache)
+            if cache_key is not None:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self.metrics.record_cache_hit(self.caller)
+                    call_span.set_attribute("cache_hit", True)
+                    return cached
+            
+            async def fetch():
+                request_metrics = self._start_metrics(stream=False)
+                async with self._get_semaphore():
+                    request_metrics.queue_wait = time.monotonic() - request_metrics.started
+                    result = await self._acomplete_with_retries(params, estimate, request_metrics)
+                if cache_key is not None and result is not None:
+                    self.cache.set(cache_key, result)
+                return result
+            
+            # Identical deterministic requests already in flight on this event loop share one API call
+            if not self._coalescable(params):
+                return await fetch()
+            return await async_single_flight.do(self._flight_key(params), fetch)
+    
+    async def _acomplete_with_retries(
+        self,
+        params: Dict[str, Any],
+        estimate: TokenEstimate,
+        request_metrics: RequestMetrics
+    ) -> str:
+        """Call the API, retrying transient errors according to the retry policy."""
+        attempt = 1
+        while True:
+            try:
+                with tracing.span("llm_attempt", attempt=attempt) as attempt_span:
+                    queue_wait = request_metrics.queue_wait
+                    try:
+                        result = await self._acomplete_once(params, estimate, request_metrics)
+                    finally:
+                        attempt_span.set_attribute("queue_wait", round(request_metrics.queue_wait - queue_wait, 6))
+                if attempt > 1:
+                    retry_metrics.record_recovered()
+                self._finish_metrics(request_metrics)
+                return result
+            except Exception as e:
+                delay = self._next_retry_delay(e, attempt)
+                if delay is None:
+                    self._finish_metrics(request_metrics, e)
+                    raise
+                request_metrics.retries += 1
+                await asyncio.sleep(delay)
+                attempt += 1
+    
+    async def _acomplete_once(
+        self,
+        params: Dict[str, Any],
+        estimate: TokenEstimate,
+        request_metrics: RequestMetrics
+    ) -> str:
+        """Send a single async completion attempt through the rate limiter."""
+        request_metrics.queue_wait += await self.rate_limiter.acquire_async(estimate.total)
+        sent = False
+        try:
+            logger.debug("Making async completion request")
+            raw_response = await self.client.chat.completions.with_raw_response.create(**params)
+            sent = True
+            return self._handle_response(raw_response, params, estimate, False, request_metrics)
+        except Exception as e:
+            if not sent:
+                # A failed attempt used no tokens; refund them before a 429 caps the bucket
+                self.rate_limiter.reconcile(estimate.total, 0)
+            self._handle_error(e)
+            raise
+        finally:
+            self.rate_limiter.release()
+    
+    async def astream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        Stream a completion and yield content chunks as they arrive.
+        
+        Args:
+            prompt: The user prompt
+            system_prompt: Optional system prompt
+            temperature: Sampling temperature (0.0 to 1.0)
+            max_tokens: Maximum number of tokens to generate
+            **kwargs: Additional parameters to pass to the API
+            
+        Yields:
+            Content chunks as strings
+            
+        Example:
+            client = AsyncSwissAIClient()
+            async for chunk in client.astream("Tell me about Switzerland"):
+                print(chunk, end="", flush=True)
+        """
+        params, estimate = self._build_request(prompt, system_prompt, temperature, max_tokens, True, kwargs)
+        
+        request_metrics = self._start_metrics(stream=True)
+        async with self._get_semaphore():
+            request_metrics.queue_wait = time.monotonic() - request_metrics.started
+            # Only opening the stream is retried; chunks already yielded cannot be taken back
+            attempt = 1
+            while True:
+                request_metrics.queue_wait += await self.rate_limiter.acquire_async(estimate.total)
+                sent = False
+                try:
+                    logger.debug("Making async streaming request")
+                    raw_response = await self.client.chat.completions.with_raw_response.create(**params)
+                    sent = True
+                    stream = self._handle_response(raw_response, params, estimate, True, request_metrics)
+                    if attempt > 1:
+                        retry_metrics.record_recovered()
+                    break
+                except Exception as e:
+                    # A failed attempt used no tokens; refund them before a 429 caps the bucket
+                    self.rate_limiter.release(0 if sent else estimate.total, 0)
+                    self._handle_error(e)
+                    delay = self._next_retry_delay(e, attempt)
+                    if delay is None:
+                        self._finish_metrics(request_metrics, e)
+                        raise
+                    request_metrics.retries += 1
+                    await asyncio.sleep(delay)
+                    attempt += 1
+            
+            error = None
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    request_metrics.observe_chunk(content, chunk.choices[0].finish_reason)
+                    if content:
+                        yield content
+            except Exception as e:
+                error = e
+                self._handle_error(e)
+                raise
+            finally:
+                try:
+                    # Also reached when the caller stops early; give the connection back to the pool
+                    await aclose_stream(stream)
+                finally:
+                    self.rate_limiter.release()
+                    self._finish_metrics(request_metrics, error)
+
+
 # Convenience function for quick usage
 def create_client(api_key: Optional[str] = None) -> SwissAIClient:
     """
@@ -0,0 +1,197 @@
+"""
+Content-addressed on-disk cache for LLM completions.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / ".cache" / "completions.sqlite"
+
+
+def make_cache_key(params: Dict[str, Any]) -> str:
+    """
+    Hash the request parameters that determine a completion.
+    
+    Args:
+        params: Chat completion parameters (model, messages, temperature, max_tokens, extra kwargs)
+    
+    Returns:
+        Hex SHA-256 digest of the canonical JSON form
+    """
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """
+    SQLite-backed completion cache with TTL and least-recently-used eviction.
+    
+    Entries are keyed by a hash of the full request (see make_cache_key). Entries
+    older than ttl_seconds are treated as misses. When the cache grows beyond
+    max_entries or max_bytes, the least recently read entries are evicted.
+    The database uses WAL mode so several processes can share one file.
+    """
+    
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+        max_entries: int = 10_000,
+        max_bytes: int = 200 * 1024 * 1024
+    ):
+        """
+        Open (or create) a completion cache.
+        
+        Args:
+            path: SQLite file. Defaults to .cache/completions.sqlite next to this module.
+            ttl_seconds: Maximum age of an entry; None keeps entries until evicted
+            max_entries: Maximum number of cached completions
+            max_bytes: Maximum total size of cached responses
+        """
+        self.path = Path(path) if path else DEFAULT_CACHE_PATH
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON completions(last_access)")
+        self._conn.commit()
+        
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached completion.
+        
+        Args:
+            key: Cache key from make_cache_key
+        
+        Returns:
+            The cached response text, or None on a miss or expired entry
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            
+            if row is None:
+                self.misses += 1
+                return None
+            
+            self._conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+    
+    def set(self, key: str, response: str):
+        """
+        Store a completion and evict old entries if the cache is over its limits.
+        
+        Args:
+            key: Cache key from make_cache_key
+            response: Completion text
+        """
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+    
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until within limits."""
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM completions WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+        
+        count, total_size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions"
+        ).fetchone()
+        if count <= self.max_entries and total_size <= self.max_bytes:
+            return
+        
+        removed = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM completions ORDER BY last_access ASC"
+        ).fetchall():
+            if count <= self.max_entries and total_size <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+            count -= 1
+            total_size -= size
+            removed += 1
+        logger.debug(f"Evicted {removed} cached completions")
+    
+    def clear(self):
+        """Remove all cached completions."""
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+    
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups served from the cache since this instance was opened."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+_default_cache: Optional[CompletionCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[CompletionCache]:
+    """
+    Return the process-wide completion cache if it is enabled.
+    
+    The cache is enabled with the SWISS_AI_COMPLETION_CACHE environment variable:
+    "1"/"true" uses the default location, any other value is taken as the SQLite path.
+    
+    Returns:
+        The shared CompletionCache, or None if caching is disabled
+    """
+    global _default_cache
+    setting = os.getenv("SWISS_AI_COMPLETION_CACHE", "").strip()
+    if not setting or setting.lower() in ("0", "false", "no"):
+        return None
+    
+    with _default_cache_lock:
+        if _default_cache is None:
+            path = None if setting.lower() in ("1", "true", "yes") else Path(setting)
+            _default_cache = CompletionCache(path=path)
+        return _default_cache
@@ -0,0 +1,395 @@
+"""
+Record/replay cassettes for chat completion requests.
+
+A cassette is a JSONL file with one recorded request/response pair per line,
+including the observed latency and, for streams, the timing of every chunk.
+Replaying a cassette needs neither network access nor an API key.
+"""
+import os
+import json
+import time
+import asyncio
+import inspect
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterator, AsyncIterator
+
+import httpx
+import openai
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from llm_cache import make_cache_key
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+
+# openai error classes raised for recorded error responses
+_STATUS_ERRORS = {
+    400: openai.BadRequestError,
+    401: openai.AuthenticationError,
+    403: openai.PermissionDeniedError,
+    404: openai.NotFoundError,
+    409: openai.ConflictError,
+    422: openai.UnprocessableEntityError,
+    429: openai.RateLimitError,
+}
+
+
+class CassetteMissError(LookupError):
+    """Raised in strict replay mode when a request was never recorded."""
+
+
+class Cassette:
+    """
+    A file of recorded chat completion exchanges.
+    
+    In record mode every request is passed to the real API and the response is
+    appended to the file. In replay mode requests are answered from the file:
+    identical requests (same hash as the completion cache) get their recorded
+    responses in recording order. With strict=False a request that was never
+    recorded is answered with the next recorded exchange of the same kind, which
+    lets benchmarks replay pipelines whose prompts contain random data.
+    
+    Latencies are replayed multiplied by timing_scale (0 disables waiting).
+    """
+    
+    def __init__(
+        self,
+        path: Path,
+        mode: str = REPLAY,
+        timing_scale: float = 1.0,
+        strict: bool = True
+    ):
+        """
+        Open a cassette.
+        
+        Args:
+            path: JSONL cassette file
+            mode: "record" or "replay"
+            timing_scale: Factor applied to recorded latencies on replay
+            strict: Raise CassetteMissError for unrecorded requests instead of
+                answering with another recorded exchange
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        
+        self.path = Path(path)
+        self.mode = mode
+        self.timing_scale = timing_scale
+        self.strict = strict
+        
+        self._lock = threading.Lock()
+        self._entries: List[Dict[str, Any]] = []
+        self._by_key: Dict[str, List[int]] = {}
+        self._key_positions: Dict[str, int] = {}
+        self._fallback_positions: Dict[bool, int] = {}
+        
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._add(json.loads(line))
+        elif mode == REPLAY:
+            raise FileNotFoundError(f"Cassette not found: {self.path}")
+    
+    def _add(self, entry: Dict[str, Any]):
+        """Index an entry by its request key."""
+        self._by_key.setdefault(entry["key"], []).append(len(self._entries))
+        self._entries.append(entry)
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+    
+    def record(self, params: Dict[str, Any], entry: Dict[str, Any]):
+        """
+        Append a recorded exchange to the cassette.
+        
+        Args:
+            params: Request parameters sent to the API
+            entry: Recorded response (status, headers, latency, body or chunks)
+        """
+        entry = {"key": make_cache_key(params), "request": params, **entry}
+        with self._lock:
+            self._add(entry)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    
+    def lookup(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Find the recorded exchange that answers a request.
+        
+        Args:
+            params: Request parameters
+        
+        Returns:
+            The recorded entry
+        
+        Raises:
+            CassetteMissError: If nothing suitable was recorded
+        """
+        key = make_cache_key(params)
+        stream = bool(params.get("stream"))
+        with self._lock:
+            indices = self._by_key.get(key)
+            if indices:
+                position = self._key_positions.get(key, 0)
+                self._key_positions[key] = position + 1
+                return self._entries[indices[position % len(indices)]]
+            
+            if self.strict:
+                raise CassetteMissError(f"Request not found in cassette {self.path}")
+            
+            candidates = [e for e in self._entries if bool(e["request"].get("stream")) == stream]
+            if not candidates:
+                raise CassetteMissError(f"No {'streaming' if stream else 'non-streaming'} exchange in cassette {self.path}")
+            position = self._fallback_positions.get(stream, 0)
+            self._fallback_positions[stream] = position + 1
+            return candidates[position % len(candidates)]
+    
+    def scaled(self, seconds: float) -> float:
+        """Recorded duration adjusted by the timing scale."""
+        return max(0.0, seconds * self.timing_scale)
+
+
+def _status_error(entry: Dict[str, Any]) -> openai.APIStatusError:
+    """Rebuild the openai error for a recorded error response."""
+    status = entry["status"]
+    request = httpx.Request("POST", "https://cassette.invalid/v1/chat/completions")
+    response = httpx.Response(status, headers=entry.get("headers") or {}, request=request)
+    error_class = _STATUS_ERRORS.get(status)
+    if error_class is None:
+        error_class = openai.InternalServerError if status >= 500 else openai.APIStatusError
+    return error_class(entry.get("message") or f"Error code: {status}", response=response, body=entry.get("body"))
+
+
+def _error_entry(error: Exception, latency: float) -> Optional[Dict[str, Any]]:
+    """Recordable form of an API error, or None for errors without a response."""
+    if not isinstance(error, openai.APIStatusError):
+        return None
+    return {
+        "status": error.status_code,
+        "headers": dict(error.response.headers),
+        "latency": latency,
+        "message": error.message,
+        "body": error.body,
+    }
+
+
+class CassetteResponse:
+    """Stand-in for the raw response returned by with_raw_response.create()."""
+    
+    def __init__(self, headers: Dict[str, str], parsed):
+        self.headers = httpx.Headers(headers)
+        self._parsed = parsed
+    
+    def parse(self):
+        return self._parsed
+
+
+class _RecordingStream:
+    """Pass stream chunks through and record their timing once the stream ends."""
+    
+    def __init__(self, cassette: Cassette, params: Dict[str, Any], headers: Dict[str, str], start: float, stream):
+        self._cassette = cassette
+        self._params = params
+        self._headers = headers
+        self._stream = stream
+        self._latency = time.monotonic() - start
+        self._last = time.monotonic()
+        self._chunks: List[Dict[str, Any]] = []
+    
+    def _observe(self, chunk):
+        now = time.monotonic()
+        self._chunks.append({"delay": now - self._last, "chunk": chunk.model_dump(mode="json")})
+        self._last = now
+    
+    def _finish(self):
+        self._cassette.record(self._params, {
+            "status": 200, "headers": self._headers, "latency": self._latency, "chunks": self._chunks
+        })
+    
+    def __iter__(self) -> Iterator[ChatCompletionChunk]:
+        try:
+            for chunk in self._stream:
+                self._observe(chunk)
+                yield chunk
+        finally:
+            self._finish()
+    
+    async def __aiter__(self) -> AsyncIterator[ChatCompletionChunk]:
+        try:
+            async for chunk in self._stream:
+                self._observe(chunk)
+                yield chunk
+        finally:
+            self._finish()
+    
+    def close(self):
+        """Close the recorded stream and with it the HTTP response."""
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            close()
+    
+    async def aclose(self):
+        """Close the recorded async stream and with it the HTTP response."""
+        close = getattr(self._stream, "aclose", None) or getattr(self._stream, "close", None)
+        if close is not None:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+
+
+def _replay_chunks(cassette: Cassette, entry: Dict[str, Any]) -> Iterator[ChatCompletionChunk]:
+    for recorded in entry["chunks"]:
+        time.sleep(cassette.scaled(recorded["delay"]))
+        yield ChatCompletionChunk.model_validate(recorded["chunk"])
+
+
+async def _areplay_chunks(cassette: Cassette, entry: Dict[str, Any]) -> AsyncIterator[ChatCompletionChunk]:
+    for recorded in entry["chunks"]:
+        await asyncio.sleep(cassette.scaled(recorded["delay"]))
+        yield ChatCompletionChunk.model_validate(recorded["chunk"])
+
+
+def _replayed_response(cassette: Cassette, entry: Dict[str, Any], chunks) -> CassetteResponse:
+    """Turn a recorded entry into a raw response (or raise its recorded error)."""
+    if entry["status"] != 200:
+        raise _status_error(entry)
+    if "chunks" in entry:
+        return CassetteResponse(entry["headers"], chunks)
+    return CassetteResponse(entry["headers"], ChatCompletion.model_validate(entry["body"]))
+
+
+class _Namespace:
+    """Expose create() under .chat.completions.with_raw_response like the openai clients."""
+    
+    def __init__(self, create):
+        self.chat = self
+        self.completions = self
+        self.with_raw_response = self
+        self.create = create
+
+
+class CassetteOpenAI(_Namespace):
+    """
+    Drop-in for openai.OpenAI that records to or replays from a cassette.
+    
+    Only chat.completions.with_raw_response.create() is provided, which is all
+    SwissAIClient uses.
+    """
+    
+    def __init__(self, cassette: Cassette, inner: Optional[openai.OpenAI] = None):
+        """
+        Args:
+            cassette: Cassette to record to or replay from
+            inner: Real client used in record mode
+        """
+        if cassette.mode == RECORD and inner is None:
+            raise ValueError("Recording requires a real client")
+        self.cassette = cassette
+        self.inner = inner
+        super().__init__(self._create)
+    
+    def _create(self, **params):
+        if self.cassette.mode == REPLAY:
+            entry = self.cassette.lookup(params)
+            time.sleep(self.cassette.scaled(entry["latency"]))
+            return _replayed_response(self.cassette, entry, _replay_chunks(self.cassette, entry) if "chunks" in entry else None)
+        
+        start = time.monotonic()
+        try:
+            raw = self.inner.chat.completions.with_raw_response.create(**params)
+            headers = dict(raw.headers)
+            parsed = raw.parse()
+        except Exception as e:
+            entry = _error_entry(e, time.monotonic() - start)
+            if entry is not None:
+                self.cassette.record(params, entry)
+            raise
+        
+        if params.get("stream"):
+            return CassetteResponse(headers, _RecordingStream(self.cassette, params, headers, start, parsed))
+        self.cassette.record(params, {
+            "status": 200, "headers": headers, "latency": time.monotonic() - start,
+            "body": parsed.model_dump(mode="json")
+        })
+        return CassetteResponse(headers, parsed)
+
+
+class AsyncCassetteOpenAI(_Namespace):
+    """Drop-in for openai.AsyncOpenAI that records to or replays from a cassette."""
+    
+    def __init__(self, cassette: Cassette, inner: Optional[openai.AsyncOpenAI] = None):
+        """
+        Args:
+            cassette: Cassette to record to or replay from
+            inner: Real async client used in record mode
+        """
+        if cassette.mode == RECORD and inner is None:
+            raise ValueError("Recording requires a real client")
+        self.cassette = cassette
+        self.inner = inner
+        super().__init__(self._create)
+    
+    async def _create(self, **params):
+        if self.cassette.mode == REPLAY:
+            entry = self.cassette.lookup(params)
+            await asyncio.sleep(self.cassette.scaled(entry["latency"]))
+            return _replayed_response(self.cassette, entry, _areplay_chunks(self.cassette, entry) if "chunks" in entry else None)
+        
+        start = time.monotonic()
+        try:
+            raw = await self.inner.chat.completions.with_raw_response.create(**params)
+            headers = dict(raw.headers)
+            parsed = raw.parse()
+        except Exception as e:
+            entry = _error_entry(e, time.monotonic() - start)
+            if entry is not None:
+                self.cassette.record(params, entry)
+            raise
+        
+        if params.get("stream"):
+            return CassetteResponse(headers, _RecordingStream(self.cassette, params, headers, start, parsed))
+        self.cassette.record(params, {
+            "status": 200, "headers": headers, "latency": time.monotonic() - start,
+            "body": parsed.model_dump(mode="json")
+        })
+        return CassetteResponse(headers, parsed)
+
+
+_default_cassette: Optional[Cassette] = None
+_default_cassette_lock = threading.Lock()
+
+
+def get_default_cassette() -> Optional[Cassette]:
+    """
+    Return the process-wide cassette if one is configured.
+    
+    Configured with environment variables:
+    SWISS_AI_CASSETTE (path of the JSONL file), SWISS_AI_CASSETTE_MODE
+    ("replay" or "record", default replay), SWISS_AI_CASSETTE_TIMING (latency
+    scale, default 1.0) and SWISS_AI_CASSETTE_STRICT ("0" to answer unrecorded
+    requests with other recorded exchanges).
+    
+    Returns:
+        The shared Cassette, or None if no cassette is configured
+    """
+    global _default_cassette
+    path = os.getenv("SWISS_AI_CASSETTE", "").strip()
+    if not path:
+        return None
+    
+    with _default_cassette_lock:
+        if _default_cassette is None or _default_cassette.path != Path(path):
+            _default_cassette = Cassette(
+                path=Path(path),
+                mode=os.getenv("SWISS_AI_CASSETTE_MODE", REPLAY).strip().lower(),
+                timing_scale=float(os.getenv("SWISS_AI_CASSETTE_TIMING", "1.0")),
+                strict=os.getenv("SWISS_AI_CASSETTE_STRICT", "1").strip().lower() not in ("0", "false", "no")
+            )
+            logger.info(f"Using {_default_cassette.mode} cassette {path} ({len(_default_cassette)} entries)")
+        return _default_cassette
@@ -0,0 +1,323 @@
+"""
+In-process telemetry for LLM requests with Prometheus and JSON export.
+"""
+import os
+import json
+import math
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Dict, Any, List, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_tokens import count_text_tokens
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _quantile(values, q: float) -> Optional[float]:
+    """Nearest-rank quantile (0-1) of the values, None if there are none."""
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus sense.
+    
+    Also keeps the most recent observations so that quantiles can be computed
+    exactly for the recent window (bucket-based quantiles are coarse).
+    """
+    
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = 1000):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+    
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Quantile (0-1) of the recent observations, None if there are none."""
+        return _quantile(self.recent, q)
+    
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+@dataclass
+class RequestMetrics:
+    """Measurements of one logical LLM request (including its retries)."""
+    caller: str
+    stream: bool = False
+    started: float = field(default_factory=time.monotonic)
+    queue_wait: float = 0.0
+    latency: Optional[float] = None
+    time_to_first_token: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    retries: int = 0
+    finish_reason: Optional[str] = None
+    status: str = "ok"
+    error: Optional[str] = None
+    
+    def observe_chunk(self, content: Optional[str], finish_reason: Optional[str] = None):
+        """Account for one streamed chunk (time to first token, output tokens)."""
+        if content:
+            if self.time_to_first_token is None:
+                self.time_to_first_token = time.monotonic() - self.started
+            self.completion_tokens = (self.completion_tokens or 0) + count_text_tokens(content)
+        if finish_reason:
+            self.finish_reason = finish_reason
+    
+    def finish(self, error: Optional[BaseException] = None):
+        """Stop the clock and set the outcome."""
+        self.latency = time.monotonic() - self.started
+        if error is not None:
+            self.status = "error"
+            self.error = type(error).__name__
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of LLM request metrics, labelled by caller.
+    
+    Keeps per-caller histograms (total latency, limiter queue wait, time to first
+    token) and counters (requests by status and finish_reason, tokens, retries,
+    cache hits), plus the most recent request records.
+    """
+    
+    def __init__(self, recent_requests: int = 500):
+        self._lock = threading.Lock()
+        self._recent_size = recent_requests
+        self.reset()
+    
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self._latency: Dict[str, Histogram] = {}
+            self._queue_wait: Dict[str, Histogram] = {}
+            self._ttft: Dict[str, Histogram] = {}
+            self._requests: Dict[Tuple[str, str, str], int] = {}
+            self._tokens: Dict[Tuple[str, str], int] = {}
+            self._retries: Dict[str, int] = {}
+            self._cache_hits: Dict[str, int] = {}
+            self._recent = deque(maxlen=self._recent_size)
+    
+    @staticmethod
+    def _histogram(histograms: Dict[str, Histogram], caller: str) -> Histogram:
+        if caller not in histograms:
+            histograms[caller] = Histogram()
+        return histograms[caller]
+    
+    def record(self, request: RequestMetrics):
+        """Add a finished request."""
+        with self._lock:
+            caller = request.caller
+            if request.latency is not None:
+                self._histogram(self._latency, caller).observe(request.latency)
+            self._histogram(self._queue_wait, caller).observe(request.queue_wait)
+            if request.time_to_first_token is not None:
+                self._histogram(self._ttft, caller).observe(request.time_to_first_token)
+            
+            key = (caller, request.status, request.finish_reason or "")
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for kind, amount in (("prompt", request.prompt_tokens), ("completion", request.completion_tokens)):
+                if amount:
+                    self._tokens[(caller, kind)] = self._tokens.get((caller, kind), 0) + amount
+            self._retries[caller] = self._retries.get(caller, 0) + request.retries
+            self._recent.append(request)
+    
+    def record_cache_hit(self, caller: str):
+        """Count a request answered from the completion cache."""
+        with self._lock:
+            self._cache_hits[caller] = self._cache_hits.get(caller, 0) + 1
+    
+    def recent(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """The most recent request records, newest last."""
+        with self._lock:
+            records = list(self._recent)
+        if limit is not None:
+            records = records[-limit:]
+        return [asdict(record) for record in records]
+    
+    def latency_quantile(self, q: float, caller: Optional[str] = None) -> Optional[float]:
+        """Quantile of the recent total latencies, of one caller or of all callers."""
+        with self._lock:
+            if caller is None:
+                values = [v for histogram in self._latency.values() for v in histogram.recent]
+            else:
+                values = list(self._latency[caller].recent) if caller in self._latency else []
+        return _quantile(values, q)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Per-caller summary of everything recorded.
+        
+        Returns:
+            Dict caller -> requests, errors, cache_hits, retries, tokens,
+            finish_reasons and latency/queue_wait/time_to_first_token summaries
+        """
+        with self._lock:
+            callers = set(self._latency) | set(self._cache_hits) | {c for c, _, _ in self._requests}
+            result = {}
+            for caller in sorted(callers):
+                requests = {k: v for k, v in self._requests.items() if k[0] == caller}
+                finish_reasons: Dict[str, int] = {}
+                for (_, _, reason), count in requests.items():
+                    if reason:
+                        finish_reasons[reason] = finish_reasons.get(reason, 0) + count
+                empty = Histogram().summary()
+                result[caller] = {
+                    "requests": sum(requests.values()),
+                    "errors": sum(v for k, v in requests.items() if k[1] == "error"),
+                    "cache_hits": self._cache_hits.get(caller, 0),
+                    "retries": self._retries.get(caller, 0),
+                    "prompt_tokens": self._tokens.get((caller, "prompt"), 0),
+                    "completion_tokens": self._tokens.get((caller, "completion"), 0),
+                    "finish_reasons": finish_reasons,
+                    "latency": self._latency[caller].summary() if caller in self._latency else empty,
+                    "queue_wait": self._queue_wait[caller].summary() if caller in self._queue_wait else empty,
+                    "time_to_first_token": self._ttft[caller].summary() if caller in self._ttft else empty,
+                }
+            return result
+    
+    def to_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        
+        def histogram_lines(name: str, help_text: str, histograms: Dict[str, Histogram]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for caller, histogram in sorted(histograms.items()):
+                label = f'caller="{_escape(caller)}"'
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+                lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{label}}} {histogram.count}")
+        
+        with self._lock:
+            histogram_lines("llm_request_latency_seconds", "Total request latency including queueing and retries", self._latency)
+            histogram_lines("llm_queue_wait_seconds", "Time spent waiting for the rate limiter", self._queue_wait)
+            histogram_lines("llm_time_to_first_token_seconds", "Time until the first streamed token", self._ttft)
+            
+            lines.append("# HELP llm_requests_total Finished LLM requests")
+            lines.append("# TYPE llm_requests_total counter")
+            for (caller, status, reason), count in sorted(self._requests.items()):
+                lines.append(
+                    f'llm_requests_total{{caller="{_escape(caller)}",status="{status}",finish_reason="{_escape(reason)}"}} {count}'
+                )
+            
+            lines.append("# HELP llm_tokens_total Prompt and completion tokens")
+            lines.append("# TYPE llm_tokens_total counter")
+            for (caller, kind), count in sorted(self._tokens.items()):
+                lines.append(f'llm_tokens_total{{caller="{_escape(caller)}",kind="{kind}"}} {count}')
+            
+            lines.append("# HELP llm_retries_total Retried attempts")
+            lines.append("# TYPE llm_retries_total counter")
+            for caller, count in sorted(self._retries.items()):
+                lines.append(f'llm_retries_total{{caller="{_escape(caller)}"}} {count}')
+            
+            lines.append("# HELP llm_cache_hits_total Requests answered from the completion cache")
+            lines.append("# TYPE llm_cache_hits_total counter")
+            for caller, count in sorted(self._cache_hits.items()):
+                lines.append(f'llm_cache_hits_total{{caller="{_escape(caller)}"}} {count}')
+        
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics_registry = MetricsRegistry()
+
+
+_metrics_server_started = False
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = 9464, host: str = "127.0.0.1", registry: Optional[MetricsRegistry] = None) -> ThreadingHTTPServer:
+    """
+    Serve the registry on a local port in a background thread.
+    
+    GET /metrics returns the Prometheus text format, GET /metrics.json the
+    per-caller snapshot plus the most recent requests.
+    
+    Args:
+        port: Port to listen on (0 picks a free one)
+        host: Interface to bind
+        registry: Registry to expose, defaults to the process-wide one
+    
+    Returns:
+        The running server (server.server_address has the bound port)
+    """
+    registry = registry or metrics_registry
+    
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+        
+        def do_GET(self):
+            path = self.path.split("?")[0].rstrip("/")
+            if path == "/metrics":
+                body = registry.to_prometheus().encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/metrics.json":
+                payload = {"callers": registry.snapshot(), "recent": registry.recent(100)}
+                body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving LLM metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def ensure_metrics_server():
+    """Start the metrics server once per process if SWISS_AI_METRICS_PORT is set."""
+    global _metrics_server_started
+    port = os.getenv("SWISS_AI_METRICS_PORT", "").strip()
+    if not port:
+        return
+    
+    with _metrics_server_lock:
+        if _metrics_server_started:
+            return
+        _metrics_server_started = True
+        try:
+            start_metrics_server(int(port))
+        except OSError as e:
+            # Another process (e.g. a second Streamlit worker) already serves this port
+            logger.warning(f"Could not start metrics server on port {port}: {e}")
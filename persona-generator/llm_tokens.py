@@ -0,0 +1,168 @@
+"""
+Local token estimation for LLM requests, used to admit requests by their token cost.
+"""
+import re
+import math
+import threading
+from dataclasses import dataclass
+from typing import Optional, List, Dict
+
+# Words, digit groups and single non-space symbols are counted separately
+_TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\d+|[^\w\s]|_", re.UNICODE)
+
+# Completion budget assumed when a request sets no max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+# Chat formatting overhead per message (role markers, separators)
+TOKENS_PER_MESSAGE = 4
+
+
+def count_text_tokens(text: str) -> int:
+    """
+    Approximate the number of tokens of a text without a tokenizer.
+    
+    Words count one token per started 4 characters, digit groups one per started
+    3 digits and every punctuation or JSON symbol one token. This matches BPE
+    tokenizers on German prose and on the JSON schema in prompt.md far better than
+    a flat characters/4 rule.
+    
+    Args:
+        text: Text to measure
+    
+    Returns:
+        Estimated token count
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        if piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif piece[0].isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        else:
+            tokens += 1
+    return tokens
+
+
+@dataclass
+class TokenEstimate:
+    """Expected token usage of a single request."""
+    prompt_tokens: int
+    completion_tokens: int
+    
+    @property
+    def total(self) -> int:
+        """Prompt plus expected completion tokens."""
+        return self.prompt_tokens + self.completion_tokens
+
+
+class TokenEstimator:
+    """
+    Estimates request cost before sending and learns from the reported usage.
+    
+    Prompt tokens are counted locally (count_text_tokens) and scaled by a
+    calibration factor learned from usage.prompt_tokens. Completion tokens are
+    predicted per max_tokens budget from a moving average of observed completion
+    lengths; until a budget has been observed the full max_tokens is assumed.
+    """
+    
+    def __init__(self, smoothing: float = 0.2, safety_margin: float = 1.1):
+        """
+        Initialize the estimator.
+        
+        Args:
+            smoothing: Weight of a new observation in the moving averages (0-1)
+            safety_margin: Factor applied to the learned completion length
+        """
+        self.smoothing = smoothing
+        self.safety_margin = safety_margin
+        self._lock = threading.Lock()
+        self._prompt_calibration = 1.0
+        self._completion_averages: Dict[Optional[int], float] = {}
+    
+    def estimate_prompt(self, messages: List[Dict[str, str]]) -> int:
+        """
+        Estimate the prompt tokens of chat messages.
+        
+        Args:
+            messages: Chat messages that will be sent
+        
+        Returns:
+            Estimated prompt tokens
+        """
+        raw = sum(count_text_tokens(message.get("content") or "") for message in messages)
+        raw += TOKENS_PER_MESSAGE * len(messages)
+        with self._lock:
+            return math.ceil(raw * self._prompt_calibration)
+    
+    def estimate_completion(self, max_tokens: Optional[int] = None) -> int:
+        """
+        Predict the completion tokens for a request with the given budget.
+        
+        Args:
+            max_tokens: Completion limit of the request
+        
+        Returns:
+            Expected completion tokens (never more than max_tokens)
+        """
+        budget = max_tokens if max_tokens is not None else DEFAULT_COMPLETION_TOKENS
+        with self._lock:
+            average = self._completion_averages.get(max_tokens)
+        if average is None:
+            return budget
+        return min(budget, math.ceil(average * self.safety_margin))
+    
+    def estimate(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> TokenEstimate:
+        """
+        Estimate prompt and completion tokens of a chat request.
+        
+        Args:
+            messages: Chat messages that will be sent
+            max_tokens: Completion limit of the request
+        
+        Returns:
+            TokenEstimate for the request
+        """
+        return TokenEstimate(
+            prompt_tokens=self.estimate_prompt(messages),
+            completion_tokens=self.estimate_completion(max_tokens)
+        )
+    
+    def observe(
+        self,
+        estimate: TokenEstimate,
+        max_tokens: Optional[int],
+        prompt_tokens: Optional[int],
+        completion_tokens: Optional[int]
+    ):
+        """
+        Learn from the usage reported for a finished request.
+        
+        Args:
+            estimate: The estimate made before sending
+            max_tokens: Completion limit the request was sent with
+            prompt_tokens: usage.prompt_tokens reported by the API
+            completion_tokens: usage.completion_tokens reported by the API
+        """
+        with self._lock:
+            if prompt_tokens and estimate.prompt_tokens:
+                uncalibrated = estimate.prompt_tokens / self._prompt_calibration
+                ratio = prompt_tokens / uncalibrated
+                self._prompt_calibration += self.smoothing * (ratio - self._prompt_calibration)
+            
+            if completion_tokens is not None:
+                average = self._completion_averages.get(max_tokens)
+                if average is None:
+                    self._completion_averages[max_tokens] = float(completion_tokens)
+                else:
+                    self._completion_averages[max_tokens] = average + self.smoothing * (completion_tokens - average)
+    
+    @property
+    def prompt_calibration(self) -> float:
+        """Learned ratio between reported and locally counted prompt tokens."""
+        with self._lock:
+            return self._prompt_calibration
+
+
+token_estimator = TokenEstimator()
@@ -1,5 +1,9 @@
+import time
 import streamlit as st
 from ui_components import load_custom_css, create_header
+from diagnostics import show_diagnostics_panel
+
+render_started = time.perf_counter()
 
 # Set up the page
 st.set_page_config(
@@ -58,19 +62,30 @@ with st.sidebar:
     }
     
     st.info(page_info[page])
+    
+    # Diagnostics are filled in after the page has rendered
+    st.markdown("---")
+    show_diagnostics = st.toggle("🩺 Diagnose anzeigen", key="show_diagnostics",
+                                 help="Renderzeit, Cache-Trefferquoten und Auslastung der LLM-Anfragen")
+    diagnostics_placeholder = st.empty()
 
-if page == "Single Persona":
-    import single_persona
-    single_persona.show()
-elif page == "Batch Generation":
-    import batch_generation  
-    batch_generation.show()
-elif page == "Persona Library":
-    import persona_library
-    persona_library.show()
-elif page == "Persona Chat":
-    import persona_chat
-    persona_chat.persona_chat_page()
-elif page == "Batch Chat":
-    import batch_chat
-    batch_chat.batch_chat_page()
\ No newline at end of file
+try:
+    if page == "Single Persona":
+        import single_persona
+        single_persona.show()
+    elif page == "Batch Generation":
+        import batch_generation  
+        batch_generation.show()
+    elif page == "Persona Library":
+        import persona_library
+        persona_library.show()
+    elif page == "Persona Chat":
+        import persona_chat
+        persona_chat.persona_chat_page()
+    elif page == "Batch Chat":
+        import batch_chat
+        batch_chat.batch_chat_page()
+finally:
+    if show_diagnostics:
+        with diagnostics_placeholder.container():
+            show_diagnostics_panel(render_started)
\ No newline at end of file
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI-compatible Swiss AI Platform endpoint.
+
+Serves POST /v1/chat/completions (streaming and non-streaming) with configurable
+latency, output speed, injected 429/5xx errors, X-Ratelimit-* headers and
+valid or deliberately malformed persona JSON. Point a client at it with
+SwissAIClient(api_key="mock", base_url=server.base_url) to load-test the batch
+paths without using real quota.
+
+Usage:
+    python mock_llm_server.py --port 8089 --latency 0.8 --tokens-per-second 150 --error-rate 0.02
+"""
+import re
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_tokens import count_text_tokens
+
+logger = logging.getLogger(__name__)
+
+FIRST_NAMES = {
+    "m": ["Luca", "Noah", "Marco", "Daniel", "Thomas", "Reto", "Urs", "Beat", "Jonas", "Matteo"],
+    "w": ["Laura", "Sarah", "Anna", "Nicole", "Sandra", "Ursula", "Mia", "Lea", "Chiara", "Elena"],
+}
+LAST_NAMES = ["Müller", "Meier", "Schmid", "Keller", "Weber", "Huber", "Schneider", "Frei", "Brunner", "Gerber"]
+CANTONS = ["Zürich", "Bern", "Luzern", "Aargau", "St. Gallen", "Basel-Stadt", "Waadt", "Tessin", "Graubünden", "Zug"]
+CHAT_SENTENCES = [
+    "Das ist eine gute Frage, darüber habe ich schon länger nachgedacht.",
+    "Ehrlich gesagt bin ich bei solchen Angeboten eher vorsichtig.",
+    "Wichtig ist mir vor allem, dass die Gebühren transparent sind.",
+    "Ich erledige das meiste inzwischen über die App.",
+    "Für grössere Entscheide hätte ich gerne eine persönliche Beratung.",
+    "Mit meinem Budget muss ich das gut überlegen.",
+]
+MALFORMATIONS = ("fenced", "trailing_text", "truncated", "single_quotes")
+
+
+@dataclass
+class MockServerConfig:
+    """Behaviour of the mock server."""
+    latency: float = 0.5  # median seconds until the first token
+    latency_distribution: str = "lognormal"  # fixed, uniform or lognormal
+    latency_spread: float = 0.5  # lognormal sigma, or +/- fraction for uniform
+    tokens_per_second: float = 200.0  # output speed, 0 = instant
+    rate_limit_rate: float = 0.0  # share of requests answered with an injected 429
+    server_error_rate: float = 0.0  # share of requests answered with a 500/502/503
+    malformed_rate: float = 0.0  # share of persona responses with broken JSON
+    tokens_per_minute: int = 100_000  # budget reported in X-Ratelimit-* headers
+    enforce_token_budget: bool = True  # answer 429 once the budget is used up
+    seed: Optional[int] = None
+
+
+@dataclass
+class MockServerStats:
+    """Counters of what the server answered."""
+    requests: int = 0
+    completions: int = 0
+    streams: int = 0
+    rate_limited: int = 0
+    server_errors: int = 0
+    malformed: int = 0
+    tokens: int = 0
+    status_codes: Dict[int, int] = field(default_factory=dict)
+
+
+class _TokenBudget:
+    """Per-minute token budget refilled continuously, as reported in the headers."""
+    
+    def __init__(self, tokens_per_minute: int):
+        self.tokens_per_minute = tokens_per_minute
+        self._remaining = float(tokens_per_minute)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._remaining = min(
+            float(self.tokens_per_minute),
+            self._remaining + (now - self._last) * self.tokens_per_minute / 60.0
+        )
+        self._last = now
+    
+    def consume(self, tokens: int) -> bool:
+        """Take tokens from the budget; False if not enough are left."""
+        with self._lock:
+            self._refill()
+            if tokens > self._remaining:
+                return False
+            self._remaining -= tokens
+            return True
+    
+    def headers(self) -> Dict[str, str]:
+        """X-Ratelimit-* headers describing the current budget."""
+        with self._lock:
+            self._refill()
+            missing = self.tokens_per_minute - self._remaining
+            reset = missing * 60.0 / self.tokens_per_minute
+            return {
+                "X-Ratelimit-Limit-Tokens": str(self.tokens_per_minute),
+                "X-Ratelimit-Remaining-Tokens": str(int(self._remaining)),
+                "X-Ratelimit-Reset-Tokens": f"{reset:.3f}s",
+            }
+
+
+class MockLLMServer:
+    """
+    OpenAI-compatible chat completion server running in a background thread.
+    
+    Example:
+        with MockLLMServer(MockServerConfig(latency=0.2, rate_limit_rate=0.05)) as server:
+            client = SwissAIClient(api_key="mock", base_url=server.base_url)
+            print(client.complete("Hallo"))
+    """
+    
+    def __init__(self, config: Optional[MockServerConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Create the server (not started yet).
+        
+        Args:
+            config: Server behaviour; defaults to MockServerConfig()
+            host: Interface to bind
+            port: Port to bind, 0 picks a free port
+        """
+        self.config = config or MockServerConfig()
+        self.stats = MockServerStats()
+        self.budget = _TokenBudget(self.config.tokens_per_minute)
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def base_url(self) -> str:
+        """Base URL to pass to SwissAIClient."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+    
+    def start(self) -> "MockLLMServer":
+        """Serve requests in a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """Stop serving and close the socket."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+    
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def _chance(self, rate: float) -> bool:
+        with self._lock:
+            return rate > 0 and self._random.random() < rate
+    
+    def _count(self, status: Optional[int] = None, **counters):
+        with self._lock:
+            if status is not None:
+                self.stats.status_codes[status] = self.stats.status_codes.get(status, 0) + 1
+            for name, amount in counters.items():
+                setattr(self.stats, name, getattr(self.stats, name) + amount)
+    
+    def sample_latency(self) -> float:
+        """Draw the time to first token from the configured distribution."""
+        config = self.config
+        with self._lock:
+            if config.latency_distribution == "fixed":
+                return config.latency
+            if config.latency_distribution == "uniform":
+                spread = config.latency * config.latency_spread
+                return max(0.0, self._random.uniform(config.latency - spread, config.latency + spread))
+            if config.latency <= 0:
+                return 0.0
+            return self._random.lognormvariate(0.0, config.latency_spread) * config.latency
+    
+    def generate_content(self, messages: List[Dict[str, str]], max_tokens: Optional[int]) -> str:
+        """Persona JSON for persona prompts, a short German answer otherwise."""
+        prompt = "\n".join(message.get("content") or "" for message in messages)
+        with self._lock:
+            if '"banking_persona"' in prompt:
+                content = make_persona_json(self._random, prompt)
+            else:
+                content = " ".join(self._random.sample(CHAT_SENTENCES, 2))
+        
+        if max_tokens is not None and count_text_tokens(content) > max_tokens:
+            # Cut like a real model running into max_tokens
+            while content and count_text_tokens(content) > max_tokens:
+                content = content[:int(len(content) * 0.9)]
+        return content
+    
+    def malform(self, content: str) -> str:
+        """Break a persona JSON the way LLMs typically do."""
+        with self._lock:
+            kind = self._random.choice(MALFORMATIONS)
+        if kind == "fenced":
+            return f"```json\n{content}\n```"
+        if kind == "trailing_text":
+            return f"Hier ist die Persona:\n{content}\nIch hoffe, das hilft!"
+        if kind == "truncated":
+            return content[:len(content) * 2 // 3]
+        return content.replace('"', "'")
+    
+    def _make_handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+            
+            def _send_json(self, status: int, body: Dict[str, Any], headers: Dict[str, str]):
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def _send_error(self, status: int, message: str, error_type: str, headers: Dict[str, str]):
+                self._send_json(status, {"error": {"message": message, "type": error_type, "code": status}}, headers)
+            
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_error(400, "Invalid JSON body", "invalid_request_error", {})
+                    return
+                
+                if self.path.rstrip("/") != "/v1/chat/completions":
+                    self._send_error(404, f"Unknown path {self.path}", "not_found", {})
+                    return
+                server._handle_completion(self, request)
+            
+            def do_GET(self):
+                self._send_error(404, f"Unknown path {self.path}", "not_found", {})
+        
+        return Handler
+    
+    def _handle_completion(self, handler, request: Dict[str, Any]):
+        """Answer one chat completion request."""
+        self._count(requests=1)
+        config = self.config
+        messages = request.get("messages") or []
+        max_tokens = request.get("max_tokens")
+        
+        if self._chance(config.server_error_rate):
+            with self._lock:
+                status = self._random.choice([500, 502, 503])
+            self._count(status, server_errors=1)
+            handler._send_error(status, "Injected server error", "server_error", self.budget.headers())
+            return
+        
+        content = self.generate_content(messages, max_tokens)
+        prompt_tokens = sum(count_text_tokens(m.get("content") or "") + 4 for m in messages)
+        completion_tokens = count_text_tokens(content)
+        total_tokens = prompt_tokens + completion_tokens
+        
+        injected = self._chance(config.rate_limit_rate)
+        if injected or (config.enforce_token_budget and not self.budget.consume(total_tokens)):
+            headers = self.budget.headers()
+            headers["Retry-After"] = "1" if injected else str(max(1, round(parse_seconds(headers["X-Ratelimit-Reset-Tokens"]))))
+            self._count(429, rate_limited=1)
+            handler._send_error(429, "Rate limit exceeded", "rate_limit_error", headers)
+            return
+        
+        if '"banking_persona"' in "".join(m.get("content") or "" for m in messages) and self._chance(config.malformed_rate):
+            content = self.malform(content)
+            self._count(malformed=1)
+        
+        time.sleep(self.sample_latency())
+        
+        completion_id = f"chatcmpl-mock-{time.time_ns()}"
+        created = int(time.time())
+        model = request.get("model", "mock")
+        headers = self.budget.headers()
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": total_tokens}
+        
+        if not request.get("stream"):
+            if config.tokens_per_second > 0:
+                time.sleep(completion_tokens / config.tokens_per_second)
+            self._count(200, completions=1, tokens=total_tokens)
+            handler._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            }, headers)
+            return
+        
+        self._count(200, streams=1, tokens=total_tokens)
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.close_connection = True
+        
+        def send_chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            handler.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            handler.wfile.flush()
+        
+        try:
+            send_chunk({"role": "assistant", "content": ""})
+            for piece in re.findall(r"\S+\s*|\s+", content):
+                if config.tokens_per_second > 0:
+                    time.sleep(count_text_tokens(piece) / config.tokens_per_second)
+                send_chunk({"content": piece})
+            send_chunk({}, finish_reason="stop")
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("Client closed the stream early")
+
+
+def parse_seconds(value: str) -> float:
+    """Seconds of a "1.500s" reset header value."""
+    return float(value.rstrip("s"))
+
+
+def make_persona_json(rng: random.Random, prompt: str = "") -> str:
+    """A plausible persona in the prompt.md schema, consistent with age and gender of the prompt."""
+    age_match = re.search(r"\*\*Alter\*\*:\s*(\d+)", prompt)
+    gender_match = re.search(r"\*\*Geschlecht\*\*:\s*([mw])", prompt)
+    age = int(age_match.group(1)) if age_match else rng.randint(20, 75)
+    gender = gender_match.group(1) if gender_match else rng.choice("mw")
+    first_name = rng.choice(FIRST_NAMES[gender])
+    canton = rng.choice(CANTONS)
+    
+    persona = {
+        "persona_id": f"mock-{rng.randrange(10**8):08d}",
+        "basic_info": {
+            "name": f"{first_name} {rng.choice(LAST_NAMES)}",
+            "age": age,
+            "gender": "männlich" if gender == "m" else "weiblich",
+            "nationality": "Schweiz",
+            "languages": ["Deutsch", rng.choice(["Englisch", "Französisch", "Italienisch"])],
+        },
+        "demographics": {
+            "canton": canton,
+            "municipality_type": rng.choice(["urban", "periurban", "rural"]),
+            "region": canton,
+            "household_size": rng.randint(1, 5),
+            "marital_status": rng.choice(["ledig", "verheiratet", "geschieden"]),
+            "children": rng.random() < 0.5,
+            "housing": rng.choice(["owner", "renter"]),
+        },
+        "professional": {
+            "employment_status": "angestellt" if age < 65 else "pensioniert",
+            "job_title": rng.choice(["Sachbearbeiter/in", "Pflegefachperson", "Informatiker/in", "Lehrperson"]),
+            "industry": rng.choice(["Gesundheitswesen", "Bildung", "IT", "Detailhandel"]),
+            "company_size": rng.choice(["KMU", "Grossunternehmen"]),
+            "employment_percentage": rng.choice([60, 80, 100]),
+            "leadership_position": rng.random() < 0.2,
+            "work_location": canton,
+            "tenure_years": rng.randint(0, 25),
+        },
+        "financial": {
+            "annual_gross_income_chf": rng.randrange(45_000, 180_000, 1_000),
+            "disposable_income_category": rng.choice(["< 60k", "60k-100k", ">100k"]),
+            "net_worth_category": rng.choice(["< 10k", "10k-100k", ">100k"]),
+            "planned_major_expenses": rng.random() < 0.3,
+            "financial_experience": rng.choice(["Einsteiger", "Fortgeschritten", "Experte"]),
+        },
+        "banking_persona": {
+            "risk_tolerance": rng.choice(["konservativ", "ausgewogen", "risikofreudig"]),
+            "investment_interest": rng.choice(["niedrig", "mittel", "hoch"]),
+            "banking_preferences": {
+                "channel_preference": rng.choice(["online", "mobile", "filiale", "hybrid"]),
+                "service_level": rng.choice(["selbständig", "beratung", "premium"]),
+                "product_complexity": rng.choice(["einfach", "standard", "komplex"]),
+            },
+            "financial_goals": ["Altersvorsorge", "Notgroschen aufbauen"],
+            "pain_points": ["Intransparente Gebühren"],
+            "banking_frequency": rng.choice(["täglich", "wöchentlich", "monatlich"]),
+        },
+        "personality": {
+            "traits": ["zuverlässig", "pragmatisch"],
+            "values": ["Sicherheit", "Familie"],
+            "lifestyle": "Ausgeglichen zwischen Arbeit und Freizeit",
+            "technology_affinity": rng.choice(["niedrig", "mittel", "hoch"]),
+            "decision_making_style": rng.choice(["spontan", "überlegt", "analytisch"]),
+        },
+        "narrative": {
+            "life_story": f"{first_name} ist im Kanton {canton} aufgewachsen und lebt noch heute dort.",
+            "current_situation": "Beruflich etabliert und auf der Suche nach einer passenden Anlagestrategie.",
+            "future_aspirations": "Finanzielle Unabhängigkeit im Alter.",
+            "typical_day": "Arbeit am Vormittag, am Abend Sport oder Zeit mit Freunden.",
+        },
+        "banking_scenarios": {
+            "likely_products": ["Privatkonto", "Säule 3a"],
+            "service_triggers": ["Lohnerhöhung", "Umzug"],
+            "communication_preferences": ["App-Benachrichtigung", "E-Mail"],
+            "loyalty_factors": ["Faire Gebühren", "Gute App"],
+        },
+    }
+    return json.dumps(persona, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the Swiss AI chat completion endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="Median seconds until the first token")
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-spread", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of injected 429 responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of injected 5xx responses")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of broken persona JSON")
+    parser.add_argument("--tokens-per-minute", type=int, default=100_000)
+    parser.add_argument("--no-budget", action="store_true", help="Report but do not enforce the token budget")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    
+    config = MockServerConfig(
+        latency=args.latency,
+        latency_distribution=args.latency_distribution,
+        latency_spread=args.latency_spread,
+        tokens_per_second=args.tokens_per_second,
+        rate_limit_rate=args.rate_limit_rate,
+        server_error_rate=args.error_rate,
+        malformed_rate=args.malformed_rate,
+        tokens_per_minute=args.tokens_per_minute,
+        enforce_token_budget=not args.no_budget,
+        seed=args.seed,
+    )
+    server = MockLLMServer(config, host=args.host, port=args.port)
+    print(f"🧪 Mock LLM server listening on {server.base_url}")
+    print(f"   SwissAIClient(api_key='mock', base_url='{server.base_url}')")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping mock server")
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
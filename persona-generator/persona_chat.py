@@ -3,6 +3,8 @@ import json
 import os
 from datetime import datetime
 from llm import SwissAIClient
+from profiling import profiled
+from data import read_cached
 import glob
 from dotenv import load_dotenv
 
@@ -270,54 +272,51 @@ def load_all_personas():
     # Load personas from individual files
     for filename in glob.glob(os.path.join(personas_dir, "persona_*.json")):
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                persona_data = json.load(f)
-                if isinstance(persona_data, dict) and 'persona' in persona_data:
-                    personas.append({
-                        'filename': os.path.basename(filename),
-                        'data': persona_data
-                    })
+            persona_data = read_cached(filename, json.load, "batch_files")
+            if isinstance(persona_data, dict) and 'persona' in persona_data:
+                personas.append({
+                    'filename': os.path.basename(filename),
+                    'data': persona_data
+                })
         except Exception as e:
             st.sidebar.warning(f"Could not load {filename}: {e}")
     
     # Load personas from batch files (new format with metadata)
     for filename in glob.glob(os.path.join(personas_dir, "personas_batch_*.json")):
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                batch_file = json.load(f)
-                
-                # Handle new format with metadata and personas array
-                if isinstance(batch_file, dict) and 'personas' in batch_file:
-                    personas_list = batch_file['personas']
-                    for i, persona_data in enumerate(personas_list):
-                        if isinstance(persona_data, dict) and 'persona' in persona_data:
-                            personas.append({
-                                'filename': f"{os.path.basename(filename)}_persona_{i+1}",
-                                'data': persona_data
-                            })
-                # Handle old format (direct array)
-                elif isinstance(batch_file, list):
-                    for i, persona_data in enumerate(batch_file):
-                        if isinstance(persona_data, dict) and 'persona' in persona_data:
-                            personas.append({
-                                'filename': f"{os.path.basename(filename)}_persona_{i+1}",
-                                'data': persona_data
-                            })
+            batch_file = read_cached(filename, json.load, "batch_files")
+            
+            # Handle new format with metadata and personas array
+            if isinstance(batch_file, dict) and 'personas' in batch_file:
+                personas_list = batch_file['personas']
+                for i, persona_data in enumerate(personas_list):
+                    if isinstance(persona_data, dict) and 'persona' in persona_data:
+                        personas.append({
+                            'filename': f"{os.path.basename(filename)}_persona_{i+1}",
+                            'data': persona_data
+                        })
+            # Handle old format (direct array)
+            elif isinstance(batch_file, list):
+                for i, persona_data in enumerate(batch_file):
+                    if isinstance(persona_data, dict) and 'persona' in persona_data:
+                        personas.append({
+                            'filename': f"{os.path.basename(filename)}_persona_{i+1}",
+                            'data': persona_data
+                        })
         except Exception as e:
             st.sidebar.warning(f"Could not load batch {filename}: {e}")
     
     # Also load from old batch files format
     for filename in glob.glob(os.path.join(personas_dir, "batch_*.json")):
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                batch_data = json.load(f)
-                if isinstance(batch_data, list):
-                    for i, persona_data in enumerate(batch_data):
-                        if isinstance(persona_data, dict) and 'persona' in persona_data:
-                            personas.append({
-                                'filename': f"{os.path.basename(filename)}_persona_{i+1}",
-                                'data': persona_data
-                            })
+            batch_data = read_cached(filename, json.load, "batch_files")
+            if isinstance(batch_data, list):
+                for i, persona_data in enumerate(batch_data):
+                    if isinstance(persona_data, dict) and 'persona' in persona_data:
+                        personas.append({
+                            'filename': f"{os.path.basename(filename)}_persona_{i+1}",
+                            'data': persona_data
+                        })
         except Exception as e:
             st.sidebar.warning(f"Could not load batch {filename}: {e}")
     
@@ -485,6 +484,7 @@ def display_persona_info(persona_data):
                 </div>
                 """, unsafe_allow_html=True)
 
+@profiled("persona_chat.persona_chat_page")
 def persona_chat_page():
     """Main persona chat page"""
     # Load custom CSS
@@ -667,7 +667,7 @@ def persona_chat_page():
                         conversation_context
                     )
                     
-                    client = SwissAIClient(api_key=api_key)
+                    client = SwissAIClient(api_key=api_key, caller="persona_chat")
                     response = client.complete(
                         prompt=user_input,
                         system_prompt=system_prompt,
@@ -6,10 +6,12 @@ from datetime import datetime
 import plotly.express as px
 import plotly.graph_objects as go
 from ui_components import load_custom_css, create_header, create_section_header, create_info_box, create_persona_card, create_metric_card
+from profiling import profiled
+from data import read_cached
 
-def load_saved_batches():
+def load_saved_batches(personas_dir=None):
     """Load all saved persona batches from the generated_personas directory"""
-    personas_dir = Path(__file__).parent / "generated_personas"
+    personas_dir = Path(personas_dir) if personas_dir else Path(__file__).parent / "generated_personas"
     
     if not personas_dir.exists():
         return []
@@ -17,13 +19,14 @@ def load_saved_batches():
     batches = []
     for file_path in personas_dir.glob("*.json"):
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                batch_data = json.load(f)
+            # Parsed once per file version; large libraries otherwise re-parse on every rerun
+            batch_data = read_cached(file_path, json.load, "batch_files")
             
-            # Add file info to metadata
-            batch_data['metadata']['filepath'] = str(file_path)
-            batch_data['metadata']['filename'] = file_path.name
-            batches.append(batch_data)
+            # Add file info to a copy of the metadata; the cached batch is shared
+            batches.append({
+                **batch_data,
+                'metadata': {**batch_data['metadata'], 'filepath': str(file_path), 'filename': file_path.name}
+            })
         except Exception as e:
             st.error(f"Error loading {file_path.name}: {str(e)}")
     
@@ -80,6 +83,11 @@ def create_personas_dataframe(personas):
     
     return pd.DataFrame(data)
 
+def search_personas(df, search_term):
+    """Rows of the personas DataFrame where any column contains the search term"""
+    mask = df.astype(str).apply(lambda x: x.str.contains(search_term, case=False, na=False)).any(axis=1)
+    return df[mask]
+
 def create_demographics_charts(df):
     """Create demographic analysis charts"""
     charts = {}
@@ -143,6 +151,7 @@ def create_banking_charts(df):
     
     return charts
 
+@profiled("persona_library.show")
 def show():
     """Show the persona library page"""
     
@@ -228,8 +237,7 @@ def show():
                 
                 # Filter DataFrame based on search
                 if search_term:
-                    mask = df.astype(str).apply(lambda x: x.str.contains(search_term, case=False, na=False)).any(axis=1)
-                    filtered_df = df[mask]
+                    filtered_df = search_personas(df, search_term)
                 else:
                     filtered_df = df
                 
@@ -0,0 +1,216 @@
+"""
+Opt-in profiling of persona generation and page renders.
+
+Set SWISS_AI_PROFILE to turn it on:
+    SWISS_AI_PROFILE=1 (or "cprofile")  deterministic cProfile of the calling thread,
+                                        plus a stack sampler over all threads
+    SWISS_AI_PROFILE=sample             stack sampler only (low overhead)
+
+Every profiled call writes its artifacts to SWISS_AI_PROFILE_DIR (default
+.cache/profiles/): <name>-<timestamp>-<pid>-<n>.prof (pstats, deterministic
+mode only) and .collapsed (one "frame;frame;frame count" line per stack, the
+input format of flamegraph.pl, speedscope and similar viewers).
+
+Profiled calls nested in another profiled call (generate_persona inside a
+batch, or inside a page render) are covered by the outer profile and do not
+start their own.
+
+Usage:
+    python profiling.py .cache/profiles/single_persona.show-20250101-120000-123-1.prof
+"""
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import argparse
+import itertools
+import functools
+import threading
+from pathlib import Path
+from collections import Counter
+from datetime import datetime
+from typing import Optional, Dict, Callable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DIR = Path(__file__).parent / ".cache" / "profiles"
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+DETERMINISTIC = "cprofile"
+SAMPLING = "sample"
+
+# Stacks of other threads are only sampled when they run code from this directory
+_PACKAGE_DIR = str(Path(__file__).parent.resolve())
+
+# Only one profile runs at a time: cProfile cannot be enabled twice, and the
+# sampler of the outer profile already sees the work of nested calls.
+_active_lock = threading.Lock()
+_run_counter = itertools.count(1)
+
+
+def get_profile_mode() -> Optional[str]:
+    """
+    Read the profiling mode from SWISS_AI_PROFILE.
+    
+    Returns:
+        DETERMINISTIC, SAMPLING, or None if profiling is off
+    """
+    setting = os.getenv("SWISS_AI_PROFILE", "").strip().lower()
+    if not setting or setting in ("0", "false", "no"):
+        return None
+    if setting == SAMPLING:
+        return SAMPLING
+    if setting not in ("1", "true", "yes", DETERMINISTIC, "deterministic"):
+        logger.warning(f"Unknown SWISS_AI_PROFILE value {setting!r}, using {DETERMINISTIC}")
+    return DETERMINISTIC
+
+
+def get_profile_dir() -> Path:
+    """Directory profile artifacts are written to (SWISS_AI_PROFILE_DIR)."""
+    setting = os.getenv("SWISS_AI_PROFILE_DIR", "").strip()
+    return Path(setting) if setting else DEFAULT_PROFILE_DIR
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{Path(code.co_filename).name}:{code.co_name}".replace(";", ":").replace(" ", "_")
+
+
+class StackSampler:
+    """
+    Background thread that periodically records the Python stacks of all threads.
+    
+    Stacks are aggregated into collapsed form ("thread;outer;...;inner" -> count).
+    The thread that started the sampler is always recorded; other threads only
+    while they execute code from this package, which keeps Streamlit's idle
+    server threads out of the profile.
+    """
+    
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._target_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+    
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                in_package = ident == self._target_thread
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    in_package = in_package or frame.f_code.co_filename.startswith(_PACKAGE_DIR)
+                    frame = frame.f_back
+                if in_package:
+                    thread_name = names.get(ident, str(ident)).replace(";", ":").replace(" ", "_")
+                    self.stacks[";".join([thread_name] + stack[::-1])] += 1
+            self.samples += 1
+    
+    def write_collapsed(self, path: Path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfileRun:
+    """One profiled call: starts the profilers and writes the artifacts when done."""
+    
+    def __init__(self, name: str, mode: str, output_dir: Path, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.name = name
+        self.mode = mode
+        self.output_dir = Path(output_dir)
+        self.sampler = StackSampler(interval)
+        self.profiler = cProfile.Profile() if mode == DETERMINISTIC else None
+        self.artifacts: Dict[str, Path] = {}
+        self.wall_time = 0.0
+    
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self.sampler.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.sampler.stop()
+        self.wall_time = time.perf_counter() - self._started
+        try:
+            self._write()
+        except OSError as e:
+            logger.warning(f"Could not write profile for {self.name}: {e}")
+        return False
+    
+    def _write(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        stem = f"{self.name}-{timestamp}-{os.getpid()}-{next(_run_counter)}"
+        
+        if self.profiler is not None:
+            self.artifacts["pstats"] = self.output_dir / f"{stem}.prof"
+            self.profiler.dump_stats(str(self.artifacts["pstats"]))
+        self.artifacts["collapsed"] = self.output_dir / f"{stem}.collapsed"
+        self.sampler.write_collapsed(self.artifacts["collapsed"])
+        
+        logger.info(
+            f"Profiled {self.name} in {self.wall_time:.2f}s ({self.sampler.samples} samples): "
+            + ", ".join(str(p) for p in self.artifacts.values())
+        )
+
+
+def profiled(name: str) -> Callable:
+    """
+    Decorator that profiles each call of the function when SWISS_AI_PROFILE is set.
+    
+    The setting is read on every call, so profiling can be switched without a
+    restart. When it is off the wrapper only costs an environment lookup.
+    
+    Args:
+        name: Name used for the artifact files
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            mode = get_profile_mode()
+            if mode is None or not _active_lock.acquire(blocking=False):
+                return func(*args, **kwargs)
+            try:
+                interval = float(os.getenv("SWISS_AI_PROFILE_INTERVAL", DEFAULT_SAMPLE_INTERVAL))
+                with ProfileRun(name, mode, get_profile_dir(), interval):
+                    return func(*args, **kwargs)
+            finally:
+                _active_lock.release()
+        return wrapper
+    return decorator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the most expensive functions of a .prof artifact")
+    parser.add_argument("profile", type=Path, help="pstats file written by a profiled run")
+    parser.add_argument("--sort", default="cumulative", help="pstats sort key (cumulative, tottime, calls, ...)")
+    parser.add_argument("--limit", type=int, default=30, help="Number of functions to print")
+    args = parser.parse_args()
+    
+    pstats.Stats(str(args.profile)).strip_dirs().sort_stats(args.sort).print_stats(args.limit)
+
+
+if __name__ == "__main__":
+    main()
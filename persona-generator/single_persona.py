@@ -1,22 +1,25 @@
 import streamlit as st
 import pandas as pd
 from pathlib import Path
-from data import load_demographie_csv
+from demographic_sampler import render_statistical_data
+from filter_spec import SIDEBAR_BUCKETS, spec_from_sidebar
+from data import load_demographic_index, load_demographic_rows, load_demographic_store, read_cached
 from llm import SwissAIClient
+from profiling import profiled
+import tracing
 from ui_components import load_custom_css, create_header, create_section_header, create_info_box, create_persona_card
 import random
 import json
+import re
 
 def load_prompt_files():
     """Load system and prompt markdown files"""
     system_path = Path(__file__).parent / "system.md"
     prompt_path = Path(__file__).parent / "prompt.md"
     
-    with open(system_path, 'r', encoding='utf-8') as f:
-        system_prompt = f.read()
-    
-    with open(prompt_path, 'r', encoding='utf-8') as f:
-        prompt_template = f.read()
+    # Re-read only when the files change
+    system_prompt = read_cached(system_path, lambda f: f.read(), "prompts")
+    prompt_template = read_cached(prompt_path, lambda f: f.read(), "prompts")
     
     return system_prompt, prompt_template
 
@@ -24,102 +27,132 @@ def format_person_data(person_row, additional_params):
     """Format person data for display and LLM input"""
     person_dict = person_row.to_dict()
     
-    # Create a formatted string for the statistical data
-    formatted_data = []
-    for key, value in person_dict.items():
-        if pd.notna(value):  # Only include non-null values
-            formatted_data.append(f"{key}: {value}")
-    
-    statistical_data_str = "\n".join(formatted_data)
+    # Create a formatted string for the statistical data (non-null values only)
+    statistical_data_str = render_statistical_data(person_dict)
     
     # Combine with additional parameters
     combined_dict = {**person_dict, **additional_params}
     
     return statistical_data_str, combined_dict
 
-def generate_persona(additional_params, csv_filters, debug_mode=False):
-    """Generate a new persona by selecting a random person and calling the LLM"""
-    try:
-        # Load data
-        df = load_demographie_csv()
-        
-        # Apply CSV filters if any
-        filtered_df = df.copy()
-        for key, value in csv_filters.items():
-            if value is not None and value != "Alle":
-                if key in ['alter_min', 'alter_max']:
-                    continue  # Handle age range separately
-                elif key == 'alter_range':
-                    if value != "Alle":
-                        if value == "18-25":
-                            filtered_df = filtered_df[(filtered_df['alter'] >= 18) & (filtered_df['alter'] <= 25)]
-                        elif value == "26-35":
-                            filtered_df = filtered_df[(filtered_df['alter'] >= 26) & (filtered_df['alter'] <= 35)]
-                        elif value == "36-45":
-                            filtered_df = filtered_df[(filtered_df['alter'] >= 36) & (filtered_df['alter'] <= 45)]
-                        elif value == "46-65":
-                            filtered_df = filtered_df[(filtered_df['alter'] >= 46) & (filtered_df['alter'] <= 65)]
-                        elif value == "65+":
-                            filtered_df = filtered_df[filtered_df['alter'] > 65]
-                elif key == 'geschlecht':
-                    if value == "Männlich":
-                        filtered_df = filtered_df[filtered_df['weiblich'] == 0]
-                    elif value == "Weiblich":
-                        filtered_df = filtered_df[filtered_df['weiblich'] == 1]
-                elif key == 'bruttojahr_range':
-                    if value == "< 60k":
-                        filtered_df = filtered_df[filtered_df['bruttojahr'] < 60000]
-                    elif value == "60k-100k":
-                        filtered_df = filtered_df[(filtered_df['bruttojahr'] >= 60000) & (filtered_df['bruttojahr'] <= 100000)]
-                    elif value == "> 100k":
-                        filtered_df = filtered_df[filtered_df['bruttojahr'] > 100000]
-                else:
-                    # Direct column matching
-                    if key in filtered_df.columns:
-                        filtered_df = filtered_df[filtered_df[key] == value]
-        
-        if len(filtered_df) == 0:
+def apply_csv_filters(df, csv_filters):
+    """Apply the CSV filters from the sidebar to the demographic data"""
+    # Boolean masks only, so the shared data frame is never modified
+    return spec_from_sidebar(csv_filters).apply(df)
+
+def build_persona_prompt(prompt_template, statistical_data_str, combined_dict, additional_params):
+    """Fill the persona prompt template with the selected person's data"""
+    # Extract values from combined data for template replacement
+    alter = combined_dict.get('alter', 'N/A')
+    geschlecht = 'w' if combined_dict.get('weiblich', 0) == 1 else 'm'
+    vermoegen = additional_params.get('vermoegen', 'N/A')
+    verfuegbares_einkommen = additional_params.get('verfuegbares_einkommen', 'N/A')
+    grosse_ausgaben = additional_params.get('grosse_ausgaben', 'N/A')
+    beruf = combined_dict.get('beruf', 'N/A')
+    kinder = combined_dict.get('kinder', 0)
+    eigentum = additional_params.get('eigentum', 'N/A')
+    single = combined_dict.get('ledig', 0)
+    finanz_erfahrung = additional_params.get('finanz_erfahrung', 'N/A')
+    
+    # Replace all placeholders in prompt template
+    return prompt_template.format(
+        statistical_data=statistical_data_str,
+        alter=alter,
+        geschlecht=geschlecht,
+        vermoegen=vermoegen,
+        verfuegbares_einkommen=verfuegbares_einkommen,
+        grosse_ausgaben=grosse_ausgaben,
+        beruf=beruf,
+        kinder=kinder,
+        eigentum=eigentum,
+        single=single,
+        finanz_erfahrung=finanz_erfahrung
+    )
+
+def clean_persona_response(persona_response):
+    """Strip markdown fences and surrounding text from an LLM response, keeping the JSON object"""
+    # Clean up response - remove potential markdown formatting and whitespace
+    persona_clean = persona_response.strip()
+    
+    # Remove markdown code blocks
+    if persona_clean.startswith("```json"):
+        persona_clean = persona_clean[7:]
+    elif persona_clean.startswith("```"):
+        persona_clean = persona_clean[3:]
+    if persona_clean.endswith("```"):
+        persona_clean = persona_clean[:-3]
+    
+    # Clean whitespace and newlines
+    persona_clean = persona_clean.strip()
+    
+    # Try to find JSON object start if response has extra text
+    json_start = persona_clean.find('{')
+    json_end = persona_clean.rfind('}')
+    
+    if json_start != -1 and json_end != -1 and json_end > json_start:
+        persona_clean = persona_clean[json_start:json_end+1]
+    
+    return persona_clean
+
+def repair_persona_json(persona_clean):
+    """Fix common JSON issues (comments, trailing commas); raises if the result is still invalid"""
+    # Remove JavaScript-style comments (// comment)
+    fixed_json = re.sub(r'//.*$', '', persona_clean, flags=re.MULTILINE)
+    
+    # Remove trailing commas
+    fixed_json = re.sub(r',\s*}', '}', fixed_json)
+    fixed_json = re.sub(r',\s*]', ']', fixed_json)
+    
+    # Remove extra whitespace
+    fixed_json = re.sub(r'\n\s*\n', '\n', fixed_json)
+    
+    json.loads(fixed_json)
+    return fixed_json
+
+def sample_person_data(additional_params, csv_filters):
+    """Draw one random person matching the filters; (None, None) if nobody matches"""
+    with tracing.span("demographic_sampling") as sampling_span:
+        # Apply CSV filters if any (bitmap index, row ids cached per filter combination)
+        index = load_demographic_index()
+        row_ids = index.row_ids(csv_filters)
+        sampling_span.set_attribute("matching_rows", len(row_ids))
+        
+        if len(row_ids) == 0:
             st.error("Keine Personen mit den gewählten Filtern gefunden. Bitte lockern Sie die Filter.")
             return None, None
             
-        st.info(f"Filter angewendet: {len(filtered_df)} von {len(df)} Personen gefunden")
+        st.info(f"Filter angewendet: {len(row_ids)} von {index.rows} Personen gefunden")
         
-        # Select a random person from filtered data
-        random_index = random.randint(0, len(filtered_df) - 1)
-        selected_person = filtered_df.iloc[random_index]
+        # Select a random person from filtered data; only its row is read in full
+        random_index = random.randint(0, len(row_ids) - 1)
+        selected_person = load_demographic_rows([row_ids[random_index]]).iloc[0]
         
         # Format person data
-        statistical_data_str, combined_dict = format_person_data(selected_person, additional_params)
-        
-        # Load prompts
-        system_prompt, prompt_template = load_prompt_files()
-        
-        # Extract values from combined data for template replacement
-        alter = combined_dict.get('alter', 'N/A')
-        geschlecht = 'w' if combined_dict.get('weiblich', 0) == 1 else 'm'
-        vermoegen = additional_params.get('vermoegen', 'N/A')
-        verfuegbares_einkommen = additional_params.get('verfuegbares_einkommen', 'N/A')
-        grosse_ausgaben = additional_params.get('grosse_ausgaben', 'N/A')
-        beruf = combined_dict.get('beruf', 'N/A')
-        kinder = combined_dict.get('kinder', 0)
-        eigentum = additional_params.get('eigentum', 'N/A')
-        single = combined_dict.get('ledig', 0)
-        finanz_erfahrung = additional_params.get('finanz_erfahrung', 'N/A')
+        return format_person_data(selected_person, additional_params)
+
+@profiled("generate_persona")
+def generate_persona(additional_params, csv_filters, debug_mode=False, sampled_person=None):
+    """
+    Generate a new persona by selecting a random person and calling the LLM
+    
+    Batch generation passes a sampled_person drawn up front (see demographic_sampler);
+    csv_filters are then not applied again.
+    """
+    try:
+        if sampled_person is not None:
+            statistical_data_str = sampled_person.statistical_data
+            combined_dict = {**sampled_person.person, **additional_params}
+        else:
+            statistical_data_str, combined_dict = sample_person_data(additional_params, csv_filters)
+            if combined_dict is None:
+                return None, None
         
-        # Replace all placeholders in prompt template
-        full_prompt = prompt_template.format(
-            statistical_data=statistical_data_str,
-            alter=alter,
-            geschlecht=geschlecht,
-            vermoegen=vermoegen,
-            verfuegbares_einkommen=verfuegbares_einkommen,
-            grosse_ausgaben=grosse_ausgaben,
-            beruf=beruf,
-            kinder=kinder,
-            eigentum=eigentum,
-            single=single,
-            finanz_erfahrung=finanz_erfahrung
-        )
+        with tracing.span("prompt_build") as prompt_span:
+            # Load prompts
+            system_prompt, prompt_template = load_prompt_files()
+            
+            full_prompt = build_persona_prompt(prompt_template, statistical_data_str, combined_dict, additional_params)
+            prompt_span.set_attribute("prompt_chars", len(system_prompt) + len(full_prompt))
         
         # Show debug info if enabled
         if debug_mode:
@@ -130,7 +163,14 @@ def generate_persona(additional_params, csv_filters, debug_mode=False):
                 st.code(full_prompt, language="text")
         
         # Initialize LLM client
-        client = SwissAIClient()
+        client = SwissAIClient(caller="generate_persona")
+        
+        if debug_mode:
+            estimate = client.estimate_request_tokens(full_prompt, system_prompt, max_tokens=3000)
+            st.caption(
+                f"Geschätzte Tokens: {estimate.prompt_tokens} Prompt + "
+                f"{estimate.completion_tokens} Antwort = {estimate.total}"
+            )
         
         # Generate persona
         with st.spinner("Generating persona... This may take a moment."):
@@ -141,88 +181,148 @@ def generate_persona(additional_params, csv_filters, debug_mode=False):
                 max_tokens=3000
             )
             
-            # Clean up response - remove potential markdown formatting and whitespace
-            persona_clean = persona_response.strip()
-            
-            # Remove markdown code blocks
-            if persona_clean.startswith("```json"):
-                persona_clean = persona_clean[7:]
-            elif persona_clean.startswith("```"):
-                persona_clean = persona_clean[3:]
-            if persona_clean.endswith("```"):
-                persona_clean = persona_clean[:-3]
-            
-            # Clean whitespace and newlines
-            persona_clean = persona_clean.strip()
-            
-            # Try to find JSON object start if response has extra text
-            json_start = persona_clean.find('{')
-            json_end = persona_clean.rfind('}')
-            
-            if json_start != -1 and json_end != -1 and json_end > json_start:
-                persona_clean = persona_clean[json_start:json_end+1]
-            
-            # Validate JSON
-            try:
-                parsed_json = json.loads(persona_clean)
-                st.success("✅ Valid JSON generated!")
-                return persona_clean, combined_dict
-            except json.JSONDecodeError as e:
-                st.error(f"❌ LLM returned invalid JSON: {str(e)}")
+            with tracing.span("json_parse") as parse_span:
+                persona_clean = clean_persona_response(persona_response)
                 
-                # Show debugging information (always show if debug mode, or in expander otherwise)
-                if debug_mode:
-                    st.text("Raw LLM response:")
-                    st.code(persona_response, language="text")
-                    st.text("Cleaned response:")
-                    st.code(persona_clean, language="text")
-                    st.text(f"JSON error at position {e.pos}: {e.msg}")
-                else:
-                    with st.expander("🔍 Debug Information"):
+                # Validate JSON
+                try:
+                    parsed_json = json.loads(persona_clean)
+                    parse_span.set_attribute("repaired", False)
+                    st.success("✅ Valid JSON generated!")
+                    return persona_clean, combined_dict
+                except json.JSONDecodeError as e:
+                    st.error(f"❌ LLM returned invalid JSON: {str(e)}")
+                    
+                    # Show debugging information (always show if debug mode, or in expander otherwise)
+                    if debug_mode:
                         st.text("Raw LLM response:")
                         st.code(persona_response, language="text")
                         st.text("Cleaned response:")
                         st.code(persona_clean, language="text")
                         st.text(f"JSON error at position {e.pos}: {e.msg}")
-                
-                # Try to fix common JSON issues
-                try:
-                    import re
+                    else:
+                        with st.expander("🔍 Debug Information"):
+                            st.text("Raw LLM response:")
+                            st.code(persona_response, language="text")
+                            st.text("Cleaned response:")
+                            st.code(persona_clean, language="text")
+                            st.text(f"JSON error at position {e.pos}: {e.msg}")
                     
-                    # Remove JavaScript-style comments (// comment)
-                    fixed_json = re.sub(r'//.*$', '', persona_clean, flags=re.MULTILINE)
-                    
-                    # Remove trailing commas
-                    fixed_json = re.sub(r',\s*}', '}', fixed_json)
-                    fixed_json = re.sub(r',\s*]', ']', fixed_json)
-                    
-                    # Remove extra whitespace
-                    fixed_json = re.sub(r'\n\s*\n', '\n', fixed_json)
-                    
-                    parsed_json = json.loads(fixed_json)
-                    persona_clean = fixed_json
-                    st.warning("⚠️ Auto-fixed JSON formatting issues (removed comments)")
-                    return persona_clean, combined_dict
-                except Exception as fix_error:
-                    if debug_mode:
-                        st.error(f"Failed to auto-fix JSON: {fix_error}")
-                    return None, None
+                    # Try to fix common JSON issues
+                    try:
+                        persona_clean = repair_persona_json(persona_clean)
+                        parse_span.set_attribute("repaired", True)
+                        st.warning("⚠️ Auto-fixed JSON formatting issues (removed comments)")
+                        return persona_clean, combined_dict
+                    except Exception as fix_error:
+                        parse_span.set_attribute("repair_error", str(fix_error))
+                        if debug_mode:
+                            st.error(f"Failed to auto-fix JSON: {fix_error}")
+                        return None, None
         
     except Exception as e:
         st.error(f"Error generating persona: {str(e)}")
         return None, None
 
-# Load data once for filter options
-@st.cache_data
+# Filter options are the sorted dictionaries of the column store
 def get_filter_options():
-    df = load_demographie_csv()
+    store = load_demographic_store()
     return {
-        'kantone': sorted([k for k in df['kanton'].unique() if pd.notna(k)]),
-        'ausbildung': sorted([a for a in df['ausbildung'].unique() if pd.notna(a)]),
-        'beruf': sorted([b for b in df['beruf'].unique() if pd.notna(b)]),
-        'sprachgebiet': sorted([s for s in df['sprachgebiet'].unique() if pd.notna(s)])
+        'kantone': list(store.dictionary('kanton')),
+        'ausbildung': list(store.dictionary('ausbildung')),
+        'beruf': list(store.dictionary('beruf')),
+        'sprachgebiet': list(store.dictionary('sprachgebiet'))
     }
 
+# Demographic filter widgets: (widget key, filter key, label, help, {option label: filter value} or None)
+DEMOGRAPHIC_FILTER_WIDGETS = [
+    ("alter", 'alter_range', "Altersgruppe", "Wählen Sie eine Altersgruppe", None),
+    ("geschlecht", 'geschlecht', "Geschlecht", "Filtern nach Geschlecht", None),
+    ("kanton", 'kanton', "Kanton", "Filtern nach Kanton", None),
+    ("sprachgebiet", 'sprachgebiet', "Sprachgebiet", "Filtern nach Sprachgebiet", None),
+    ("bruttojahr", 'bruttojahr_range', "Bruttojahreseinkommen", "Filtern nach Einkommensbereich", None),
+    ("ausbildung", 'ausbildung', "Ausbildung", "Filtern nach Ausbildung", None),
+    ("erwerbstaetig", 'arbeit', "Erwerbstätigkeit", "Filtern nach Erwerbsstatus", {"Erwerbstätig": 1, "Nicht erwerbstätig": 0}),
+    ("kinder", 'kinder', "Kinder im Haushalt", "Filtern nach Kindern im Haushalt", {"Mit Kindern": 1, "Ohne Kinder": 0}),
+]
+
+def demographic_filter_options(filter_options):
+    """Selectbox options per widget key"""
+    return {
+        "alter": ["Alle", "18-25", "26-35", "36-45", "46-65", "65+"],
+        "geschlecht": ["Alle", "Männlich", "Weiblich"],
+        "kanton": ["Alle"] + filter_options['kantone'],
+        "sprachgebiet": ["Alle"] + filter_options['sprachgebiet'],
+        "bruttojahr": ["Alle", "< 60k", "60k-100k", "> 100k"],
+        "ausbildung": ["Alle"] + filter_options['ausbildung'][:10],  # Limit to first 10 for UI
+        "erwerbstaetig": ["Alle", "Erwerbstätig", "Nicht erwerbstätig"],
+        "kinder": ["Alle", "Mit Kindern", "Ohne Kinder"],
+    }
+
+def collect_csv_filters(selection):
+    """Build the CSV filter dict from the selected option label per widget key"""
+    csv_filters = {}
+    for widget, filter_key, _, _, values in DEMOGRAPHIC_FILTER_WIDGETS:
+        label = selection.get(widget, "Alle")
+        if values is not None:
+            csv_filters[filter_key] = values.get(label)
+        elif filter_key in SIDEBAR_BUCKETS:
+            # Bucket filters keep "Alle", as the sidebar always passed them
+            csv_filters[filter_key] = label
+        else:
+            csv_filters[filter_key] = label if label != "Alle" else None
+    return csv_filters
+
+def format_facet_option(label, count):
+    """Selectbox label with the number of matching persons"""
+    if count == 0:
+        return f"{label} (0 – keine Personen)"
+    return f"{label} ({count:,})".replace(",", "'")
+
+def show_demographic_filters(filter_options, key_prefix):
+    """
+    Show the demographic filter selectboxes with live person counts per option.
+    
+    The counts of each filter take all other current selections into account
+    (facet counts from the bitmap index), so empty combinations are visible
+    before a generation is started.
+    
+    Returns:
+        (csv_filters, number of matching persons)
+    """
+    index = load_demographic_index()
+    options = demographic_filter_options(filter_options)
+    # Widget values of this run are already in the session state, before the widgets are drawn
+    selection = {widget: st.session_state.get(f"{key_prefix}{widget}", "Alle") for widget in options}
+    facets = index.facet_counts(collect_csv_filters(selection))
+    
+    for widget, filter_key, label, help_text, values in DEMOGRAPHIC_FILTER_WIDGETS:
+        counts = facets.get(filter_key)
+        
+        def format_option(option, counts=counts, values=values):
+            if counts is None:
+                return option
+            value = option if option == "Alle" or values is None else values[option]
+            return format_facet_option(option, counts.get(value, 0))
+        
+        selection[widget] = st.selectbox(
+            label,
+            options=options[widget],
+            index=0,
+            format_func=format_option,
+            help=help_text,
+            key=f"{key_prefix}{widget}"
+        )
+    
+    csv_filters = collect_csv_filters(selection)
+    matching_persons = len(index.row_ids(csv_filters))
+    if matching_persons == 0:
+        st.warning("Keine Personen mit den gewählten Filtern gefunden. Bitte lockern Sie die Filter.")
+    else:
+        st.caption(f"👥 {matching_persons:,} passende Personen".replace(",", "'"))
+    return csv_filters, matching_persons
+
+@profiled("single_persona.show")
 def show():
     """Show the single persona generation page"""
     
@@ -257,73 +357,7 @@ def show():
         # Demographics filters from CSV
         st.markdown("**👥 Demografische Filter:**")
         
-        alter_range = st.selectbox(
-            "Altersgruppe",
-            options=["Alle", "18-25", "26-35", "36-45", "46-65", "65+"],
-            index=0,
-            help="Wählen Sie eine Altersgruppe"
-        )
-        
-        geschlecht_filter = st.selectbox(
-            "Geschlecht",
-            options=["Alle", "Männlich", "Weiblich"],
-            index=0,
-            help="Filtern nach Geschlecht"
-        )
-        
-        kanton_filter = st.selectbox(
-            "Kanton",
-            options=["Alle"] + filter_options['kantone'],
-            index=0,
-            help="Filtern nach Kanton"
-        )
-        
-        sprachgebiet_filter = st.selectbox(
-            "Sprachgebiet", 
-            options=["Alle"] + filter_options['sprachgebiet'],
-            index=0,
-            help="Filtern nach Sprachgebiet"
-        )
-        
-        bruttojahr_range = st.selectbox(
-            "Bruttojahreseinkommen",
-            options=["Alle", "< 60k", "60k-100k", "> 100k"],
-            index=0,
-            help="Filtern nach Einkommensbereich"
-        )
-        
-        ausbildung_filter = st.selectbox(
-            "Ausbildung",
-            options=["Alle"] + filter_options['ausbildung'][:10],  # Limit to first 10 for UI
-            index=0,
-            help="Filtern nach Ausbildung"
-        )
-        
-        erwerbstaetig_filter = st.selectbox(
-            "Erwerbstätigkeit",
-            options=["Alle", "Erwerbstätig", "Nicht erwerbstätig"],
-            index=0,
-            help="Filtern nach Erwerbsstatus"
-        )
-        
-        kinder_filter = st.selectbox(
-            "Kinder im Haushalt",
-            options=["Alle", "Mit Kindern", "Ohne Kinder"],
-            index=0,
-            help="Filtern nach Kindern im Haushalt"
-        )
-        
-        # Collect CSV filters
-        csv_filters = {
-            'alter_range': alter_range,
-            'geschlecht': geschlecht_filter,
-            'kanton': kanton_filter if kanton_filter != "Alle" else None,
-            'sprachgebiet': sprachgebiet_filter if sprachgebiet_filter != "Alle" else None,
-            'bruttojahr_range': bruttojahr_range,
-            'ausbildung': ausbildung_filter if ausbildung_filter != "Alle" else None,
-            'arbeit': 1 if erwerbstaetig_filter == "Erwerbstätig" else (0 if erwerbstaetig_filter == "Nicht erwerbstätig" else None),
-            'kinder': 1 if kinder_filter == "Mit Kindern" else (0 if kinder_filter == "Ohne Kinder" else None)
-        }
+        csv_filters, matching_persons = show_demographic_filters(filter_options, key_prefix="single_")
         
         st.markdown("---")
         
@@ -379,7 +413,7 @@ def show():
         st.markdown("---")
         
         create_section_header("Aktionen", "⚡")
-        if st.button("🎯 Persona Generieren", type="primary", use_container_width=True):
+        if st.button("🎯 Persona Generieren", type="primary", use_container_width=True, disabled=matching_persons == 0):
             persona, person_data = generate_persona(additional_params, csv_filters, debug_mode)
             if persona and person_data:
                 st.session_state.current_persona = persona
@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 from pathlib import Path
-from data import load_demographie_csv
+from data import load_demographic_index, load_demographic_rows, load_demographic_store
 from llm import SwissAIClient
 from ui_components import load_custom_css, create_header, create_section_header, create_info_box
 import random
@@ -65,53 +65,19 @@ def format_person_data(person_row, additional_params):
 def generate_persona(additional_params, csv_filters, debug_mode=False):
     """Generate a new persona by selecting a random person and calling the LLM"""
     try:
-        # Load data
-        df = load_demographie_csv()
+        # Apply CSV filters if any (row ids from the filter plan over the bitmap index)
+        index = load_demographic_index()
+        row_ids = index.row_ids(csv_filters)
         
-        # Apply CSV filters if any
-        filtered_df = df.copy()
-        for key, value in csv_filters.items():
-            if value is not None and value != "Alle":
-                if key in ['alter_min', 'alter_max']:
-                    continue  # Handle age range separately
-                elif key == 'alter_range':
-                    if value != "Alle":
-                        if value == "18-25":
-                            filtered_df = filtered_df[(filtered_df['alter'] >= 18) & (filtered_df['alter'] <= 25)]
-                        elif value == "26-35":
-                            filtered_df = filtered_df[(filtered_df['alter'] >= 26) & (filtered_df['alter'] <= 35)]
-                        elif value == "36-45":
-                            filtered_df = filtered_df[(filtered_df['alter'] >= 36) & (filtered_df['alter'] <= 45)]
-                        elif value == "46-65":
-                            filtered_df = filtered_df[(filtered_df['alter'] >= 46) & (filtered_df['alter'] <= 65)]
-                        elif value == "65+":
-                            filtered_df = filtered_df[filtered_df['alter'] > 65]
-                elif key == 'geschlecht':
-                    if value == "Männlich":
-                        filtered_df = filtered_df[filtered_df['weiblich'] == 0]
-                    elif value == "Weiblich":
-                        filtered_df = filtered_df[filtered_df['weiblich'] == 1]
-                elif key == 'bruttojahr_range':
-                    if value == "< 60k":
-                        filtered_df = filtered_df[filtered_df['bruttojahr'] < 60000]
-                    elif value == "60k-100k":
-                        filtered_df = filtered_df[(filtered_df['bruttojahr'] >= 60000) & (filtered_df['bruttojahr'] <= 100000)]
-                    elif value == "> 100k":
-                        filtered_df = filtered_df[filtered_df['bruttojahr'] > 100000]
-                else:
-                    # Direct column matching
-                    if key in filtered_df.columns:
-                        filtered_df = filtered_df[filtered_df[key] == value]
-        
-        if len(filtered_df) == 0:
+        if len(row_ids) == 0:
             st.error("Keine Personen mit den gewählten Filtern gefunden. Bitte lockern Sie die Filter.")
             return False
             
-        st.info(f"Filter angewendet: {len(filtered_df)} von {len(df)} Personen gefunden")
+        st.info(f"Filter angewendet: {len(row_ids)} von {index.rows} Personen gefunden")
         
-        # Select a random person from filtered data
-        random_index = random.randint(0, len(filtered_df) - 1)
-        selected_person = filtered_df.iloc[random_index]
+        # Select a random person from filtered data; only its row is read in full
+        random_index = random.randint(0, len(row_ids) - 1)
+        selected_person = load_demographic_rows([row_ids[random_index]]).iloc[0]
         
         # Format person data
         statistical_data_str, combined_dict = format_person_data(selected_person, additional_params)
@@ -147,7 +113,7 @@ def generate_persona(additional_params, csv_filters, debug_mode=False):
         )
         
         # Initialize LLM client
-        client = SwissAIClient()
+        client = SwissAIClient(caller="streamlit_app.generate_persona")
         
         # Show debug info if enabled
         if debug_mode:
@@ -242,15 +208,14 @@ def generate_persona(additional_params, csv_filters, debug_mode=False):
         st.error(f"Error generating persona: {str(e)}")
         return False
 
-# Load data once for filter options
-@st.cache_data
+# Filter options are the sorted dictionaries of the column store
 def get_filter_options():
-    df = load_demographie_csv()
+    store = load_demographic_store()
     return {
-        'kantone': sorted([k for k in df['kanton'].unique() if pd.notna(k)]),
-        'ausbildung': sorted([a for a in df['ausbildung'].unique() if pd.notna(a)]),
-        'beruf': sorted([b for b in df['beruf'].unique() if pd.notna(b)]),
-        'sprachgebiet': sorted([s for s in df['sprachgebiet'].unique() if pd.notna(s)])
+        'kantone': list(store.dictionary('kanton')),
+        'ausbildung': list(store.dictionary('ausbildung')),
+        'beruf': list(store.dictionary('beruf')),
+        'sprachgebiet': list(store.dictionary('sprachgebiet'))
     }
 
 filter_options = get_filter_options()
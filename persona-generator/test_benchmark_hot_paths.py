@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Smoke test for the hot-path benchmark suite and the helpers it measures
+"""
+
+import json
+from benchmark_hot_paths import BENCHMARK_FILTERS, compare, make_demographics, run_suite, scaling_report
+from single_persona import apply_csv_filters, clean_persona_response, repair_persona_json
+
+def test_extracted_helpers_keep_behaviour():
+    """Filter chain and JSON cleanup behave like the former inline code"""
+    df = make_demographics(2000)
+    filtered = apply_csv_filters(df, BENCHMARK_FILTERS)
+    
+    assert len(filtered) > 0
+    assert filtered['alter'].between(26, 35).all()
+    assert (filtered['weiblich'] == 1).all() and (filtered['kanton'] == "ZH").all()
+    assert filtered['bruttojahr'].between(60000, 100000).all()
+    
+    assert clean_persona_response('Antwort:\n```json\n{"a": 1}\n```') == '{"a": 1}'
+    assert json.loads(repair_persona_json('{"a": [1, 2,], // Kommentar\n"b": 2,}')) == {"a": [1, 2], "b": 2}
+
+def test_suite_runs_and_flags_regressions():
+    """All cases are measured at every size and slowdowns are reported"""
+    results = run_suite([200, 400], [10, 20], min_time=0.0, progress=lambda line: None)
+    
+    cases = {r["case"] for r in results.values()}
+    assert len(cases) == 14
+    assert len(scaling_report(results)) == 12  # all cases with more than one size
+    
+    slower = {"results": {key: {**r, "median": r["median"] / 2} for key, r in results.items()}}
+    comparison = compare(results, slower, threshold=1.25)
+    assert comparison and all(entry["regression"] for entry in comparison)
+
+if __name__ == "__main__":
+    test_extracted_helpers_keep_behaviour()
+    test_suite_runs_and_flags_regressions()
+    print("✅ Benchmark suite tests passed!")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the process-wide demographics loader and its on-disk column cache
+"""
+
+import os
+import time
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+import data
+from diagnostics import cache_stats
+from benchmark_hot_paths import make_demographics
+
+def test_csv_is_parsed_once_across_threads(demographics_csv):
+    """Concurrent first loads share one parse and get the same read-only frame"""
+    csv_path = demographics_csv(make_demographics(2000))
+    
+    frames = []
+    threads = [threading.Thread(target=lambda: frames.append(data.load_demographie_csv(csv_path))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(frames) == 8 and all(frame is frames[0] for frame in frames)
+    assert cache_stats.snapshot()["data"] == {"hits": 7, "misses": 1, "hit_rate": 7 / 8}
+    
+    try:
+        frames[0]['alter'].to_numpy()[0] = -1
+        assert False, "shared frame must be read-only"
+    except ValueError:
+        pass
+    pd.testing.assert_frame_equal(frames[0], data.parse_demographie_csv(csv_path), check_dtype=False, check_categorical=False)
+
+def test_store_replaces_parse_until_csv_changes(demographics_csv, forbid_csv_parse):
+    """A new process maps the column store; a rewritten CSV is parsed again"""
+    csv_path = demographics_csv(make_demographics(500))
+    first = data.load_demographie_csv(csv_path)
+    
+    # Simulate a fresh process: only the store on disk is left
+    data._demographics.clear()
+    with forbid_csv_parse():
+        reloaded = data.load_demographie_csv(csv_path)
+    assert reloaded.equals(first) and list(reloaded.dtypes) == list(first.dtypes)
+    
+    demographics_csv(make_demographics(300, seed=1))
+    os.utime(csv_path, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+    assert len(data.load_demographie_csv(csv_path)) == 300
+    data._demographics.clear()
+    assert len(data.load_demographie_csv(csv_path)) == 300
+
+def test_store_is_mapped_and_dictionary_encoded(demographics_csv, monkeypatch):
+    """Numeric columns are memory-mapped, text columns codes over a sorted dictionary"""
+    from single_persona import get_filter_options
+    
+    df = make_demographics(1000)
+    df.loc[3, 'beruf'] = None
+    monkeypatch.setenv("DEMOGRAPHIE_CSV", str(demographics_csv(df)))
+    store = data.load_demographic_store()
+    options = get_filter_options()
+    frame = data.load_demographie_csv()
+    
+    assert isinstance(store.column('alter').base, np.memmap) and store.column('alter').dtype == np.int8
+    assert store.column('kanton').dtype == np.int8 and store.dictionary('kanton') == sorted(df['kanton'].unique())
+    assert store.column('beruf')[3] == -1 and pd.isna(frame.loc[3, 'beruf'])
+    assert store.code('kanton', "ZH") == store.dictionary('kanton').index("ZH") and store.code('kanton', "XX") == -1
+    assert options['kantone'] == store.dictionary('kanton') and options['sprachgebiet'] == sorted(df['sprachgebiet'].unique())
+    assert (frame['kanton'] == "ZH").sum() == (df['kanton'] == "ZH").sum()
+    assert store.nbytes < df.memory_usage(deep=True).sum() / 1.5
+
+def test_only_filter_columns_are_mapped(demographics_csv):
+    """Filtering maps the filter columns; other columns are read for selected rows only"""
+    df = make_demographics(800)
+    csv_path = demographics_csv(df)
+    data.load_demographic_store(csv_path)
+    data._demographics.clear()
+    
+    row_ids = data.load_demographic_index(csv_path).row_ids({'kanton': "ZH", 'alter_range': "26-35"})
+    store = data.load_demographic_store(csv_path)
+    assert set(store.mapped_columns) <= set(data.FILTER_COLUMNS)
+    
+    rows = data.load_demographic_rows(row_ids[::-1], csv_path)
+    assert rows.index.tolist() == row_ids[::-1].tolist() and list(rows.columns) == list(df.columns)
+    expected = data.parse_demographie_csv(csv_path).iloc[row_ids[::-1]]
+    pd.testing.assert_frame_equal(rows, expected, check_dtype=False, check_categorical=False, check_index_type=False)
+
+def test_rows_fetched_by_line_offset_without_store(demographics_csv, monkeypatch):
+    """Without a store only the filter columns are parsed, rows come from the CSV lines"""
+    csv_path = demographics_csv(make_demographics(600))
+    monkeypatch.setenv("SWISS_AI_DATA_CACHE", "0")
+    parsed_columns = []
+    parse = data.parse_demographie_csv
+    
+    def recording_parse(path, columns=None):
+        parsed_columns.append(columns)
+        return parse(path, columns)
+    
+    with monkeypatch.context() as patch:
+        patch.setattr(data, "parse_demographie_csv", recording_parse)
+        store = data.load_demographic_store(csv_path)
+        rows = data.load_demographic_rows([5, 599, 5], csv_path)
+    
+    assert parsed_columns == [data.EAGER_COLUMNS]
+    assert store.columns == [c for c in parse(csv_path).columns if c in data.EAGER_COLUMNS]
+    expected = parse(csv_path).iloc[[5, 599, 5]]
+    pd.testing.assert_frame_equal(rows, expected, check_dtype=False, check_index_type=False)
+    
+    # Quoted line breaks: lines are not rows, so the whole file is parsed instead
+    with open(csv_path, 'a', encoding='utf-8') as f:
+        f.write('40,1,50000,2,Hochschule,"Lehrer\nin",ZH,Deutsch,1,0,0' + ',' * 20 + '\n')
+    data._demographics.clear()
+    rows = data.load_demographic_rows([600], csv_path)
+    assert rows.loc[600, 'beruf'] == "Lehrer\nin"
+
+if __name__ == "__main__":
+    # The tests use the fixtures in conftest.py
+    if pytest.main(["-q", __file__]) == 0:
+        print("✅ Data loader tests passed!")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests for the bitmap filter index (no data file required)
+"""
+
+import itertools
+import numpy as np
+from demographic_store import DemographicStore
+from demographic_index import DemographicIndex
+from filter_spec import Eq, FilterSpec
+from benchmark_hot_paths import BENCHMARK_FILTERS, make_demographics
+from single_persona import apply_csv_filters, collect_csv_filters, format_facet_option
+
+def test_index_matches_filter_chain():
+    """Bitmap ANDs select exactly the rows of the pandas filter chain"""
+    df = make_demographics(3000)
+    df.loc[5, 'kanton'] = None
+    index = DemographicIndex(DemographicStore.from_frame(df))
+    
+    combinations = [
+        {},
+        BENCHMARK_FILTERS,
+        {'alter_range': "Alle", 'geschlecht': "Männlich", 'kanton': None},
+        {'alter_range': "65+", 'sprachgebiet': "Französisch", 'kinder': 0},
+        {'bruttojahr_range': "> 100k", 'ausbildung': "Hochschule", 'arbeit': 0},
+        {'alter_range': "unbekannt", 'kanton': "XX"},
+        {'hhgroesse': 3, 'alter_min': 30},
+    ]
+    for alter_range, kanton in itertools.product(["18-25", "46-65"], ["ZH", "TI", "GE"]):
+        combinations.append({'alter_range': alter_range, 'kanton': kanton, 'geschlecht': "Weiblich"})
+    
+    for filters in combinations:
+        expected = np.flatnonzero(df.index.isin(apply_csv_filters(df, filters).index))
+        assert np.array_equal(index.row_ids(filters), expected), filters
+
+def test_row_ids_are_cached_per_combination():
+    """The same combination (in any key order) returns the cached read-only array"""
+    index = DemographicIndex(DemographicStore.from_frame(make_demographics(1000)))
+    
+    first = index.row_ids({'kanton': "ZH", 'geschlecht': "Weiblich", 'sprachgebiet': None})
+    again = index.row_ids({'geschlecht': "Weiblich", 'kanton': "ZH"})
+    assert again is first and not first.flags.writeable
+    assert index.row_ids({}).tolist() == list(range(1000))
+
+def test_high_cardinality_equality_is_scanned():
+    """Eq on a column with many values is answered by a scan without building value bitmaps"""
+    df = make_demographics(3000)
+    index = DemographicIndex(DemographicStore.from_frame(df))
+    indexed = dict(index._bitmaps)
+    income = float(df['bruttojahr'].iloc[0])
+    
+    row_ids = index.spec_row_ids(FilterSpec([Eq('bruttojahr', income), Eq('hhgroesse', 3)]))
+    assert np.array_equal(row_ids, np.flatnonzero((df['bruttojahr'] == income) & (df['hhgroesse'] == 3)))
+    assert index._bitmaps.keys() == indexed.keys() | {'hhgroesse'}
+    assert all(index._bitmaps[key] is bitmaps for key, bitmaps in indexed.items())
+    
+    beruf = df['beruf'].iloc[0]
+    assert len(index.spec_row_ids(FilterSpec([Eq('beruf', beruf)]))) == (df['beruf'] == beruf).sum()
+
+def test_facet_counts_ignore_own_selection():
+    """Each option count equals the rows matching it together with all other filters"""
+    df = make_demographics(3000)
+    index = DemographicIndex(DemographicStore.from_frame(df))
+    filters = {**BENCHMARK_FILTERS, 'hhgroesse': 2}
+    
+    facets = index.facet_counts(filters)
+    assert set(facets) == {'alter_range', 'geschlecht', 'bruttojahr_range', 'kanton', 'sprachgebiet', 'ausbildung', 'arbeit', 'kinder'}
+    for key, counts in facets.items():
+        others = {k: v for k, v in filters.items() if k != key}
+        assert counts["Alle"] == len(apply_csv_filters(df, others)), key
+        for option, count in counts.items():
+            if option != "Alle":
+                assert count == len(apply_csv_filters(df, {**others, key: option})), (key, option)
+    assert facets['kanton']["ZH"] == len(index.row_ids(filters))
+
+def test_facet_labels_and_filters():
+    """Widget selections map to the sidebar filter dict, empty options are marked"""
+    filters = collect_csv_filters({"alter": "26-35", "kanton": "Alle", "erwerbstaetig": "Nicht erwerbstätig"})
+    assert filters['alter_range'] == "26-35" and filters['geschlecht'] == "Alle"
+    assert filters['kanton'] is None and filters['arbeit'] == 0 and filters['kinder'] is None
+    assert format_facet_option("ZH", 12345) == "ZH (12'345)"
+    assert format_facet_option("ZH", 0) == "ZH (0 – keine Personen)"
+
+if __name__ == "__main__":
+    test_index_matches_filter_chain()
+    test_row_ids_are_cached_per_combination()
+    test_high_cardinality_equality_is_scanned()
+    test_facet_counts_ignore_own_selection()
+    test_facet_labels_and_filters()
+    print("✅ Filter index tests passed!")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for quota and stratified sampling (no API access required)
+"""
+
+import numpy as np
+import pytest
+from demographic_quota import fit_cell_counts, marginal_counts, population_shares, round_counts, sample_stratified
+from benchmark_hot_paths import make_demographics
+
+def test_ipf_rounding_keeps_marginals():
+    """Raked and rounded cell counts hit every integer marginal"""
+    rng = np.random.default_rng(0)
+    population = rng.integers(0, 50, size=(6, 5, 2))
+    population[0, 0, :] = 0
+    targets = [np.array([30, 20, 20, 10, 10, 10.]), np.array([10, 25, 25, 20, 20.]), np.array([55, 45.])]
+    
+    counts = round_counts(fit_cell_counts(population, targets), targets)
+    assert counts.sum() == 100 and (counts[population == 0] == 0).all()
+    assert counts.sum(axis=(1, 2)).tolist() == [30, 20, 20, 10, 10, 10]
+    assert counts.sum(axis=(0, 2)).tolist() == [10, 25, 25, 20, 20]
+    assert counts.sum(axis=(0, 1)).tolist() == [55, 45]
+
+def test_representative_batch_matches_population_marginals(demographics_csv):
+    """An ipf batch reproduces the canton, age, gender and language mix of the data"""
+    csv_path = demographics_csv(make_demographics(20000))
+    shares = population_shares({'arbeit': 1}, csv_path=csv_path)
+    sampled = sample_stratified(400, {'arbeit': 1}, shares, seed=3, csv_path=csv_path)
+    
+    assert len(sampled) == 400 and len({p.row_id for p in sampled}) == 400
+    assert all(p.person['arbeit'] == 1 for p in sampled)
+    for dimension, counts in marginal_counts(sampled, csv_path=csv_path).items():
+        for option, share in shares[dimension].items():
+            assert abs(counts.get(option, 0) - share * 400) < 1, (dimension, option)
+
+def test_explicit_quotas_are_exact(demographics_csv):
+    """quota mode draws exactly the requested persons per option"""
+    csv_path = demographics_csv(make_demographics(20000))
+    quotas = {'kanton': {"ZH": 30, "TI": 15, "GE": 5}, 'geschlecht': {"Weiblich": 25, "Männlich": 25}}
+    sampled = sample_stratified(50, {'alter_range': "26-35"}, quotas, mode="quota", seed=1, csv_path=csv_path)
+    counts = marginal_counts(sampled, ('kanton', 'geschlecht', 'alter_range'), csv_path=csv_path)
+    
+    assert counts == {'kanton': quotas['kanton'], 'geschlecht': quotas['geschlecht'], 'alter_range': {"26-35": 50}}
+    for bad in ({'kanton': {"ZH": 10}}, {'kanton': {"XX": 50}}, {'unbekannt': {"a": 50}}):
+        try:
+            sample_stratified(50, {}, bad, mode="quota", csv_path=csv_path)
+            assert False, f"expected ValueError for {bad}"
+        except ValueError:
+            pass
+
+def test_dimensions_without_values_do_not_break_sampling(demographics_csv):
+    """Dimensions nobody matching has a value in are skipped; unreachable targets draw nobody"""
+    df = make_demographics(3000)
+    df.loc[df['arbeit'] == 0, 'kanton'] = None
+    csv_path = demographics_csv(df)
+    
+    shares = population_shares({'arbeit': 0}, csv_path=csv_path)
+    assert 'kanton' not in shares and set(shares) == {'alter_range', 'geschlecht', 'sprachgebiet'}
+    sampled = sample_stratified(40, {'arbeit': 0}, {**shares, 'kanton': {}}, seed=2, csv_path=csv_path)
+    assert len(sampled) == 40 and all(p.person['arbeit'] == 0 for p in sampled)
+    assert len(sample_stratified(10, {'arbeit': 0}, {'kanton': {}}, csv_path=csv_path)) == 10
+    
+    assert sample_stratified(10, {'arbeit': 0}, {'kanton': {"ZH": 1.0}}, csv_path=csv_path) == []
+    assert sample_stratified(10, {'alter_range': "18-25"}, {'alter_range': {"65+": 1.0}}, csv_path=csv_path) == []
+
+if __name__ == "__main__":
+    # The sampling tests use the fixtures in conftest.py
+    if pytest.main(["-q", __file__]) == 0:
+        print("✅ Quota sampling tests passed!")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for the vectorized source-person sampler (no API access required)
+"""
+
+import logging
+import logging.handlers
+import pytest
+import data
+from demographic_sampler import sample_persons
+from single_persona import format_person_data
+from benchmark_hot_paths import make_demographics
+
+def test_seeded_draw_matches_filters_and_prompt_text(demographics_csv):
+    """One draw returns distinct matching rows with the same text as format_person_data"""
+    csv_path = demographics_csv(make_demographics(2000))
+    filters = {'kanton': "ZH", 'geschlecht': "Weiblich"}
+    sampled = sample_persons(20, filters, seed=7, csv_path=csv_path)
+    df = data.load_demographie_csv(csv_path)
+    
+    assert [p.row_id for p in sampled] == [p.row_id for p in sample_persons(20, filters, seed=7, csv_path=csv_path)]
+    assert len({p.row_id for p in sampled}) == 20
+    for person in sampled:
+        assert person.person['kanton'] == "ZH" and person.person['weiblich'] == 1
+        statistical_data_str, combined_dict = format_person_data(df.iloc[person.row_id], {})
+        assert person.statistical_data == statistical_data_str and person.person.keys() == combined_dict.keys()
+
+def test_replacement_modes(demographics_csv):
+    """Small matches fall back to drawing with replacement, with a warning, unless that is ruled out"""
+    csv_path = demographics_csv(make_demographics(2000))
+    filters = {'kanton': "UR", 'alter_range': "18-25"}
+    matching = len(data.load_demographic_index(csv_path).row_ids(filters))
+    assert 0 < matching < 30
+    
+    handler = logging.handlers.BufferingHandler(10)
+    logging.getLogger("demographic_sampler").addHandler(handler)
+    try:
+        assert len(sample_persons(30, filters, seed=1, csv_path=csv_path)) == 30
+    finally:
+        logging.getLogger("demographic_sampler").removeHandler(handler)
+    assert [r.levelno for r in handler.buffer] == [logging.WARNING] and "with replacement" in handler.buffer[0].getMessage()
+    try:
+        sample_persons(30, filters, replace=False, csv_path=csv_path)
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    assert sample_persons(5, {'kanton': "XX"}, csv_path=csv_path) == []
+
+if __name__ == "__main__":
+    # The tests use the fixtures in conftest.py
+    if pytest.main(["-q", __file__]) == 0:
+        print("✅ Sampler tests passed!")
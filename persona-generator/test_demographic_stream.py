@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Tests for the out-of-core demographics reader (no data file required)
+"""
+
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pytest
+import data
+import demographic_sampler
+from benchmark_hot_paths import make_demographics
+from demographic_sampler import sample_persons, stream_sample_persons
+from demographic_store import DemographicStore
+from demographic_stream import build_store, stream_sample
+from filter_spec import In, FilterSpec, spec_from_sidebar
+from single_persona import get_filter_options
+
+def write_demographics(tmp, rows=3000):
+    df = make_demographics(rows)
+    df.loc[7, 'beruf'] = None
+    df.loc[2500:, 'hhgroesse'] = np.nan  # integers with gaps in the last chunks only
+    csv_path = Path(tmp) / "demographics.csv"
+    df.to_csv(csv_path, index=False)
+    return df, csv_path
+
+def test_chunked_store_equals_full_parse(tmp_path):
+    """Two chunked passes encode the same store as one full parse"""
+    df, csv_path = write_demographics(tmp_path)
+    store = build_store(csv_path, tmp_path / "store", (1, 2), chunk_rows=700)
+    expected = DemographicStore.from_frame(data.parse_demographie_csv(csv_path))
+    
+    assert store.columns == expected.columns and store.dictionaries == expected.dictionaries
+    for name in expected.columns:
+        assert store.column(name).dtype == expected.column(name).dtype, name
+        assert np.array_equal(store.column(name), expected.column(name), equal_nan=store.column(name).dtype.kind == 'f'), name
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([csv_path.name, "store"])  # no work files left
+
+def test_stream_sample_draws_matching_rows_without_replacement(tmp_path):
+    """Reservoir sampling keeps count distinct matching rows, or all of them"""
+    df, csv_path = write_demographics(tmp_path)
+    spec = spec_from_sidebar({'geschlecht': "Weiblich", 'alter_range': "26-35"})
+    matching = set(np.flatnonzero(df.index.isin(spec.apply(df).index)))
+    
+    row_ids, rows = stream_sample(40, spec, csv_path, seed=3, chunk_rows=500)
+    assert len(row_ids) == 40 and len(set(row_ids)) == 40 and set(row_ids) <= matching
+    assert rows['alter'].tolist() == df['alter'].iloc[row_ids].tolist()
+    again, _ = stream_sample(40, spec, csv_path, seed=3, chunk_rows=500)
+    assert again.tolist() == row_ids.tolist()
+    
+    everyone, _ = stream_sample(10**6, spec, csv_path, chunk_rows=500)
+    assert sorted(everyone) == sorted(matching)
+
+def test_stream_sample_weights(tmp_path):
+    """Heavier rows are drawn first, rows without weight never"""
+    df = make_demographics(1000)
+    df['gewicht'] = 1.0
+    df.loc[:9, 'gewicht'] = 1000.0
+    df.loc[10:499, 'gewicht'] = 0.0
+    csv_path = tmp_path / "demographics.csv"
+    df.to_csv(csv_path, index=False)
+    
+    row_ids, _ = stream_sample(20, FilterSpec(), csv_path, weight_column='gewicht', seed=0, chunk_rows=128)
+    assert (row_ids < 10).sum() >= 8
+    assert not ((row_ids >= 10) & (row_ids < 500)).any()
+
+def test_stream_sample_persons_builds_store_for_later_runs(tmp_path, data_cache, forbid_csv_parse):
+    """The streaming pass leaves a column store that the next load maps without parsing"""
+    df, csv_path = write_demographics(tmp_path)
+    
+    persons = stream_sample_persons(25, FilterSpec([In('kanton', ("ZH", "BE"))]), seed=1, csv_path=csv_path, chunk_rows=600)
+    assert len(persons) == 25 and all(p.person['kanton'] in ("ZH", "BE") for p in persons)
+    assert persons[0].statistical_data.startswith(f"alter: {df.loc[persons[0].row_id, 'alter']}")
+    
+    with forbid_csv_parse():
+        index = data.load_demographic_index(csv_path)
+    assert index.rows == len(df) and len(index.row_ids({'kanton': "ZH"})) == (df['kanton'] == "ZH").sum()
+
+def test_concurrent_first_draws_share_one_store(tmp_path, data_cache, forbid_csv_parse):
+    """Threads streaming the same CSV at once all get their persons and leave one valid store"""
+    df, csv_path = write_demographics(tmp_path)
+    
+    def draw(seed):
+        return stream_sample_persons(10, FilterSpec(), seed=seed, csv_path=csv_path, chunk_rows=600)
+    
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        draws = list(pool.map(draw, range(4)))
+    assert all(len(persons) == 10 for persons in draws)
+    assert not list(data_cache.glob("*.tmp"))
+    
+    with forbid_csv_parse():
+        index = data.load_demographic_index(csv_path)
+    assert index.rows == len(df) and len(index.row_ids({'kanton': "ZH"})) == (df['kanton'] == "ZH").sum()
+
+def test_large_csv_is_loaded_by_streaming(tmp_path, data_cache, forbid_csv_parse, monkeypatch):
+    """From SWISS_AI_DATA_STREAM_MB on, the loader builds the store in chunks instead of parsing"""
+    df, csv_path = write_demographics(tmp_path, rows=500)
+    monkeypatch.setenv("SWISS_AI_DATA_STREAM_MB", "0")
+    with forbid_csv_parse():
+        rows = data.load_demographic_rows([0, 499], csv_path)
+    
+    pd.testing.assert_frame_equal(rows, df.iloc[[0, 499]], check_dtype=False, check_categorical=False, check_index_type=False)
+
+def test_large_csv_without_store_loads_filter_columns_only(tmp_path, data_cache, monkeypatch):
+    """If the store cannot be written, a large CSV is never parsed whole"""
+    df, csv_path = write_demographics(tmp_path, rows=500)
+    monkeypatch.setenv("SWISS_AI_DATA_STREAM_MB", "0")
+    parsed_columns = []
+    parse = data.parse_demographie_csv
+    
+    def recording_parse(path, columns=None):
+        parsed_columns.append(columns)
+        return parse(path, columns)
+    
+    def failing_build(*args, **kwargs):
+        raise OSError("read-only cache")
+    
+    monkeypatch.setattr(data, "parse_demographie_csv", recording_parse)
+    monkeypatch.setattr(data, "build_store", failing_build)
+    rows = data.load_demographic_rows([3, 250], csv_path)
+    assert parsed_columns == [data.EAGER_COLUMNS]
+    pd.testing.assert_frame_equal(rows, df.iloc[[3, 250]], check_dtype=False, check_index_type=False)
+    with pytest.raises(ValueError, match="too large"):
+        data.load_demographie_csv(csv_path)
+
+def test_first_draw_from_large_csv_streams(tmp_path, data_cache, forbid_csv_parse, monkeypatch):
+    """Batch sampling streams a large CSV once, leaving the store for the indexed draws"""
+    df, csv_path = write_demographics(tmp_path)
+    monkeypatch.setenv("SWISS_AI_DATA_STREAM_MB", "0")
+    filters = {'kanton': "UR", 'alter_range': "18-25"}
+    matching = set(np.flatnonzero(df.index.isin(spec_from_sidebar(filters).apply(df).index)))
+    assert 0 < len(matching) < 30 and data.should_stream_demographics(csv_path)
+    
+    with forbid_csv_parse():
+        sampled = sample_persons(30, filters, seed=4, csv_path=csv_path)
+        assert len(sampled) == 30 and {p.row_id for p in sampled} == matching  # all of them, then repeated
+        assert not data._demographics and not data.should_stream_demographics(csv_path)
+        
+        indexed = sample_persons(10, {'kanton': "ZH"}, seed=4, csv_path=csv_path)
+    assert len(data._demographics) == 1 and all(p.person['kanton'] == "ZH" for p in indexed)
+
+def test_pages_build_the_store_on_first_render(tmp_path, data_cache, forbid_csv_parse, monkeypatch):
+    """The pages need the store for their filter options, so a draw from the UI uses the index"""
+    df, csv_path = write_demographics(tmp_path)
+    monkeypatch.setenv("SWISS_AI_DATA_STREAM_MB", "0")
+    monkeypatch.setenv("DEMOGRAPHIE_CSV", str(csv_path))
+    assert data.should_stream_demographics()
+    
+    def fail_stream(*args, **kwargs):
+        raise AssertionError("the first draw from the UI streamed the CSV")
+    
+    with forbid_csv_parse():
+        options = get_filter_options()  # first call of both pages
+        assert not data.should_stream_demographics()
+        monkeypatch.setattr(demographic_sampler, "stream_sample_persons", fail_stream)
+        sampled = sample_persons(10, {'kanton': "ZH"}, seed=4)
+    assert options['kantone'] == sorted(df['kanton'].unique())
+    assert len(sampled) == 10 and all(p.person['kanton'] == "ZH" for p in sampled)
+
+if __name__ == "__main__":
+    # The tests use the fixtures in conftest.py
+    if pytest.main(["-q", __file__]) == 0:
+        print("✅ Streaming reader tests passed!")
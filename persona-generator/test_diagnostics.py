@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for the diagnostics counters and the cached file reader
+"""
+
+import os
+import json
+import time
+import tempfile
+import threading
+from pathlib import Path
+from llm import RateLimiter
+from data import read_cached
+from diagnostics import cache_stats, collect_diagnostics
+from persona_library import load_saved_batches
+
+def test_read_cached_counts_hits_until_file_changes():
+    """Unchanged files are parsed once; rewritten files are parsed again"""
+    cache_stats.reset()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "personas_batch_1.json"
+        path.write_text(json.dumps({"personas": [1]}), encoding="utf-8")
+    
+        first = read_cached(path, json.load, "batch_files")
+        assert read_cached(path, json.load, "batch_files") is first
+    
+        path.write_text(json.dumps({"personas": [1, 2]}), encoding="utf-8")
+        os.utime(path, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+        assert read_cached(path, json.load, "batch_files") == {"personas": [1, 2]}
+    
+    stats = collect_diagnostics(0.5)["caches"]["batch_files"]
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert abs(stats["hit_rate"] - 1 / 3) < 1e-9
+
+def test_saved_batches_leave_cached_files_unchanged():
+    """The library adds file info to copies, not to the shared cached batch"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "personas_batch_1.json"
+        path.write_text(json.dumps({"metadata": {"generated_at": "2025-01-01"}, "personas": []}), encoding="utf-8")
+        
+        batches = load_saved_batches(tmp)
+        assert batches[0]['metadata']['filename'] == path.name
+        assert read_cached(path, json.load, "batch_files")['metadata'] == {"generated_at": "2025-01-01"}
+
+def test_limiter_counts_queued_callers():
+    """Callers blocked in acquire() are reported as queued until admitted"""
+    limiter = RateLimiter(requests_per_second=1000, request_burst=10, max_concurrency=1)
+    limiter.acquire()
+    
+    waiter = threading.Thread(target=limiter.acquire)
+    waiter.start()
+    deadline = time.time() + 2
+    while limiter.waiting == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert limiter.waiting == 1 and limiter.in_flight == 1
+    
+    limiter.release()
+    waiter.join(timeout=2)
+    assert limiter.waiting == 0 and limiter.in_flight == 1
+
+if __name__ == "__main__":
+    test_read_cached_counts_hits_until_file_changes()
+    test_saved_batches_leave_cached_files_unchanged()
+    test_limiter_counts_queued_callers()
+    print("✅ Diagnostics tests passed!")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for the declarative filter specs and the filter planner (no data file required)
+"""
+
+import numpy as np
+from demographic_store import DemographicStore
+from demographic_index import DemographicIndex
+from benchmark_hot_paths import make_demographics
+from data import filter_df_by_params
+from filter_spec import Eq, FilterSpec, In, Range, parse_condition, spec_from_sidebar
+
+def test_sidebar_spec_keeps_filter_semantics():
+    """Sidebar buckets select the same rows as the former comparisons"""
+    df = make_demographics(2000)
+    
+    spec = spec_from_sidebar({'alter_range': "65+", 'geschlecht': "Männlich", 'bruttojahr_range': "< 60k",
+                              'kanton': "ZH", 'sprachgebiet': "Alle", 'alter_min': 30, 'nicht_da': 1})
+    expected = df[(df['alter'] > 65) & (df['weiblich'] == 0) & (df['bruttojahr'] < 60000) & (df['kanton'] == "ZH")]
+    assert spec.apply(df).index.tolist() == expected.index.tolist()
+    assert spec_from_sidebar({'alter_range': "unbekannt", 'kanton': None}) == FilterSpec()
+    assert spec_from_sidebar({}).apply(df) is df
+
+def test_specs_compare_independent_of_order():
+    """Specs are hashable cache keys regardless of predicate order"""
+    first = FilterSpec([Eq('kanton', "ZH"), Range('alter', 30, 40)])
+    second = FilterSpec([Range('alter', 30, 40), Eq('kanton', "ZH"), Eq('kanton', "ZH")])
+    assert first == second and hash(first) == hash(second) and len(second) == 2
+
+def test_parse_condition():
+    """Command-line conditions become predicates with numbers parsed"""
+    assert parse_condition("alter>=30") == Range('alter', low=30)
+    assert parse_condition("alter < 40.5") == Range('alter', high=40.5, high_inclusive=False)
+    assert parse_condition("weiblich=1") == Eq('weiblich', 1)
+    assert parse_condition("kanton in ZH, BE") == In('kanton', ("ZH", "BE"))
+    try:
+        parse_condition("alter ~ 3")
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+def test_plan_matches_pandas():
+    """Bitmap and scan steps on the column store select the rows pandas selects"""
+    df = make_demographics(3000)
+    df.loc[7, 'kanton'] = None
+    index = DemographicIndex(DemographicStore.from_frame(df))
+    
+    specs = [
+        FilterSpec([Range('alter', 30, 45), In('kanton', ("ZH", "BE", "XX"))]),
+        FilterSpec([Range('bruttojahr', low=80000, low_inclusive=False), Eq('beruf', df['beruf'].iloc[0])]),
+        FilterSpec([In('hhgroesse', (1, 2)), Eq('weiblich', 1), Range('v03', high=0.5)]),
+        FilterSpec([Eq('kanton', "XX"), Range('alter', 20, 60)]),
+        FilterSpec([Eq('nicht_da', 1)]),
+    ]
+    for spec in specs:
+        expected = np.flatnonzero(df.index.isin(spec.apply(df).index))
+        assert np.array_equal(index.plan(spec).run(), expected), spec
+        assert np.array_equal(index.spec_row_ids(spec), expected), spec
+
+def test_plan_orders_by_selectivity():
+    """Most selective bitmaps run first, scans run after all bitmaps"""
+    index = DemographicIndex(DemographicStore.from_frame(make_demographics(3000)))
+    spec = FilterSpec([Range('alter', 18, 80), Eq('weiblich', 1), Eq('kanton', "ZH"), Range('alter', 70, 80)])
+    
+    plan = index.plan(spec)
+    assert [step.predicate for step in plan.bitmap_steps] == [Eq('kanton', "ZH"), Eq('weiblich', 1)]
+    assert [step.predicate for step in plan.scan_steps] == [Range('alter', 70, 80), Range('alter', 18, 80)]
+    assert len(plan.explain()) == 4 and "bitmap" in plan.explain()[0]
+
+def test_filter_df_by_params():
+    """None values are ignored, the others are equality filters"""
+    df = make_demographics(500)
+    result = filter_df_by_params(df, {'kanton': "BE", 'weiblich': 1, 'ausbildung': None})
+    assert result.index.tolist() == df[(df['kanton'] == "BE") & (df['weiblich'] == 1)].index.tolist()
+
+if __name__ == "__main__":
+    test_sidebar_spec_keeps_filter_semantics()
+    test_specs_compare_independent_of_order()
+    test_parse_condition()
+    test_plan_matches_pandas()
+    test_plan_orders_by_selectivity()
+    test_filter_df_by_params()
+    print("✅ Filter spec tests passed!")
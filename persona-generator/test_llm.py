@@ -0,0 +1,634 @@
+#!/usr/bin/env python3
+"""
+Tests for the LLM client utilities (no API access required)
+"""
+
+import time
+import asyncio
+import contextvars
+import tempfile
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+import openai
+from llm import (
+    AsyncSingleFlight, AsyncSwissAIClient, RateLimiter, RateLimitInfo, RetryPolicy, SwissAIClient, estimate_tokens,
+    close_http_clients, get_async_http_client, get_http_client, get_rate_limiter, parse_reset_time,
+    retry_metrics, run_async
+)
+from llm_cache import CompletionCache
+from llm_tokens import TokenEstimator, count_text_tokens
+from llm_cassette import RECORD, REPLAY, AsyncCassetteOpenAI, Cassette, CassetteMissError, CassetteOpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from mock_llm_server import MockLLMServer, MockServerConfig
+from llm_metrics import MetricsRegistry, start_metrics_server
+import json
+import urllib.request
+
+class FakeHTTPResponse:
+    """Minimal stand-in for the HTTP response attached to openai errors"""
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.request = None
+
+class FakeRawResponse:
+    """Stand-in for the object returned by with_raw_response.create()"""
+    def __init__(self, content, headers=None):
+        self.headers = headers or {}
+        self._completion = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(total_tokens=10)
+        )
+    
+    def parse(self):
+        return self._completion
+
+def make_status_error(error_class, status_code, headers=None):
+    """Create an openai status error without a real HTTP exchange"""
+    return error_class("error", response=FakeHTTPResponse(status_code, headers), body=None)
+
+def make_fake_client(outcomes, cache=None, latency=0.0):
+    """SwissAIClient whose API calls raise or return the given outcomes in order"""
+    outcomes = list(outcomes)
+    
+    def create(**params):
+        client.api_calls += 1
+        time.sleep(latency)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeRawResponse(outcome)
+    
+    client = SwissAIClient(
+        api_key="test",
+        rate_limiter=RateLimiter(requests_per_second=1000, request_burst=100),
+        retry_policy=RetryPolicy(base_delay=0.01, max_delay=0.05),
+        cache=cache
+    )
+    client.api_calls = 0
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        with_raw_response=SimpleNamespace(create=create)
+    )))
+    return client
+
+def test_token_budget_blocks_until_refilled():
+    """A request larger than the remaining token budget waits for the refill"""
+    limiter = RateLimiter(requests_per_second=100, tokens_per_minute=6000)
+    
+    limiter.acquire(6000)
+    start = time.time()
+    wait = limiter.acquire(50)  # 100 tokens/sec refill -> ~0.5s
+    
+    assert wait >= 0.4
+    assert time.time() - start >= 0.4
+
+def test_reconcile_returns_unused_tokens():
+    """Overestimated requests give their unused tokens back"""
+    limiter = RateLimiter(tokens_per_minute=1000)
+    
+    limiter.acquire(800)
+    limiter.reconcile(800, 100)
+    
+    assert limiter.available_tokens >= 899
+
+def test_limiter_is_shared_across_threads():
+    """Requests from many threads are spaced by the shared request rate"""
+    limiter = RateLimiter(requests_per_second=20)
+    start = time.time()
+    
+    threads = [threading.Thread(target=limiter.acquire) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    
+    assert time.time() - start >= 0.4  # 9 intervals of 0.05s
+
+def test_clients_share_process_limiter():
+    """Every client uses the same limiter unless one is passed explicitly"""
+    first = SwissAIClient(api_key="test")
+    second = SwissAIClient(api_key="test")
+    
+    assert first.rate_limiter is second.rate_limiter is get_rate_limiter()
+
+def test_estimate_tokens_counts_completion_budget():
+    """The estimate includes the prompt and the full max_tokens"""
+    messages = [{"role": "user", "content": "x" * 400}]
+    
+    assert count_text_tokens('{"name": "Anna", "alter": 42}') == 16
+    assert estimate_tokens(messages, max_tokens=100) == 100 + 4 + 100
+
+def test_token_estimator_learns_from_usage():
+    """Reported usage calibrates prompt counting and the expected completion length"""
+    estimator = TokenEstimator(smoothing=1.0, safety_margin=1.0)
+    messages = [{"role": "user", "content": "x" * 400}]
+    
+    estimate = estimator.estimate(messages, max_tokens=3000)
+    assert estimate.completion_tokens == 3000
+    
+    estimator.observe(estimate, 3000, prompt_tokens=208, completion_tokens=1200)
+    learned = estimator.estimate(messages, max_tokens=3000)
+    
+    assert learned.prompt_tokens == 208
+    assert learned.completion_tokens == 1200
+    assert estimator.estimate_completion(200) == 200
+
+def test_large_requests_leave_reserve_for_small_ones():
+    """A large request is held back while only the small-request reserve is left"""
+    limiter = RateLimiter(
+        requests_per_second=100, request_burst=10, tokens_per_minute=60_000,
+        large_request_tokens=2_000, small_request_reserve_ratio=0.1
+    )
+    limiter.acquire(53_000)
+    
+    assert limiter.acquire(500) < 0.05  # chat request is served from the reserve
+    with limiter._condition:
+        wait = limiter._try_acquire(2_500)  # needs 2500 + 6000 reserve, 6500 left
+    
+    assert 1.9 <= wait <= 2.1
+
+def test_parse_reset_time():
+    """Reset headers are understood as plain seconds and as duration strings"""
+    assert parse_reset_time("12") == 12.0
+    assert parse_reset_time("1m30s") == 90.0
+    assert parse_reset_time("250ms") == 0.25
+    assert parse_reset_time("soon") is None
+    assert parse_reset_time(None) is None
+
+def test_low_server_budget_lowers_concurrency():
+    """A nearly exhausted server budget halves concurrency and caps local tokens"""
+    limiter = RateLimiter(tokens_per_minute=100_000, max_concurrency=8)
+    
+    limiter.update_from_headers(RateLimitInfo(remaining_tokens=5_000, reset_tokens_time="30s"))
+    
+    assert limiter.concurrency_limit == 4
+    assert limiter.available_tokens <= 5_100
+
+def test_low_budget_window_halves_concurrency_once():
+    """Responses of all requests in flight during one low-budget window back off once"""
+    limiter = RateLimiter(tokens_per_minute=100_000, max_concurrency=16, decrease_cooldown=0.2)
+    
+    for _ in range(8):
+        limiter.update_from_headers(RateLimitInfo(remaining_tokens=5_000))
+    assert limiter.concurrency_limit == 8
+    
+    time.sleep(0.25)
+    limiter.update_from_headers(RateLimitInfo(remaining_tokens=5_000))
+    assert limiter.concurrency_limit == 4
+
+def test_plentiful_server_budget_raises_concurrency():
+    """Concurrency grows back one step per response while the budget is plentiful"""
+    limiter = RateLimiter(tokens_per_minute=100_000, max_concurrency=8)
+    limiter.concurrency_limit = 2
+    
+    for _ in range(10):
+        limiter.update_from_headers(RateLimitInfo(remaining_tokens=90_000))
+    
+    assert limiter.concurrency_limit == 8
+
+def test_concurrency_limit_blocks_until_release():
+    """acquire() waits while the in-flight limit is reached"""
+    limiter = RateLimiter(requests_per_second=100, max_concurrency=1, request_burst=5)
+    limiter.acquire()
+    
+    threading.Timer(0.3, limiter.release).start()
+    wait = limiter.acquire()
+    
+    assert wait >= 0.25
+    assert limiter.in_flight == 1
+
+def test_async_acquire_shares_request_rate():
+    """Coroutines waiting on the limiter are spaced like threads"""
+    limiter = RateLimiter(requests_per_second=20)
+    
+    async def acquire_all():
+        await asyncio.gather(*[limiter.acquire_async() for _ in range(10)])
+    
+    start = time.time()
+    asyncio.run(acquire_all())
+    
+    assert time.time() - start >= 0.4
+    assert limiter.in_flight == 10
+
+def test_retry_policy_honours_retry_after():
+    """Retry-After from the server wins over the computed backoff"""
+    policy = RetryPolicy()
+    error = make_status_error(openai.RateLimitError, 429, {"retry-after": "7"})
+    
+    assert policy.get_delay(error, attempt=1) == 7.0
+
+def test_retry_policy_backoff_and_fatal_errors():
+    """Transient errors back off exponentially, fatal errors are not retried"""
+    policy = RetryPolicy(base_delay=1.0, jitter=0.0, max_attempts=3)
+    server_error = make_status_error(openai.InternalServerError, 503)
+    bad_request = make_status_error(openai.BadRequestError, 400)
+    
+    assert policy.get_delay(server_error, attempt=1) == 1.0
+    assert policy.get_delay(server_error, attempt=2) == 2.0
+    assert policy.get_delay(server_error, attempt=3) is None
+    assert policy.get_delay(bad_request, attempt=1) is None
+
+def test_complete_recovers_from_rate_limit():
+    """complete() retries a 429 and returns the later successful response"""
+    retry_metrics.reset()
+    client = make_fake_client([
+        make_status_error(openai.RateLimitError, 429, {"retry-after-ms": "10"}),
+        "persona"
+    ])
+    
+    assert client.complete("hello") == "persona"
+    assert retry_metrics.snapshot()["recovered"] == 1
+    assert client.rate_limiter.in_flight == 0
+
+def test_complete_raises_fatal_error_immediately():
+    """Fatal errors are raised on the first attempt"""
+    retry_metrics.reset()
+    client = make_fake_client([make_status_error(openai.AuthenticationError, 401), "unused"])
+    
+    try:
+        client.complete("hello")
+        assert False, "expected AuthenticationError"
+    except openai.AuthenticationError:
+        pass
+    assert retry_metrics.snapshot()["fatal"] == 1
+    assert retry_metrics.snapshot()["retries"] == 0
+
+def test_failed_attempts_refund_reserved_tokens():
+    """Attempts that fail before using tokens give their reservation back to the bucket"""
+    client = make_fake_client([
+        make_status_error(openai.InternalServerError, 503),
+        make_status_error(openai.AuthenticationError, 401)
+    ])
+    client.rate_limiter.acquire(50_000)
+    client.rate_limiter.release()
+    before = client.rate_limiter.available_tokens
+    
+    try:
+        client.complete("hello", max_tokens=3000)
+        assert False, "expected AuthenticationError"
+    except openai.AuthenticationError:
+        pass
+    assert client.api_calls == 2
+    assert abs(client.rate_limiter.available_tokens - before) < 100  # refill only, no 2 x 3000 charged
+    assert client.rate_limiter.in_flight == 0
+
+def test_http_client_pooled_per_endpoint():
+    """Clients for the same key and endpoint reuse one keep-alive connection pool"""
+    first = get_http_client("key-a", "http://localhost:9/v1")
+    
+    assert get_http_client("key-a", "http://localhost:9/v1") is first
+    assert get_http_client("key-b", "http://localhost:9/v1") is not first
+
+def test_run_async_keeps_one_async_pool():
+    """Coroutines run through run_async share one loop and pool, close_http_clients closes it"""
+    request_id = contextvars.ContextVar("request_id", default=None)
+    
+    async def pooled():
+        return get_async_http_client("key-a", "http://localhost:9/v1"), request_id.get()
+    
+    token = request_id.set("frage-1")
+    first, seen = run_async(pooled())
+    request_id.reset(token)
+    assert seen == "frage-1"
+    assert run_async(pooled())[0] is first and not first.is_closed
+    
+    close_http_clients()
+    assert first.is_closed
+    assert run_async(pooled())[0] is not first
+
+def make_temp_cache(**settings):
+    """Completion cache in a fresh temporary directory"""
+    return CompletionCache(path=Path(tempfile.mkdtemp()) / "cache.sqlite", **settings)
+
+def test_cached_completion_skips_api():
+    """An identical request is answered from the cache, bypass_cache forces a call"""
+    client = make_fake_client(["first", "second"], cache=make_temp_cache())
+    
+    assert client.complete("hello", temperature=0.0) == "first"
+    assert client.complete("hello", temperature=0.0) == "first"
+    assert client.api_calls == 1
+    
+    assert client.complete("hello", temperature=0.0, bypass_cache=True) == "second"
+    assert client.api_calls == 2
+
+def test_cache_is_separated_per_endpoint():
+    """The same request against another base URL does not reuse the cached answer"""
+    cache = make_temp_cache()
+    first = make_fake_client(["first"], cache=cache)
+    other = make_fake_client(["other"], cache=cache)
+    other.base_url = "http://localhost:9/v1"
+    
+    assert first.complete("hello", temperature=0.0) == "first"
+    assert other.complete("hello", temperature=0.0) == "other"
+    assert first.complete("hello", temperature=0.0) == "first"
+    assert first.api_calls == 1 and other.api_calls == 1
+
+def test_cache_expires_and_evicts_least_recently_used():
+    """Entries expire after the TTL and the oldest reads are evicted first"""
+    cache = make_temp_cache(ttl_seconds=0.2, max_entries=2)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    cache.get("a")
+    cache.set("c", "C")
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    
+    time.sleep(0.3)
+    assert cache.get("c") is None
+
+def ask_concurrently(client, times, **kwargs):
+    """Answers of times threads sending the same request at once"""
+    results = []
+    
+    def ask():
+        results.append(client.complete("Quick Action", **kwargs))
+    
+    threads = [threading.Thread(target=ask) for _ in range(times)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+def test_identical_concurrent_requests_share_one_call():
+    """Threads asking the same deterministic question at once trigger a single API call"""
+    client = make_fake_client(["shared answer"], latency=0.3)
+    assert ask_concurrently(client, 5, temperature=0.0) == ["shared answer"] * 5
+    assert client.api_calls == 1
+    
+    client = make_fake_client(["seeded answer"], latency=0.3)
+    assert ask_concurrently(client, 3, temperature=0.7, seed=42) == ["seeded answer"] * 3
+    assert client.api_calls == 1
+
+def test_sampled_concurrent_requests_are_not_coalesced():
+    """Identical prompts at temperature > 0 are separate samples with one call each"""
+    client = make_fake_client(["first persona", "second persona"], latency=0.3)
+    
+    assert sorted(ask_concurrently(client, 2, temperature=0.7)) == ["first persona", "second persona"]
+    assert client.api_calls == 2
+
+def test_async_single_flight_coalesces_per_loop():
+    """Concurrent coroutines with the same key await one shared call"""
+    flight = AsyncSingleFlight()
+    calls = []
+    
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "answer"
+    
+    async def run():
+        return await asyncio.gather(*[flight.do("key", fetch) for _ in range(4)])
+    
+    assert asyncio.run(run()) == ["answer"] * 4
+    assert len(calls) == 1
+    assert flight.in_flight == 0
+
+def make_completion(content):
+    """Real ChatCompletion object as returned by the openai SDK"""
+    return ChatCompletion.model_validate({
+        "id": "c", "object": "chat.completion", "created": 0, "model": "test",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 5, "completion_tokens": 5, "total_tokens": 10}
+    })
+
+def make_chunk(content):
+    """Real ChatCompletionChunk object as streamed by the openai SDK"""
+    return ChatCompletionChunk.model_validate({
+        "id": "c", "object": "chat.completion.chunk", "created": 0, "model": "test",
+        "choices": [{"index": 0, "delta": {"content": content}}]
+    })
+
+def make_recording_api(latency):
+    """Fake openai client answering after a delay, as the recording target"""
+    def create(**params):
+        time.sleep(latency)
+        if params.get("stream"):
+            def chunks():
+                for word in ["Grüezi", " mitenand"]:
+                    time.sleep(latency)
+                    yield make_chunk(word)
+            return SimpleNamespace(headers={"x-ratelimit-remaining-tokens": "90000"}, parse=chunks)
+        return SimpleNamespace(headers={}, parse=lambda: make_completion("recorded " + params["messages"][-1]["content"]))
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        with_raw_response=SimpleNamespace(create=create)
+    )))
+
+def test_cassette_records_and_replays_offline():
+    """Recorded responses are replayed without an API, with scaled latency"""
+    path = Path(tempfile.mkdtemp()) / "cassette.jsonl"
+    limiter = RateLimiter(requests_per_second=1000, request_burst=100)
+    
+    recorder = SwissAIClient(api_key="test", rate_limiter=limiter, cassette=Cassette(path, mode=RECORD))
+    recorder.client = CassetteOpenAI(recorder.cassette, inner=make_recording_api(latency=0.2))
+    assert recorder.complete("hallo", bypass_cache=True) == "recorded hallo"
+    assert "".join(recorder.stream_complete("erzähl")) == "Grüezi mitenand"
+    
+    replayer = SwissAIClient(rate_limiter=limiter, cassette=Cassette(path, mode=REPLAY, timing_scale=0.5))
+    start = time.time()
+    assert replayer.complete("hallo", bypass_cache=True) == "recorded hallo"
+    assert 0.09 <= time.time() - start < 0.2
+    
+    start = time.time()
+    assert "".join(replayer.stream_complete("erzähl")) == "Grüezi mitenand"
+    assert 0.25 <= time.time() - start < 0.45  # 0.1s until headers + 2 chunks of 0.1s
+    
+    try:
+        replayer.complete("never recorded", bypass_cache=True)
+        assert False, "expected CassetteMissError"
+    except CassetteMissError:
+        pass
+    
+    lenient = SwissAIClient(rate_limiter=limiter, cassette=Cassette(path, timing_scale=0, strict=False))
+    assert lenient.complete("never recorded", bypass_cache=True) == "recorded hallo"
+
+def test_abandoned_stream_releases_limiter_slot():
+    """A stream that is dropped, closed early or left in a with block frees its slot"""
+    limiter = RateLimiter(requests_per_second=1000, request_burst=100)
+    client = SwissAIClient(api_key="test", rate_limiter=limiter)
+    client.client = make_recording_api(latency=0)
+    
+    stream = client.complete("erzähl", stream=True)
+    assert limiter.in_flight == 1
+    del stream  # never iterated
+    assert limiter.in_flight == 0
+    
+    stream = client.complete("erzähl", stream=True)
+    next(stream)
+    stream.close()
+    assert limiter.in_flight == 0 and list(stream) == []
+    
+    with client.complete("erzähl", stream=True) as stream:
+        next(stream)
+        assert limiter.in_flight == 1
+    assert limiter.in_flight == 0
+
+def test_closing_a_recorded_stream_closes_the_response():
+    """Stopping early while recording closes the underlying stream, sync and async"""
+    closed = []
+    
+    def chunks():
+        try:
+            yield make_chunk("Grüezi")
+            yield make_chunk(" mitenand")
+        finally:
+            closed.append("sync")
+    
+    async def achunks():
+        try:
+            yield make_chunk("Grüezi")
+            yield make_chunk(" mitenand")
+        finally:
+            closed.append("async")
+    
+    def make_api(parse, is_async):
+        async def acreate(**params):
+            return SimpleNamespace(headers={}, parse=parse)
+        create = acreate if is_async else (lambda **params: SimpleNamespace(headers={}, parse=parse))
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+            with_raw_response=SimpleNamespace(create=create)
+        )))
+    
+    path = Path(tempfile.mkdtemp()) / "cassette.jsonl"
+    limiter = RateLimiter(requests_per_second=1000, request_burst=100)
+    
+    recorder = SwissAIClient(api_key="test", rate_limiter=limiter, cassette=Cassette(path, mode=RECORD))
+    recorder.client = CassetteOpenAI(recorder.cassette, inner=make_api(chunks, False))
+    stream = recorder.complete("erzähl", stream=True)
+    next(stream)
+    stream.close()
+    assert closed == ["sync"] and limiter.in_flight == 0
+    
+    async def stop_early():
+        arecorder = AsyncSwissAIClient(api_key="test", rate_limiter=limiter, cassette=Cassette(path, mode=RECORD))
+        arecorder.client = AsyncCassetteOpenAI(arecorder.cassette, inner=make_api(achunks, True))
+        astream = arecorder.astream("erzähl")
+        await astream.__anext__()
+        await astream.aclose()
+    
+    asyncio.run(stop_early())
+    assert closed == ["sync", "async"] and limiter.in_flight == 0
+
+def test_client_against_mock_server():
+    """The client retries injected errors and reads the budget headers of the mock server"""
+    config = MockServerConfig(latency=0.01, tokens_per_second=0, rate_limit_rate=0.3, server_error_rate=0.2, seed=7)
+    limiter = RateLimiter(requests_per_second=1000, request_burst=100)
+    
+    with MockLLMServer(config) as server:
+        client = SwissAIClient(
+            api_key="mock", base_url=server.base_url, rate_limiter=limiter,
+            retry_policy=RetryPolicy(base_delay=0.01, max_attempts=10, respect_retry_after=False)
+        )
+        client.coalesce_requests = False
+        
+        answers = [client.complete(f"Frage {i}", bypass_cache=True) for i in range(10)]
+        streamed = "".join(client.stream_complete("Erzähl mir etwas"))
+    
+    assert all(answers) and streamed
+    assert server.stats.status_codes[200] == 11
+    assert server.stats.rate_limited + server.stats.server_errors > 0
+    assert limiter.in_flight == 0
+
+def test_async_client_against_mock_server():
+    """acomplete retries a 429 and an abandoned astream closes its response and frees its slot"""
+    config = MockServerConfig(latency=0.01, tokens_per_second=200, rate_limit_rate=0.5, seed=5)
+    limiter = RateLimiter(requests_per_second=1000, request_burst=100)
+    
+    async def run(base_url):
+        client = AsyncSwissAIClient(
+            api_key="mock", base_url=base_url, rate_limiter=limiter,
+            retry_policy=RetryPolicy(base_delay=0.01, max_attempts=10, respect_retry_after=False)
+        )
+        answers = [await client.acomplete(f"Frage {i}", bypass_cache=True) for i in range(4)]
+        assert limiter.in_flight == 0
+        
+        opened = []
+        handle_response = client._handle_response
+        client._handle_response = lambda *args: opened.append(handle_response(*args)) or opened[-1]
+        chunks = client.astream("Erzähl mir etwas Langes", max_tokens=500)
+        first = await chunks.__anext__()
+        assert limiter.in_flight == 1
+        await chunks.aclose()  # what async for does on break via the loop's finalizer
+        assert limiter.in_flight == 0 and opened[0].response.is_closed
+        
+        # The pooled connection is usable again after the early exit
+        streamed = "".join([chunk async for chunk in client.astream("Noch etwas")])
+        return answers, first, streamed
+    
+    with MockLLMServer(config) as server:
+        answers, first, streamed = asyncio.run(run(server.base_url))
+    
+    assert all(answers) and first and streamed
+    assert server.stats.rate_limited > 0
+    assert limiter.in_flight == 0
+
+def test_requests_are_recorded_in_metrics():
+    """Latency, queue wait, tokens, retries and finish_reason are recorded per caller"""
+    registry = MetricsRegistry()
+    config = MockServerConfig(latency=0.02, latency_distribution="fixed", tokens_per_second=0, rate_limit_rate=0.5, seed=3)
+    
+    with MockLLMServer(config) as server:
+        client = SwissAIClient(
+            api_key="mock", base_url=server.base_url, caller="generate_persona",
+            rate_limiter=RateLimiter(requests_per_second=1000, request_burst=100),
+            retry_policy=RetryPolicy(base_delay=0.01, max_attempts=10, respect_retry_after=False),
+            cache=make_temp_cache()
+        )
+        client.metrics = registry
+        
+        client.complete("Frage", temperature=0.0)
+        client.complete("Frage", temperature=0.0)  # cache hit
+        "".join(client.stream_complete("Erzähl"))
+        
+        metrics_server = start_metrics_server(port=0, registry=registry)
+        port = metrics_server.server_address[1]
+        prometheus = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+        exported = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics.json").read())
+        metrics_server.shutdown()
+    
+    stats = registry.snapshot()["generate_persona"]
+    assert stats["requests"] == 2 and stats["cache_hits"] == 1
+    assert stats["finish_reasons"] == {"stop": 2}
+    assert stats["retries"] == server.stats.rate_limited
+    assert stats["prompt_tokens"] > 0 and stats["completion_tokens"] > 0
+    assert stats["latency"]["p50"] >= 0.02
+    assert stats["time_to_first_token"]["count"] == 1
+    assert 'llm_requests_total{caller="generate_persona",status="ok",finish_reason="stop"} 2' in prometheus
+    assert exported["callers"]["generate_persona"]["requests"] == 2
+
+if __name__ == "__main__":
+    test_token_budget_blocks_until_refilled()
+    test_reconcile_returns_unused_tokens()
+    test_limiter_is_shared_across_threads()
+    test_clients_share_process_limiter()
+    test_estimate_tokens_counts_completion_budget()
+    test_token_estimator_learns_from_usage()
+    test_large_requests_leave_reserve_for_small_ones()
+    test_parse_reset_time()
+    test_low_server_budget_lowers_concurrency()
+    test_low_budget_window_halves_concurrency_once()
+    test_plentiful_server_budget_raises_concurrency()
+    test_concurrency_limit_blocks_until_release()
+    test_async_acquire_shares_request_rate()
+    test_retry_policy_honours_retry_after()
+    test_retry_policy_backoff_and_fatal_errors()
+    test_complete_recovers_from_rate_limit()
+    test_complete_raises_fatal_error_immediately()
+    test_failed_attempts_refund_reserved_tokens()
+    test_http_client_pooled_per_endpoint()
+    test_run_async_keeps_one_async_pool()
+    test_cached_completion_skips_api()
+    test_cache_is_separated_per_endpoint()
+    test_cache_expires_and_evicts_least_recently_used()
+    test_identical_concurrent_requests_share_one_call()
+    test_sampled_concurrent_requests_are_not_coalesced()
+    test_async_single_flight_coalesces_per_loop()
+    test_cassette_records_and_replays_offline()
+    test_abandoned_stream_releases_limiter_slot()
+    test_closing_a_recorded_stream_closes_the_response()
+    test_client_against_mock_server()
+    test_async_client_against_mock_server()
+    test_requests_are_recorded_in_metrics()
+    print("✅ All LLM tests passed!")
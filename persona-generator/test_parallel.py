@@ -3,9 +3,10 @@
 Test script for parallel batch persona generation
 """
 
-import asyncio
 import time
-from batch_generation import generate_batch_personas_parallel, RateLimiter
+from llm import RateLimiter
+from mock_llm_server import MockServerConfig
+from benchmark_batch_throughput import compare, run_sweep
 
 def test_rate_limiter():
     """Test that rate limiter works correctly"""
@@ -17,40 +18,35 @@ def test_rate_limiter():
     # Try to acquire 10 slots quickly
     for i in range(10):
         rate_limiter.acquire()
+        rate_limiter.release()
         print(f"Acquired slot {i+1} at {time.time() - start_time:.2f}s")
     
     total_time = time.time() - start_time
     print(f"Total time for 10 acquisitions: {total_time:.2f}s")
-    print(f"Expected minimum time: 2.0s (10 requests / 5 per second)")
+    print(f"Expected minimum time: 1.8s (9 intervals of 0.2s at 5 per second)")
     
-    if total_time >= 1.8:  # Allow some tolerance
-        print("✅ Rate limiter working correctly!")
-    else:
-        print("❌ Rate limiter not working - requests too fast!")
+    assert total_time >= 1.7, "Rate limiter not working - requests too fast!"
+    print("✅ Rate limiter working correctly!")
 
 def test_parallel_vs_sequential():
-    """Compare parallel vs sequential generation times (mock test)"""
-    print("\nTesting parallel processing structure...")
+    """Parallel batch chat is faster than sequential against the simulated LLM"""
+    print("\nTesting parallel vs sequential batch chat...")
     
-    # Test parameters
-    test_params = {
-        'vermoegen': '100000-500000',
-        'verfuegbares_einkommen': '5000-8000',
-        'grosse_ausgaben': 'Keine',
-        'eigentum': 'Miete',
-        'finanz_erfahrung': 'Mittel'
-    }
+    config = MockServerConfig(latency=0.3, latency_distribution="fixed", tokens_per_second=1000.0)
+    results = run_sweep(
+        [1, 5], [5], config,
+        requests_per_second=20, paths=("chat",), demographic_rows=500
+    )
+    sequential, parallel = results
     
-    test_filters = {
-        'age_min': 25,
-        'age_max': 65
-    }
+    assert sequential["failure_rate"] == 0 and parallel["failure_rate"] == 0
+    assert parallel["personas_per_sec"] > sequential["personas_per_sec"] * 1.5
+    assert all(r["p50"] is not None and r["p99"] >= r["p50"] for r in results)
     
-    print(f"Test parameters: {test_params}")
-    print(f"Test filters: {test_filters}")
-    
-    # This would test actual generation, but requires API key
-    print("✅ Function structure looks correct for parallel processing!")
+    # Halved throughput against itself as baseline is reported as a regression
+    baseline = {"results": [{**r, "personas_per_sec": r["personas_per_sec"] * 2} for r in results]}
+    assert all(entry["regression"] for entry in compare(results, baseline))
+    print("✅ Parallel processing speeds up batch chat!")
 
 if __name__ == "__main__":
     print("🧪 Running Banking Persona Generator Tests")
@@ -59,15 +55,10 @@ if __name__ == "__main__":
     try:
         test_rate_limiter()
         test_parallel_vs_sequential()
-        
+    
         print("\n✅ All tests completed!")
-        print("\n📝 To test full functionality:")
-        print("1. Open http://localhost:8501 in your browser")
-        print("2. Go to 'Batch Generation' page")
-        print("3. Set count to 10+ personas")
-        print("4. Enter your Swiss AI API key")
-        print("5. Click 'Generate Batch'")
-        print("6. Watch the progress bar show parallel processing in action!")
-        
+        print("\n📝 Full throughput sweep against the simulated LLM:")
+        print("python benchmark_batch_throughput.py --baseline throughput_baseline.json")
+    
     except Exception as e:
-        print(f"❌ Test failed: {e}")
\ No newline at end of file
+        print(f"❌ Test failed: {e}")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for the opt-in profiling hooks
+"""
+
+import os
+import time
+import pstats
+import tempfile
+import threading
+from pathlib import Path
+from profiling import profiled
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+@profiled("inner")
+def inner_work():
+    busy(0.05)
+
+@profiled("outer")
+def outer_work():
+    worker = threading.Thread(target=inner_work)
+    worker.start()
+    inner_work()
+    worker.join()
+    return "done"
+
+def run_profiled(mode):
+    """Run outer_work with the given SWISS_AI_PROFILE mode and return the artifact files"""
+    saved = {key: os.environ.get(key) for key in ("SWISS_AI_PROFILE", "SWISS_AI_PROFILE_DIR")}
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            os.environ["SWISS_AI_PROFILE"] = mode
+            os.environ["SWISS_AI_PROFILE_DIR"] = tmp
+            assert outer_work() == "done"
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        return {path.suffix: (path.name, path.read_bytes()) for path in Path(tmp).iterdir()}
+
+def test_profile_writes_pstats_and_collapsed_stacks():
+    """One artifact pair per outer call; nested and worker-thread calls are part of it"""
+    artifacts = run_profiled("1")
+    
+    assert set(artifacts) == {".prof", ".collapsed"}
+    assert all(name.startswith("outer-") for name, _ in artifacts.values())
+    
+    with tempfile.NamedTemporaryFile(suffix=".prof") as f:
+        f.write(artifacts[".prof"][1])
+        f.flush()
+        functions = {func for _, _, func in pstats.Stats(f.name).stats}
+    assert "outer_work" in functions and "inner_work" in functions
+    
+    stacks = artifacts[".collapsed"][1].decode("utf-8").splitlines()
+    assert stacks and all(int(line.rsplit(" ", 1)[1]) > 0 for line in stacks)
+    assert any("test_profiling.py:outer_work;profiling.py:wrapper;test_profiling.py:inner_work" in line for line in stacks)
+    # The worker thread's stack is sampled too
+    assert any(line.startswith("Thread-") and "test_profiling.py:inner_work" in line for line in stacks)
+
+def test_sampling_mode_and_off_switch():
+    """Sampling mode skips cProfile; without SWISS_AI_PROFILE nothing is written"""
+    assert set(run_profiled("sample")) == {".collapsed"}
+    assert run_profiled("0") == {}
+
+if __name__ == "__main__":
+    test_profile_writes_pstats_and_collapsed_stacks()
+    test_sampling_mode_and_off_switch()
+    print("✅ Profiling tests passed!")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for pipeline tracing (no API access required)
+"""
+
+import os
+import tempfile
+from pathlib import Path
+import tracing
+from tracing import format_tree, load_spans
+from mock_llm_server import MockLLMServer, MockServerConfig
+from benchmark_hot_paths import make_demographics
+
+TRACE_ENV = ("SWISS_AI_TRACE", "DEMOGRAPHIE_CSV", "SWISS_AI_BASE_URL", "SWISS_AI_PLATFORM_API_KEY")
+
+class traced_env:
+    """Point SWISS_AI_TRACE (and optionally other variables) at a temporary setup"""
+    def __init__(self, trace_path, **env):
+        self.env = {"SWISS_AI_TRACE": str(trace_path), **env}
+    
+    def __enter__(self):
+        self.saved = {key: os.environ.get(key) for key in TRACE_ENV}
+        os.environ.update(self.env)
+    
+    def __exit__(self, *exc):
+        for key, value in self.saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+def test_spans_nest_inherit_tags_and_record_errors():
+    """Children share the trace, inherit batch_id/persona_index and failures are marked"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_path = Path(tmp) / "traces.jsonl"
+        with traced_env(trace_path):
+            with tracing.batch_span("b-1", size=1):
+                with tracing.batch_span("b-1") as same:
+                    assert same is tracing.current_span()
+                with tracing.span("persona_task", persona_index=0):
+                    try:
+                        with tracing.span("llm_attempt", attempt=1):
+                            raise TimeoutError("slow")
+                    except TimeoutError:
+                        pass
+        spans = {s["name"]: s for s in load_spans(trace_path)}
+    
+    assert set(spans) == {"batch", "persona_task", "llm_attempt"}
+    assert len({s["trace_id"] for s in spans.values()}) == 1
+    assert spans["llm_attempt"]["parent_id"] == spans["persona_task"]["span_id"]
+    assert spans["llm_attempt"]["attributes"] == {"batch_id": "b-1", "persona_index": "0", "attempt": "1"}
+    assert spans["llm_attempt"]["error"] and not spans["persona_task"]["error"]
+    
+    # Nothing is written while tracing is off
+    with tracing.span("ignored") as noop:
+        noop.set_attribute("x", 1)
+    assert tracing.current_span() is None
+
+def test_parallel_batch_forms_one_trace():
+    """Worker threads of a parallel batch add their spans to the batch trace"""
+    import batch_generation
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "demographics.csv"
+        make_demographics(500).to_csv(csv_path, index=False)
+        trace_path = Path(tmp) / "traces.jsonl"
+        config = MockServerConfig(latency=0.01, tokens_per_second=0, seed=1)
+        
+        with MockLLMServer(config) as server, traced_env(
+            trace_path, DEMOGRAPHIE_CSV=str(csv_path), SWISS_AI_BASE_URL=server.base_url, SWISS_AI_PLATFORM_API_KEY="mock"
+        ):
+            personas, errors = batch_generation.generate_batch_personas_parallel(
+                3, {'randomize': True}, {}, batch_id="batch-42"
+            )
+            batch_generation.save_personas_batch(personas, {}, {}, personas_dir=Path(tmp) / "personas", batch_id="batch-42")
+        spans = load_spans(trace_path)
+    
+    assert len(personas) == 3 and not errors
+    names = [s["name"] for s in spans]
+    for name in ("persona_task", "prompt_build", "llm_call", "llm_attempt", "json_parse"):
+        assert names.count(name) == 3, name
+    # Source persons are drawn once for the whole batch
+    assert names.count("batch") == 1 and names.count("persist") == 1 and names.count("demographic_sampling") == 1
+    
+    # All generation spans belong to the batch trace and carry its id
+    batch = next(s for s in spans if s["name"] == "batch")
+    generation = [s for s in spans if s["name"] != "persist"]
+    assert all(s["trace_id"] == batch["trace_id"] for s in generation)
+    assert all(s["attributes"]["batch_id"] == "batch-42" for s in spans)
+    assert {s["attributes"]["persona_index"] for s in spans if s["name"] == "llm_call"} == {"0", "1", "2"}
+    
+    tree = format_tree(generation)
+    assert tree[0].startswith("batch") and tree[1].startswith("  demographic_sampling") and tree[2].startswith("  persona_task")
+
+if __name__ == "__main__":
+    test_spans_nest_inherit_tags_and_record_errors()
+    test_parallel_batch_forms_one_trace()
+    print("✅ Tracing tests passed!")
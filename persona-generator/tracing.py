@@ -0,0 +1,271 @@
+"""
+Span-based tracing of the persona pipeline, written as OpenTelemetry JSON lines.
+
+Set SWISS_AI_TRACE to turn it on: "1"/"true" writes to .cache/traces.jsonl, any
+other value is taken as the file path. Every finished span is appended as one
+line in the OTLP/JSON shape ({"resourceSpans": [...]}) that the OpenTelemetry
+Collector's otlpjsonfile receiver reads, so the file can be forwarded to Jaeger,
+Tempo or any other OTLP viewer.
+
+Spans of a batch form one trace:
+    batch → demographic_sampling (all source persons at once),
+    batch → persona_task → prompt_build / llm_call (→ llm_attempt per retry)
+    / json_parse, and batch → persist
+
+batch_id and persona_index are inherited by all child spans.
+
+Usage:
+    python tracing.py .cache/traces.jsonl                  # slowest traces
+    python tracing.py .cache/traces.jsonl --batch <id>     # span tree of one batch
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+import contextvars
+from pathlib import Path
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import Optional, Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACE_PATH = Path(__file__).parent / ".cache" / "traces.jsonl"
+SERVICE_NAME = "persona-generator"
+
+# Attributes that child spans take over from their parent
+INHERITED_ATTRIBUTES = ("batch_id", "persona_index")
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_write_lock = threading.Lock()
+
+
+def get_trace_path() -> Optional[Path]:
+    """
+    Read the trace file location from SWISS_AI_TRACE.
+    
+    Returns:
+        Path of the JSONL trace file, or None if tracing is off
+    """
+    setting = os.getenv("SWISS_AI_TRACE", "").strip()
+    if not setting or setting.lower() in ("0", "false", "no"):
+        return None
+    if setting.lower() in ("1", "true", "yes"):
+        return DEFAULT_TRACE_PATH
+    return Path(setting)
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    """Encode a Python value as an OTLP AnyValue."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # int64 is a string in OTLP/JSON
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """One timed operation; use span() to create it."""
+    
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any], path: Path):
+        self.name = name
+        self.path = path
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent else None
+        inherited = {key: parent.attributes[key] for key in INHERITED_ATTRIBUTES if parent and key in parent.attributes}
+        self.attributes = {**inherited, **attributes}
+        self.events: List[Dict[str, Any]] = []
+        self.status = {"code": "STATUS_CODE_UNSET"}
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+    
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self.attributes[key] = value
+    
+    def add_event(self, name: str, **attributes):
+        self.events.append({
+            "timeUnixNano": str(time.time_ns()),
+            "name": name,
+            "attributes": [{"key": k, "value": _attribute_value(v)} for k, v in attributes.items()],
+        })
+    
+    def set_error(self, error: BaseException):
+        self.status = {"code": "STATUS_CODE_ERROR", "message": str(error)[:500]}
+        self.add_event("exception", **{"exception.type": type(error).__name__, "exception.message": str(error)[:500]})
+    
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _attribute_value(v)} for k, v in self.attributes.items()],
+            "events": self.events,
+            "status": self.status,
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": [span]}],
+            }]
+        }
+    
+    def end(self):
+        self.end_ns = time.time_ns()
+        line = json.dumps(self.to_otlp(), ensure_ascii=False)
+        try:
+            with _write_lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write trace span {self.name}: {e}")
+
+
+class _NoopSpan:
+    """Stand-in returned by span() while tracing is off."""
+    attributes: Dict[str, Any] = {}
+    
+    def set_attribute(self, key: str, value: Any):
+        pass
+    
+    def add_event(self, name: str, **attributes):
+        pass
+    
+    def set_error(self, error: BaseException):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def current_span() -> Optional[Span]:
+    """The innermost open span of this thread / task, None outside a trace."""
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Trace the enclosed block as a child of the current span.
+    
+    Exceptions mark the span as failed and are re-raised. While SWISS_AI_TRACE
+    is off this yields a no-op span and costs only an environment lookup.
+    
+    Args:
+        name: Operation name (batch, persona_task, llm_call, ...)
+        **attributes: Span attributes; batch_id and persona_index are inherited by children
+    
+    Example:
+        with tracing.span("prompt_build") as s:
+            prompt = build_prompt(...)
+            s.set_attribute("prompt_chars", len(prompt))
+    """
+    path = get_trace_path()
+    if path is None:
+        yield _NOOP_SPAN
+        return
+    
+    current = Span(name, _current_span.get(), attributes, path)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+@contextmanager
+def batch_span(batch_id: str, **attributes):
+    """
+    Open the root span of a batch unless a span for this batch is already open.
+    
+    Lets the page wrap generation and persistence in one trace, while the batch
+    functions called on their own (benchmarks, scripts) still start a trace.
+    """
+    current = _current_span.get()
+    if current is not None and current.attributes.get("batch_id") == batch_id:
+        yield current
+        return
+    with span("batch", batch_id=batch_id, **attributes) as s:
+        yield s
+
+
+def load_spans(path: Path) -> List[Dict[str, Any]]:
+    """Read all spans of a trace file as flat dicts (name, ids, duration, attributes)."""
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource in json.loads(line).get("resourceSpans", []):
+                for scope in resource.get("scopeSpans", []):
+                    for s in scope.get("spans", []):
+                        attributes = {a["key"]: next(iter(a["value"].values())) for a in s.get("attributes", [])}
+                        spans.append({
+                            "trace_id": s["traceId"],
+                            "span_id": s["spanId"],
+                            "parent_id": s.get("parentSpanId"),
+                            "name": s["name"],
+                            "start": int(s["startTimeUnixNano"]) / 1e9,
+                            "duration": (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e9,
+                            "error": s.get("status", {}).get("code") == "STATUS_CODE_ERROR",
+                            "attributes": attributes,
+                        })
+    return spans
+
+
+def format_tree(spans: List[Dict[str, Any]], min_duration: float = 0.0) -> List[str]:
+    """Render the spans of one trace as an indented tree, children ordered by start time."""
+    children = defaultdict(list)
+    span_ids = {s["span_id"] for s in spans}
+    for s in spans:
+        children[s["parent_id"] if s["parent_id"] in span_ids else None].append(s)
+    
+    lines = []
+    def walk(parent_id, depth):
+        for s in sorted(children[parent_id], key=lambda s: s["start"]):
+            if s["duration"] < min_duration and depth > 0:
+                continue
+            tags = " ".join(f"{k}={v}" for k, v in s["attributes"].items() if k not in ("batch_id",))
+            lines.append(f"{'  ' * depth}{'❌ ' if s['error'] else ''}{s['name']:<22} {s['duration']:8.3f}s  {tags}")
+            walk(s["span_id"], depth + 1)
+    walk(None, 0)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a JSONL trace file written with SWISS_AI_TRACE")
+    parser.add_argument("trace_file", type=Path)
+    parser.add_argument("--batch", help="Print the span tree of this batch_id")
+    parser.add_argument("--min-duration", type=float, default=0.0, help="Hide child spans shorter than this (seconds)")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest traces to list")
+    args = parser.parse_args()
+    
+    spans = load_spans(args.trace_file)
+    if args.batch:
+        selected = [s for s in spans if s["attributes"].get("batch_id") == args.batch]
+        print("\n".join(format_tree(selected, args.min_duration)) or f"No spans for batch {args.batch}")
+        return
+    
+    roots = sorted((s for s in spans if s["parent_id"] is None), key=lambda s: s["duration"], reverse=True)
+    for root in roots[:args.top]:
+        print(f"{root['duration']:8.3f}s  {root['name']:<22} {root['attributes'].get('batch_id', root['trace_id'])}")
+
+
+if __name__ == "__main__":
+    main()